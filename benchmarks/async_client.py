@@ -0,0 +1,63 @@
+"""Throughput of few clients with many outstanding requests each
+
+    python -O benchmarks/async_client.py cluster -c 1 --outstanding 1,8,32
+
+cluster is generated by ``pbft gen -n 4 -c 1``. Each client keeps
+--outstanding requests in flight by Client.submit, bounded by
+client_window; one outstanding request per client is the old behavior.
+"""
+import asyncio
+import json
+import statistics
+import sys
+
+import click
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def measure(config_dir, outstanding, client_count, count, command):
+    processes = start_replicas(config_dir, 4)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        elapsed, latencies = loop.run_until_complete(
+            closed_loop(clients, command, count, window = outstanding))
+        retransmits = sum(c.retransmit_count for c in clients)
+        duplicates = sum(c.duplicate_reply_count for c in clients)
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    return {
+        'clients': client_count,
+        'outstanding': outstanding,
+        'requests': count,
+        'throughput': count / elapsed,
+        'latency_p50': statistics.median(latencies),
+        'retransmits': retransmits,
+        'duplicate_replies': duplicates,
+    }
+
+@click.command()
+@click.option('--outstanding', default = '1,8,32')
+@click.option('--client_count', '-c', default = 1)
+@click.option('--count', default = 1000)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(outstanding, client_count, count, command_size, config_dir):
+    command = bytes(command_size)
+    for o in (int(o) for o in outstanding.split(',')):
+        print(json.dumps(measure(config_dir, o, client_count,
+                                 count, command)))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
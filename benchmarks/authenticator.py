@@ -0,0 +1,82 @@
+"""Cost of authenticators, keyed hmac states against hmac.new
+
+    python -O benchmarks/authenticator.py
+
+gen: authenticators of one multicast, n - 1 hmacs
+verify: a batch of commits from all the other replicas,
+one by one with hmac.new against Node.verify_messages
+"""
+import hmac
+import json
+import timeit
+
+import click
+
+from pbft.message import Commit
+from pbft.node import Node
+from pbft.principal import Principal
+
+class Verifier(Node):
+    """Replica 0 with session keys but no transport"""
+    def __init__(self, n):
+        self.index = 0
+        self.replica_principals = [Principal(i) for i in range(n)]
+        self.client_principals = []
+        self.verify_cache = None # every batch is verified for real
+        for p in self.replica_principals[1:]:
+            p.outkey = p.gen_inkey()
+
+def gen_hmac_new(principals, digest):
+    return [hmac.new(p.outkey, digest, digestmod='SHA256').digest()
+            for p in principals]
+
+def gen_cached(principals, digest):
+    return [p.gen_hmac('out', digest) for p in principals]
+
+def new_commits(node, batch):
+    n = len(node.replica_principals)
+    commits = []
+    for seqno in range(batch):
+        sender = seqno % (n - 1) + 1
+        m = Commit(0, seqno, sender)
+        m.auth = [b''] * n
+        m.auth[0] = node.replica_principals[sender].gen_hmac(
+            'in', m.content_digest)
+        commits.append(m)
+    return commits
+
+def verify_hmac_new(node, commits):
+    for m in commits:
+        pp = node.replica_principals[m.sender]
+        hmac.compare_digest(hmac.new(pp.inkey, m.content_digest,
+                                     digestmod='SHA256').digest(),
+                            m.auth[node.index])
+
+def verify_batch(node, commits):
+    for m in commits:
+        m.verified = False
+    node.verify_messages(commits)
+
+@click.command()
+@click.option('--number', default = 2000)
+@click.option('--replicas', default = '4,7,16,31')
+@click.option('--batch', default = 64)
+def main(number, replicas, batch):
+    digest = bytes(32)
+    for n in (int(r) for r in replicas.split(',')):
+        node = Verifier(n)
+        principals = node.replica_principals[1:]
+        commits = new_commits(node, batch)
+
+        result = { 'n': n, 'batch': batch }
+        for key, func, args in (
+                ('gen_hmac_new_us', gen_hmac_new, (principals, digest)),
+                ('gen_cached_us', gen_cached, (principals, digest)),
+                ('verify_hmac_new_us', verify_hmac_new, (node, commits)),
+                ('verify_batch_us', verify_batch, (node, commits))):
+            t = timeit.timeit(lambda: func(*args), number = number)
+            result[key] = t / number * 10**6
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
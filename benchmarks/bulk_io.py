@@ -0,0 +1,120 @@
+"""Syscalls per datagram, one by one against sendmmsg/recvmmsg
+
+    python -O benchmarks/bulk_io.py cluster
+
+cluster is generated by ``pbft gen -n 4``. Replica 1 runs in process,
+the addresses of the other replicas are bound by plain sockets.
+
+send: bursts of commits multicast to ALL_REPLICAS
+recv: bursts of commit frames sent to replica 1 by a plain socket
+"""
+import asyncio
+import json
+import socket
+import time
+
+import click
+
+from pbft.basic import Configuration as conf
+from pbft.cli import replica_keys
+from pbft.message import Commit
+from pbft.replica import Replica
+
+from cluster import load_config
+
+def reset(replica, bulk):
+    conf.bulk_io = bulk
+    if replica.bulk_socket:
+        replica.loop._remove_reader(replica.bulk_socket.fd)
+        replica.transport.resume_reading()
+
+    replica._bulk_socket = None
+    replica.start_bulk_recv()
+    replica.sent_datagrams = replica.send_syscalls = 0
+    replica.received_datagrams = replica.recv_syscalls = 0
+
+def drain(sockets):
+    for s in sockets:
+        try:
+            while True:
+                s.recv(65536)
+        except BlockingIOError:
+            pass
+
+def run_send(replica, sinks, frames, burst):
+    loop = replica.loop
+    for i in range(0, len(frames), burst):
+        for f in frames[i:i + burst]:
+            replica.sendto(f, 'ALL_REPLICAS')
+        loop.run_until_complete(asyncio.sleep(0)) # flush
+        drain(sinks)
+
+def run_recv(replica, sender, frames, burst):
+    loop = replica.loop
+    target = replica.dispatch_count
+    for i in range(0, len(frames), burst):
+        for f in frames[i:i + burst]:
+            sender.sendto(f, replica.principal.addr)
+        target += len(frames[i:i + burst])
+
+        deadline = time.perf_counter() + 1.0 # lost datagrams
+        while (replica.dispatch_count < target
+               and time.perf_counter() < deadline):
+            loop.run_until_complete(asyncio.sleep(0))
+        target = replica.dispatch_count
+
+@click.command()
+@click.option('--count', default = 4096)
+@click.option('--bursts', default = '1,16,64')
+@click.argument('config_dir')
+def main(count, bursts, config_dir):
+    config = load_config(config_dir, 'replica_1.toml')
+    replica = Replica(**{ k: config[k] for k in replica_keys })
+    replica.transport, replica.protocol = (
+        replica.loop.run_until_complete(replica.listen))
+    replica.loop.run_until_complete(replica.fetch()) # CONN_MADE
+
+    sinks = []
+    for p in replica.replica_principals:
+        if p is not replica.principal:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(p.addr)
+            s.setblocking(False)
+            sinks.append(s)
+    sender = sinks[-1] # as replica 3
+
+    frames = []
+    for seqno in range(count):
+        commit = Commit(0, seqno + 1, 3)
+        commit.gen_payload(replica) # authenticators fail to verify
+        frames.append(commit.frame)
+
+    for burst in (int(b) for b in bursts.split(',')):
+        for bulk in (False, True):
+            result = { 'burst': burst, 'bulk_io': bulk }
+
+            reset(replica, bulk)
+            start = time.perf_counter()
+            run_send(replica, sinks, frames, burst)
+            result['send_us_per_datagram'] = ((time.perf_counter() - start)
+                                              / replica.sent_datagrams
+                                              * 10**6)
+
+            run_recv(replica, sender, frames, burst)
+
+            stats = replica.io_stats
+            result['send_syscalls_per_datagram'] = (
+                stats['send_syscalls_per_datagram'])
+            result['recv_syscalls_per_datagram'] = (
+                stats['recv_syscalls_per_datagram'])
+            result['received'] = stats['received_datagrams']
+            print(json.dumps(result))
+
+    for s in sinks:
+        s.close()
+    replica.transport.close()
+    if replica.crypto:
+        replica.crypto.close()
+
+if __name__ == '__main__':
+    main()
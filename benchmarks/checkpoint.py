@@ -0,0 +1,59 @@
+"""Cost of state digests at checkpoints against the fraction of dirty pages
+
+    python -O benchmarks/checkpoint.py --children 128
+
+the tree has children ** 2 pages of 4 KiB, 512 (the default) is 1 GiB.
+full: compute_full_digest, rehash everything as before
+incremental: update_partition_tree, only dirty pages and ancestors
+snapshot_bytes: pages and digests copied on write for the previous
+checkpoint, a full copy of the state would be pages * 4 KiB
+"""
+import json
+import os
+import random
+import time
+
+import click
+
+from pbft.partition import Partition
+from pbft.state import State
+
+@click.command()
+@click.option('--children', default = 128)
+@click.option('--fractions', default = '0.001,0.01,0.1,0.5,1.0')
+def main(children, fractions):
+    Partition.children_count = children
+    state = State(checkpoint_log_size = 2)
+    leaf_count = len(state.leaves)
+
+    # pages with content, every page is written once
+    for i in range(leaf_count):
+        state.set_block(i, os.urandom(Partition.block_size))
+
+    start = time.perf_counter()
+    state.checkpoint(0)
+    full = time.perf_counter() - start
+
+    n = 0
+    for fraction in (float(f) for f in fractions.split(',')):
+        n += 128
+        pages = random.sample(range(leaf_count),
+                              max(1, int(leaf_count * fraction)))
+        for i in pages:
+            state.set_block(i, os.urandom(Partition.block_size))
+
+        start = time.perf_counter()
+        state.checkpoint(n)
+        incremental = time.perf_counter() - start
+
+        print(json.dumps({
+            'pages': leaf_count,
+            'dirty_fraction': fraction,
+            'dirty_pages': len(pages),
+            'full_ms': full * 1000,
+            'incremental_ms': incremental * 1000,
+            'snapshot_bytes': state.checkpoint_log[-2].size,
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Helpers to run a localhost cluster for benchmarks
+
+Generate keys and configs first, e.g.:
+
+    pbft gen -n 4 -c 16 --keysize 1024 cluster
+
+replicas are forked into their own processes, clients share the
+event loop of the benchmark process.
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from pbft.cli import parse_args, replica_keys, client_keys
+from pbft.client import Client
+from pbft.replica import Replica
+
+def load_config(config_dir, node_config):
+    owd = os.getcwd()
+    os.chdir(config_dir)
+    try:
+        with open('replica_configs.toml') as r, \
+             open('client_configs.toml') as c, \
+             open(node_config) as n:
+            return parse_args(None, None, None, r, c, n)
+    finally:
+        os.chdir(owd)
+
+def run_replica(config_dir, index, setup = None, execution_func = None,
+                overrides = None):
+    if setup:
+        setup()
+
+    # exit normally, thus workers of the crypto service are shut down
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    config = load_config(config_dir, 'replica_{}.toml'.format(index))
+    config.update(overrides or {})
+    replica = Replica(**{ k: config[k] for k in replica_keys })
+    replica.user_execution_func = execution_func
+    replica.run()
+
+def start_replicas(config_dir, n = 4, setup = None, execution_func = None,
+                   overrides = None):
+    """Fork n replicas, setup is called in each child first
+
+    execution_func becomes user_execution_func of every replica,
+    overrides replace values of their configs, e.g. intervals
+
+    replicas are not daemons, they fork workers of the crypto service
+    """
+    ctx = multiprocessing.get_context('fork')
+    processes = []
+    for i in range(n):
+        p = ctx.Process(target = run_replica,
+                        args = (config_dir, i, setup, execution_func,
+                                overrides))
+        p.start()
+        processes.append(p)
+
+    time.sleep(1.0) # wait for new_keys among replicas
+    return processes
+
+def stop_replicas(processes):
+    for p in processes:
+        p.terminate()
+    for p in processes:
+        p.join()
+
+async def new_client(config_dir, index):
+    config = load_config(config_dir, 'client_{}.toml'.format(index))
+    client = Client(**{ k: config[k] for k in client_keys })
+
+    await client.connect()
+    return client
+
+async def invoke(client, command:bytes, readonly = False,
+                 timeout = 1.0):
+    """Send a request and wait for its result, see Client.submit"""
+    return await client.submit(command, readonly, timeout)
+
+async def closed_loop(clients, command:bytes, count:int,
+                      readonly = False, window = 1):
+    """Each client keeps window requests outstanding, count in total
+
+    return (elapsed seconds, [latency in seconds])
+    """
+    loop = asyncio.get_event_loop()
+    latencies = []
+    remaining = [count]
+
+    async def run(client):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = loop.time()
+            await invoke(client, command, readonly)
+            latencies.append(loop.time() - start)
+
+    start = loop.time()
+    await asyncio.gather(*(run(c) for c in clients for _ in range(window)))
+    return loop.time() - start, latencies
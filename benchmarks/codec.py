@@ -0,0 +1,71 @@
+"""Encode and decode cost of rlp(version 1) against struct(version 2)
+
+    python -O benchmarks/codec.py
+"""
+import json
+import sys
+import timeit
+
+import click
+
+from pbft.message import BaseMessage, Request, PrePrepare, Prepare, Commit
+
+class Node():
+    type = 'Replica'
+    index = 1
+    n = 4
+    view = 0
+
+    def gen_authenticators(self, hash_bytes):
+        return [bytes(32) if i != self.index else b''
+                for i in range(self.n)]
+
+node = Node()
+
+def new_request(version, size):
+    r = Request(0, 1, 1 << 4, 0, bytes(size))
+    r.version = version
+    r.gen_payload(node)
+    return r
+
+def messages(version, batch):
+    prepare = Prepare(0, 1, 0, 1, bytes(32))
+    commit = Commit(0, 1, 1)
+    request = new_request(version, 64)
+    pre_prepare = PrePrepare(0, 1, 0,
+                             [new_request(version, 64)
+                              for _ in range(batch)], b'')
+    for m in (prepare, commit, pre_prepare):
+        m.version = version
+        m.gen_payload(node)
+
+    return [prepare, commit, request, pre_prepare]
+
+def decode(message):
+    frame = message.frame
+    _tag, version, payload = BaseMessage.parse_frame(frame)
+    if version == BaseMessage.struct_version:
+        return type(message).from_struct_payload(payload, None, node)
+    return type(message).from_payload(payload, None, node)
+
+@click.command()
+@click.option('--number', default = 20000)
+@click.option('--batch', default = 16)
+def main(number, batch):
+    for version in BaseMessage.versions:
+        for m in messages(version, batch):
+            name = type(m).__name__
+            encode_t = timeit.timeit(lambda: m.gen_payload(node),
+                                     number = number)
+            decode_t = timeit.timeit(lambda: decode(m), number = number)
+            print(json.dumps({
+                'version': version,
+                'message': name,
+                'frame_bytes': len(m),
+                'encode_us': encode_t / number * 10**6,
+                'decode_us': decode_t / number * 10**6,
+            }))
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Event loop stalls of rsa operations, inline against the crypto service
+
+    python -O benchmarks/crypto.py --keysize 1024
+
+a burst of signed messages and new_keys arrives while a ticker
+measures how late the event loop wakes up, as consensus traffic would.
+"""
+import asyncio
+import json
+import time
+
+import click
+import rsa
+
+from pbft.crypto import CryptoService
+from pbft.principal import Principal
+
+async def ticker(lags, stop, interval = 0.001):
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+async def inline(principal, jobs):
+    for signature, nonce in jobs:
+        principal.verify(b'digest', signature)
+        principal.decrypt(nonce)
+        await asyncio.sleep(0) # next message
+
+async def offloaded(crypto, principal, jobs):
+    await asyncio.gather(*(
+        coro for signature, nonce in jobs
+        for coro in (crypto.verify(principal, b'digest', signature),
+                     crypto.decrypt(principal, nonce))))
+
+async def measure(run):
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.get_event_loop().create_task(ticker(lags, stop))
+    await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick
+    return elapsed, max(lags)
+
+@click.command()
+@click.option('--keysize', default = 1024)
+@click.option('--burst', default = 16)
+@click.option('--workers', default = 2)
+def main(keysize, burst, workers):
+    public_key, private_key = rsa.newkeys(keysize)
+    p = Principal(0, private_key, public_key)
+    jobs = [(p.sign(b'digest'), p.encrypt(bytes(32)))] * burst
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    crypto = CryptoService(workers, loop)
+
+    # fork workers before measuring
+    loop.run_until_complete(crypto.decrypt(p, jobs[0][1]))
+
+    for name, run in (('inline', lambda: inline(p, jobs)),
+                      ('service', lambda: offloaded(crypto, p, jobs))):
+        elapsed, max_lag = loop.run_until_complete(measure(run))
+        print(json.dumps({
+            'mode': name, 'keysize': keysize, 'burst': burst,
+            'workers': workers, 'elapsed_ms': elapsed * 1000,
+            'max_loop_lag_ms': max_lag * 1000,
+        }))
+
+    crypto.close()
+    loop.close()
+
+if __name__ == '__main__':
+    main()
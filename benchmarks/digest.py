@@ -0,0 +1,56 @@
+"""Cost of digests on the receive path, cached against recomputed
+
+    python -O benchmarks/digest.py
+
+recv_request and recv_pre_prepare read the consensus digest of a request
+about three times and its content digest about twice, a pre_prepare
+reads both digests of every request it carries.
+"""
+import json
+import timeit
+
+import click
+
+from pbft.message import Request, PrePrepare
+
+def new_request(size):
+    r = Request(0, 1, 1 << 4, 0, bytes(size))
+    r.gen_payload()
+    return r
+
+def forget(message):
+    """Drop all cached digests, as if they were never cached"""
+    message.clear_digests()
+    for r in getattr(message, 'requests', [message]):
+        r._command_digest = None
+        r.clear_digests()
+
+def receive(message, uncached):
+    for name in ('consensus_digest',) * 3 + ('content_digest',) * 2:
+        if uncached:
+            forget(message)
+        getattr(message, name)
+
+@click.command()
+@click.option('--number', default = 2000)
+@click.option('--sizes', default = '64,4096,65536')
+@click.option('--batch', default = 16)
+def main(number, sizes, batch):
+    for size in (int(s) for s in sizes.split(',')):
+        request = new_request(size)
+        pre_prepare = PrePrepare(0, 1, 0,
+                                 [new_request(size) for _ in range(batch)],
+                                 b'')
+
+        for name, message in (('request', request),
+                              ('pre_prepare', pre_prepare)):
+            result = { 'message': name, 'command_size': size }
+            for uncached in (True, False):
+                t = timeit.timeit(lambda: receive(message, uncached),
+                                  number = number)
+                key = 'uncached_us' if uncached else 'cached_us'
+                result[key] = t / number * 10**6
+            print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
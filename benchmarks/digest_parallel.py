@@ -0,0 +1,51 @@
+"""Full digest of the state against the number of digest threads
+
+    python -O benchmarks/digest_parallel.py --children 256 --workers 1,2,4,8
+
+every page is written, as after a bulk load or state transfer, then
+compute_full_digest hashes each level with a pool of workers threads.
+"""
+import json
+import os
+import time
+
+import click
+
+from pbft.partition import Partition
+from pbft.state import State
+
+@click.command()
+@click.option('--children', default = 256)
+@click.option('--workers', default = '1,2,4,8')
+@click.option('--rounds', default = 3)
+def main(children, workers, rounds):
+    Partition.children_count = children
+    block = os.urandom(Partition.block_size)
+
+    expected = None
+    for w in (int(w) for w in workers.split(',')):
+        state = State(digest_workers = w)
+        for i in range(len(state.leaves)):
+            state.set_block(i, block)
+
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            state.compute_full_digest()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        expected = expected or state.digest
+        assert state.digest == expected
+
+        print(json.dumps({
+            'pages': len(state.leaves),
+            'workers': w,
+            'cpus': os.cpu_count(),
+            'full_ms': best * 1000,
+            'mb_per_s': len(state.leaves) * Partition.block_size / best / 2 ** 20,
+        }))
+        state.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Receive path throughput, queued tasks against direct batched dispatch
+
+    python -O benchmarks/dispatch.py cluster
+
+cluster is generated by ``pbft gen -n 4``. Commit frames from replica 2
+are handed to the datagram protocol of replica 1 in bursts, as the
+selector would after one poll, until all of them are dispatched.
+
+queue: a task puts each datagram into the task queue, and run pops
+one task per run_until_complete, which was the receive path before.
+"""
+import asyncio
+import json
+import time
+
+import click
+
+from pbft.basic import TaskType, Task
+from pbft.cli import replica_keys
+from pbft.message import Commit
+from pbft.replica import Replica
+
+from cluster import load_config
+
+def new_frames(replica, count):
+    frames = []
+    for seqno in range(count):
+        commit = Commit(0, seqno + 1, 2)
+        commit.gen_payload(replica) # authenticators fail to verify
+        frames.append(commit.frame)
+    return frames
+
+def deliver(replica, frames, burst):
+    addr = replica.replica_principals[2].addr
+    for i in range(0, len(frames), burst):
+        chunk = frames[i:i + burst]
+        replica.loop.call_soon(
+            lambda chunk = chunk: [replica.protocol.datagram_received(f, addr)
+                                   for f in chunk])
+
+def run_queue(replica, frames, burst):
+    def queue(data, addr):
+        replica.loop.create_task(replica.task_queue.put(
+            Task(TaskType.PEER_MSG, (data, addr))))
+    replica.datagram_received = queue
+
+    deliver(replica, frames, burst)
+    for _ in frames:
+        replica.loop.run_until_complete(replica.fetch_and_handle())
+
+    del replica.datagram_received
+
+def run_direct(replica, frames, burst):
+    target = replica.dispatch_count + len(frames)
+    deliver(replica, frames, burst)
+    while replica.dispatch_count < target:
+        replica.loop.run_until_complete(asyncio.sleep(0))
+
+@click.command()
+@click.option('--count', default = 20000)
+@click.option('--bursts', default = '1,8,64')
+@click.argument('config_dir')
+def main(count, bursts, config_dir):
+    config = load_config(config_dir, 'replica_1.toml')
+    replica = Replica(**{ k: config[k] for k in replica_keys })
+    replica.transport, replica.protocol = (
+        replica.loop.run_until_complete(replica.listen))
+    replica.loop.run_until_complete(replica.fetch()) # CONN_MADE
+
+    frames = new_frames(replica, count)
+    for burst in (int(b) for b in bursts.split(',')):
+        result = { 'count': count, 'burst': burst }
+        for name, run in (('queue', run_queue), ('direct', run_direct)):
+            start = time.perf_counter()
+            run(replica, frames, burst)
+            elapsed = time.perf_counter() - start
+            result[name + '_packets_per_sec'] = count / elapsed
+        print(json.dumps(result))
+
+    replica.transport.close()
+    if replica.crypto:
+        replica.crypto.close()
+
+if __name__ == '__main__':
+    main()
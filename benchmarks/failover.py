@@ -0,0 +1,101 @@
+"""Recovery after the primary is killed under load
+
+    python -O benchmarks/failover.py cluster -c 4 --view_change_interval 500
+
+    python -O benchmarks/failover.py cluster --view_change_interval 5000 \
+        --timeout fixed,adaptive
+
+cluster is generated by ``pbft gen -n 4 -c 4``. Clients keep one request
+outstanding each; after --before seconds the primary (replica 0) is
+killed. Reported are the seconds from the kill to the first reply to a
+request sent after it, and throughput before and after. With an
+adaptive timeout, view_change_interval only lasts until backups have
+seen commit latencies, see ViewChangeTimeout.
+"""
+import asyncio
+import json
+import sys
+
+import click
+
+from pbft.basic import Configuration as conf
+
+from cluster import start_replicas, stop_replicas, new_client, invoke
+
+def measure(config_dir, client_count, view_change_interval, adaptive,
+            client_timeout, before, after, command):
+    def setup():
+        # forked workers of a killed replica would keep its port
+        conf.crypto_workers = 0
+        conf.adaptive_view_change_timeout = adaptive
+
+    processes = start_replicas(
+        config_dir, 4, setup,
+        overrides = {'view_change_interval': view_change_interval})
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        done = [] # (sent at, replied at)
+        killed = [None]
+        start = loop.time()
+
+        async def run(client):
+            while loop.time() - start < before + after:
+                sent = loop.time()
+                await invoke(client, command, timeout = client_timeout)
+                done.append((sent, loop.time()))
+
+        async def kill():
+            await asyncio.sleep(before)
+            processes[0].kill()
+            killed[0] = loop.time()
+
+        loop.run_until_complete(asyncio.gather(
+            kill(), *(run(c) for c in clients)))
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    kill_at = killed[0]
+    first = min(replied for sent, replied in done if sent >= kill_at)
+    before_count = sum(1 for _, replied in done if replied < kill_at)
+    after_count = sum(1 for _, replied in done if replied >= first)
+    return {
+        'view_change_interval': view_change_interval,
+        'timeout': 'adaptive' if adaptive else 'fixed',
+        'time_to_first_commit': first - kill_at,
+        'throughput_before': before_count / (kill_at - start),
+        'throughput_after': after_count / (start + before + after - first),
+        'views': max(c.view for c in clients),
+    }
+
+@click.command()
+@click.option('--client_count', '-c', default = 4)
+@click.option('--view_change_interval', default = '500,1000')
+@click.option('--timeout', default = 'fixed',
+              help = 'fixed and/or adaptive, comma separated')
+@click.option('--client_timeout', default = 0.3)
+@click.option('--before', default = 3.0)
+@click.option('--after', default = 6.0)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(client_count, view_change_interval, timeout, client_timeout,
+         before, after, command_size, config_dir):
+    command = bytes(command_size)
+    for interval in (int(i) for i in view_change_interval.split(',')):
+        for mode in timeout.split(','):
+            print(json.dumps(measure(config_dir, client_count, interval,
+                                     mode == 'adaptive', client_timeout,
+                                     before, after, command)))
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
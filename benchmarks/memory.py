@@ -0,0 +1,106 @@
+"""Memory held by the in-flight window of a backup
+
+    python -O benchmarks/memory.py --batch 64
+
+the plog window (checkpoint_max_out) is filled with received batched
+pre_prepares, with 2f prepares and 2f + 1 commits for each, as they are
+kept until a checkpoint is stable. Reports bytes per in-flight request,
+messages are parsed from frames as a backup would.
+"""
+import gc
+import json
+import tracemalloc
+
+import click
+
+from pbft.basic import Configuration as conf
+from pbft.log import PrepareCertificateLog
+from pbft.message import BaseMessage, Request, PrePrepare, Prepare, Commit
+
+class FakeReplica():
+    type = 'Replica'
+    index = 1
+    n = 4
+    f = 1
+    view = 0
+
+    def gen_authenticators(self, hash_bytes):
+        return [bytes([i]) * 32 if i != self.index else b''
+                for i in range(self.n)]
+
+def parse(cls, frame, node):
+    _, version, payload = BaseMessage.parse_frame(frame)
+    if version == BaseMessage.struct_version:
+        return cls.from_struct_payload(payload, None, node)
+    return cls.from_payload(payload, None, node)
+
+def received_window(node, batch, command_size):
+    """Frames of the window, as they arrive from the wire"""
+    frames = []
+    for seqno in range(1, conf.checkpoint_max_out + 1):
+        requests = []
+        for i in range(batch):
+            r = Request(i % 16, seqno * batch + i, 1 << 4, 0,
+                        bytes(command_size))
+            r.gen_payload(node)
+            requests.append(r)
+        pp = PrePrepare(0, seqno, 0, requests, b'')
+        pp.sender = 0
+        pp.gen_payload(node)
+
+        prepares = []
+        for sender in (2, 3):
+            p = Prepare(0, seqno, 0, sender, pp.consensus_digest)
+            p.gen_payload(node)
+            prepares.append(p.frame)
+
+        commits = []
+        for sender in (0, 2, 3):
+            c = Commit(0, seqno, sender)
+            c.gen_payload(node)
+            commits.append(c.frame)
+
+        frames.append((pp.frame, prepares, commits))
+    return frames
+
+def fill(node, frames):
+    plog = PrepareCertificateLog(node, conf.checkpoint_max_out, 1)
+    for pp, prepares, commits in frames:
+        pre_prepare = parse(PrePrepare, pp, node)
+        pcert = plog[pre_prepare.seqno]
+        pcert.add_pre_prepare(pre_prepare)
+        for f in prepares:
+            pcert.add_prepare(parse(Prepare, f, node))
+        for f in commits:
+            pcert.add_commit(parse(Commit, f, node))
+    return plog
+
+@click.command()
+@click.option('--batch', default = 64)
+@click.option('--command_size', default = 64)
+def main(batch, command_size):
+    node = FakeReplica()
+    frames = received_window(node, batch, command_size)
+    in_flight = conf.checkpoint_max_out * batch
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    plog = fill(node, frames)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    print(json.dumps({
+        'window': conf.checkpoint_max_out,
+        'batch': batch,
+        'command_size': command_size,
+        'in_flight_requests': in_flight,
+        'total_bytes': size,
+        'bytes_per_request': size / in_flight,
+    }))
+    return plog
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Throughput as a function of the in-flight window (congestion_window)
+
+    python -O benchmarks/pipeline.py cluster --windows 1,2,4,8,16 -c 16
+
+cluster is generated by ``pbft gen -n 4 -c 16``. Every window size runs
+on a fresh 4-replica cluster, with batching fixed at one request per
+pre_prepare so only pipelining is measured.
+"""
+import asyncio
+import json
+import statistics
+import sys
+
+import click
+
+from pbft.basic import Configuration as conf
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def measure(config_dir, window, client_count, count, command):
+    def setup():
+        conf.congestion_window = window
+        conf.request_in_pre_prepare = 1
+        conf.adaptive_batching = False
+
+    processes = start_replicas(config_dir, 4, setup)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        elapsed, latencies = loop.run_until_complete(
+            closed_loop(clients, command, count))
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    return {
+        'window': window,
+        'requests': count,
+        'throughput': count / elapsed,
+        'latency_p50': statistics.median(latencies),
+    }
+
+@click.command()
+@click.option('--windows', default = '1,2,4,8,16')
+@click.option('--client_count', '-c', default = 16)
+@click.option('--count', default = 240)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(windows, client_count, count, command_size, config_dir):
+    command = bytes(command_size)
+    for w in (int(w) for w in windows.split(',')):
+        print(json.dumps(measure(config_dir, w, client_count,
+                                 count, command)))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Votes through the prepare certificate log, without network or crypto
+
+    python -O benchmarks/plog.py --seqnos 200000
+
+each seqno gets a pre_prepare, 2f prepares and 2f + 1 commits of n = 4,
+quorums are checked after every vote as recv_prepare/recv_commit do,
+and the log is truncated every checkpoint_interval seqnos.
+window_bytes: memory of the log holding votes of a full window
+"""
+import json
+import time
+import tracemalloc
+import types
+
+import click
+
+from pbft.basic import Configuration as conf
+from pbft.log import PrepareCertificateLog
+from pbft.message import Prepare, Commit
+
+@click.command()
+@click.option('--seqnos', default = 200000)
+@click.option('--n', default = 4)
+def main(seqnos, n):
+    f = (n - 1) // 3
+    replica = types.SimpleNamespace(index = 0, n = n, f = f)
+    digest = bytes(32)
+
+    # votes are reused, only their seqno matters to the log
+    prepares = [Prepare(0, 0, 0, i, digest) for i in range(1, 2 * f + 1)]
+    commits = [Commit(0, 0, i) for i in range(2 * f + 1)]
+    pre_prepare = types.SimpleNamespace(requests = [], mine = True,
+                                        consensus_digest = digest)
+
+    tracemalloc.start()
+    plog = PrepareCertificateLog(replica, conf.checkpoint_max_out, 1)
+    for seqno in range(1, plog.capacity + 1):
+        pcert = plog[seqno]
+        pcert.add_pre_prepare(pre_prepare)
+        for p in prepares:
+            pcert.add_prepare(p)
+        for c in commits:
+            pcert.add_commit(c)
+    window_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    plog.truncate(plog.capacity + 1)
+
+    votes = 0
+    start = time.perf_counter()
+    for seqno in range(plog.head, plog.head + seqnos):
+        pcert = plog[seqno]
+        pcert.add_pre_prepare(pre_prepare)
+
+        for p in prepares:
+            if pcert.add_prepare(p):
+                pcert.is_prepared
+        for c in commits:
+            if pcert.add_commit(c):
+                pcert.is_committed
+        assert pcert.is_committed
+        votes += len(prepares) + len(commits)
+
+        if seqno % conf.checkpoint_interval == 0:
+            plog.truncate(seqno + 1)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'seqnos': seqnos,
+        'votes': votes,
+        'elapsed': elapsed,
+        'votes_per_s': votes / elapsed,
+        'window_bytes': window_bytes,
+    }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Throughput of readonly requests against read-write ones
+
+    python -O benchmarks/readonly.py cluster -c 16 --count 2000
+
+cluster is generated by ``pbft gen -n 4 -c 16``. Both runs use a fresh
+4-replica cluster. Readonly requests are multicast to all replicas and
+executed at once without the three-phase protocol, the client waits for
+2f + 1 matching replies; read-write requests are ordered by the primary.
+"""
+import asyncio
+import json
+import statistics
+import sys
+
+import click
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def measure(config_dir, readonly, client_count, count, command):
+    processes = start_replicas(config_dir, 4)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        elapsed, latencies = loop.run_until_complete(
+            closed_loop(clients, command, count, readonly))
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    return {
+        'readonly': readonly,
+        'requests': count,
+        'throughput': count / elapsed,
+        'latency_p50': statistics.median(latencies),
+    }
+
+@click.command()
+@click.option('--client_count', '-c', default = 16)
+@click.option('--count', default = 2000)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(client_count, count, command_size, config_dir):
+    command = bytes(command_size)
+    for readonly in (False, True):
+        print(json.dumps(measure(config_dir, readonly, client_count,
+                                 count, command)))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Reply bytes per request with and without digest replies
+
+    python -O benchmarks/reply_digest.py cluster --sizes 256,1024,4096
+
+cluster is generated by ``pbft gen -n 4 -c 1``. Every replica returns
+results of the given size. With digest replies only the full replier
+chosen by the client sends the result, the others send its digest;
+without them (reply_digest_thresh raised) every replica sends it.
+"""
+import asyncio
+import json
+import sys
+
+import click
+
+from pbft.basic import Configuration as conf, TaskType
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def measure(config_dir, digest, size, client_count, count, command):
+    def setup():
+        if not digest:
+            conf.reply_digest_thresh = 1 << 30
+
+    def execute(command, sender_type, sender, readonly, state):
+        return bytes(size)
+
+    processes = start_replicas(config_dir, 4, setup, execute)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        received = [0]
+        for c in clients:
+            def handle(task, handle = c.handle):
+                if task.type == TaskType.PEER_MSG:
+                    received[0] += len(task.item[0])
+                return handle(task)
+            c.handle = handle
+
+        elapsed, latencies = loop.run_until_complete(
+            closed_loop(clients, command, count))
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    return {
+        'digest_replies': digest,
+        'result_size': size,
+        'requests': count,
+        'reply_bytes_per_request': received[0] / count,
+        'throughput': count / elapsed,
+    }
+
+@click.command()
+@click.option('--sizes', default = '256,1024,4096')
+@click.option('--client_count', '-c', default = 1)
+@click.option('--count', default = 300)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(sizes, client_count, count, command_size, config_dir):
+    command = bytes(command_size)
+    for size in (int(s) for s in sizes.split(',')):
+        for digest in (False, True):
+            print(json.dumps(measure(config_dir, digest, size,
+                                     client_count, count, command)))
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Memory of replicas under sustained load
+
+    python -O benchmarks/soak.py cluster --count 1000000 -c 16
+
+clients run closed loops in rounds of --sample requests, RSS of every
+replica is read from /proc after each round. With checkpoints becoming
+stable the plog window moves and RSS should stay flat.
+"""
+import asyncio
+import json
+import sys
+
+import click
+
+from pbft.basic import Configuration as conf
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def rss_kb(pid:int) -> int:
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+@click.command()
+@click.option('--count', default = 1000000)
+@click.option('--sample', default = 10000, help = 'requests per round')
+@click.option('--client_count', '-c', default = 16)
+@click.option('--command_size', default = 64)
+@click.option('--batch', default = 1, help = 'requests per pre_prepare')
+@click.argument('config_dir')
+def main(count, sample, client_count, command_size, batch, config_dir):
+    def setup():
+        conf.request_in_pre_prepare = batch
+        conf.adaptive_batching = batch > 1
+
+    command = bytes(command_size)
+    processes = start_replicas(config_dir, 4, setup)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        done = 0
+        while done < count:
+            n = min(sample, count - done)
+            elapsed, _ = loop.run_until_complete(
+                closed_loop(clients, command, n))
+            done += n
+            print(json.dumps({
+                'requests': done,
+                'throughput': n / elapsed,
+                'rss_kb': [rss_kb(p.pid) for p in processes],
+            }))
+            sys.stdout.flush()
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+if __name__ == '__main__':
+    main()
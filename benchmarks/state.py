@@ -0,0 +1,62 @@
+"""Startup cost of the state and reads of its pages
+
+    python -O benchmarks/state.py --children 512 --path /tmp/pbft.state
+
+startup: State() with python objects only for interior partitions
+first_digest: compute_full_digest of a fresh state, pages never written
+read: digest every written page through read_page views, no copy
+"""
+import hashlib
+import json
+import os
+import time
+import tracemalloc
+
+import click
+
+from pbft.partition import Partition
+from pbft.state import State
+
+@click.command()
+@click.option('--children', default = 512)
+@click.option('--written', default = 4096, help = 'pages written')
+@click.option('--path', default = None, help = 'file backing the pages')
+def main(children, written, path):
+    Partition.children_count = children
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    state = State(path)
+    startup = time.perf_counter() - start
+    startup_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    state.compute_full_digest()
+    first_digest = time.perf_counter() - start
+
+    written = min(written, len(state.leaves))
+    for i in range(written):
+        state.set_block(i, os.urandom(Partition.block_size))
+
+    start = time.perf_counter()
+    for i in range(written):
+        hashlib.sha256(state.read_page(i))
+    read = time.perf_counter() - start
+
+    print(json.dumps({
+        'pages': len(state.leaves),
+        'path': path,
+        'startup_ms': startup * 1000,
+        'startup_bytes': startup_bytes,
+        'first_digest_ms': first_digest * 1000,
+        'written_pages': written,
+        'read_mb_per_s': written * Partition.block_size / read / 2 ** 20,
+    }))
+
+    state.close()
+    if path:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Catch-up of a lagging replica by state transfer on localhost
+
+    python -O benchmarks/state_transfer.py cluster --seqnos 4096
+
+replicas run in this process. all but replica 3 apply the same random
+page writes for seqnos and checkpoint every checkpoint_interval, then
+replica 3, still at checkpoint 0, fetches the latest checkpoint.
+"""
+import asyncio
+import json
+import random
+
+import click
+
+from pbft.basic import Configuration as conf
+from pbft.cli import replica_keys
+from pbft.partition import Partition
+from pbft.replica import Replica
+
+from cluster import load_config
+
+def apply_writes(states, seqnos:int, writes:int, seed:int):
+    rng = random.Random(seed)
+    leaf_count = len(states[0].leaves)
+    for n in range(1, seqnos + 1):
+        for _ in range(writes):
+            index = rng.randrange(leaf_count)
+            block = rng.randbytes(Partition.block_size)
+            for state in states:
+                state.set_block(index, block)
+
+        if n % conf.checkpoint_interval == 0:
+            for state in states:
+                state.checkpoint(n)
+
+async def start(replica):
+    replica.transport, replica.protocol = await replica.listen
+    await replica.fetch() # CONN_MADE
+    replica.start_bulk_recv()
+    replica.send_new_key()
+
+@click.command()
+@click.argument('config_dir')
+@click.option('--children', default = 256)
+@click.option('--seqnos', default = 4096)
+@click.option('--writes', default = 2, help = 'pages written per seqno')
+@click.option('--max-bytes', default = conf.fetch_max_bytes)
+def main(config_dir, children, seqnos, writes, max_bytes):
+    Partition.children_count = children
+    conf.crypto_workers = 0 # all replicas share this process
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    replicas = []
+    for i in range(4):
+        config = load_config(config_dir, 'replica_{}.toml'.format(i))
+        replicas.append(Replica(**{ k: config[k] for k in replica_keys }))
+
+    lagging = replicas[3]
+    lagging.fetcher.max_bytes = max_bytes
+    lagging.state.checkpoint(0)
+    apply_writes([r.state for r in replicas[:3]], seqnos, writes, seed = 1)
+
+    async def run():
+        for r in replicas:
+            await start(r)
+        await asyncio.sleep(0.5) # new_keys
+
+        start_time = loop.time()
+        lagging.fetcher.start()
+        while lagging.state.is_fetching:
+            await asyncio.sleep(0.01)
+        return loop.time() - start_time
+
+    elapsed = loop.run_until_complete(run())
+    assert lagging.state.digest == replicas[0].state.digest
+
+    stats = lagging.fetcher.stats
+    leaf_count = len(lagging.state.leaves)
+    print(json.dumps({
+        'pages': leaf_count,
+        'seqnos_behind': seqnos,
+        'checkpoint': stats['target'],
+        'elapsed': elapsed,
+        'data_count': stats['data_count'],
+        'meta_data_count': stats['meta_data_count'],
+        'retransmit_count': stats['retransmit_count'],
+        'received_bytes': stats['received_bytes'],
+        'sent_bytes': stats['sent_bytes'],
+        'full_copy_bytes': leaf_count * Partition.block_size,
+        'mb_per_s': stats['received_bytes'] / elapsed / 2 ** 20,
+    }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Client latency with and without tentative execution
+
+    python -O benchmarks/tentative.py cluster -c 1 --count 500
+
+cluster is generated by ``pbft gen -n 4 -c 1``. Both runs use a fresh
+4-replica cluster; with tentative execution replicas reply once a
+request is prepared and clients wait for 2f + 1 matching replies,
+without it they reply after commit and clients wait for f + 1.
+"""
+import asyncio
+import json
+import statistics
+import sys
+
+import click
+
+from pbft.basic import Configuration as conf
+
+from cluster import start_replicas, stop_replicas, new_client, closed_loop
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def measure(config_dir, tentative, client_count, count, command):
+    def setup():
+        conf.tentative_execution = tentative
+
+    processes = start_replicas(config_dir, 4, setup)
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients = [loop.run_until_complete(new_client(config_dir, i))
+                   for i in range(client_count)]
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        elapsed, latencies = loop.run_until_complete(
+            closed_loop(clients, command, count))
+
+        for c in clients:
+            c.close()
+        loop.run_until_complete(asyncio.sleep(0.1)) # release ports
+        loop.close()
+    finally:
+        stop_replicas(processes)
+
+    return {
+        'tentative': tentative,
+        'requests': count,
+        'throughput': count / elapsed,
+        'latency_p50': statistics.median(latencies),
+        'latency_p99': percentile(latencies, 0.99),
+    }
+
+@click.command()
+@click.option('--client_count', '-c', default = 1)
+@click.option('--count', default = 500)
+@click.option('--command_size', default = 64)
+@click.argument('config_dir')
+def main(client_count, count, command_size, config_dir):
+    command = bytes(command_size)
+    for tentative in (False, True):
+        print(json.dumps(measure(config_dir, tentative, client_count,
+                                 count, command)))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
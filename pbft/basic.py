@@ -18,18 +18,87 @@ class Task():
         self.item = item
 
 class Configuration:
-    # replicas can handle this many before next requests
-    # dx: I think there is no necessary to change this
-    congestion_window = 1
+    # seqnos the primary may assign beyond last_executed, these are
+    # in their pre_prepare/prepare/commit phases at the same time,
+    # 1 serializes the consensus, also bounded by checkpoint_max_out
+    congestion_window = 16
 
     # max request counts in pre prepare
-    request_in_pre_prepare = 1
+    request_in_pre_prepare = 64
+
+    # primary grows the batch size under load and shrinks it when idle,
+    # between 1 and request_in_pre_prepare, otherwise batches are always
+    # cut at request_in_pre_prepare
+    adaptive_batching = True
+
+    # seconds the primary may hold a batch that is not full
+    batch_max_wait = 0.002
+
+    # execute prepared requests before they commit and reply tentatively,
+    # clients accept 2f + 1 matching tentative replies
+    tentative_execution = True
+
+    # readonly requests a replica keeps while it has tentative state,
+    # the oldest are dropped beyond that, their clients retransmit
+    ro_requests_max = 1024
+
+    # results longer than this are only sent by the full replier,
+    # others reply with the digest
+    reply_digest_thresh = 32
+
+    # backups time view changes by the latency from a request to its
+    # execution, srtt + 4 * rttvar as the retransmission timeout of tcp,
+    # instead of the fixed view_change_interval which is only used until
+    # the first sample. each view change failing to start the next view
+    # doubles it, a new view resets the backoff. seconds
+    adaptive_view_change_timeout = True
+    view_change_min_timeout = 0.2
+    view_change_max_timeout = 60.0
+
+    # reqids a client may have outstanding from its oldest one on,
+    # replicas keep replies to the last 2 * client_window requests of
+    # each client
+    client_window = 32
+
+    # seconds before a client sends a request again to all replicas,
+    # doubled for each retransmission up to request_max_timeout
+    request_timeout = 1.0
+    request_max_timeout = 8.0
 
     pre_prepare_big_request_thresh = 80
     pre_prepare_content_thresh = 8196
 
+    # payload codec of sent frames, 1: rlp, 2: struct
+    # frames of both versions are always accepted, keep 1 while
+    # replicas without the struct codec are still running
+    wire_version = 2
+
+    # worker processes for rsa signing, verification and decryption,
+    # 0 runs them inline on the event loop
+    crypto_workers = 2
+
+    # send and receive up to bulk_io_batch datagrams per syscall by
+    # sendmmsg/recvmmsg where available (linux, ipv4)
+    bulk_io = True
+    bulk_io_batch = 16
+
+    # entries of the verification cache, 0 disables it
+    verify_cache_size = 4096
+
+    # threads hashing a level of the partition tree together, hashlib
+    # releases the gil on pages, 1 hashes serially
+    digest_workers = 1
+
     checkpoint_interval = 128
     checkpoint_max_out  = checkpoint_interval * 2
 
+    # checkpoints kept as copy on write snapshots of the state
+    checkpoint_log_size = checkpoint_max_out // checkpoint_interval + 1
+
+    # state transfer: bytes of replies expected for fetches in flight,
+    # and seconds before a fetch is sent again to another replica
+    fetch_max_bytes = 1 << 18
+    fetch_timeout = 0.2
+
 
 
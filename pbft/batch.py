@@ -0,0 +1,90 @@
+from .basic import Configuration as conf
+
+class Batcher():
+    """Adaptive batch sizing for pre_prepares of the primary
+
+    The target size doubles when a batch is cut full while more requests
+    are still pending (under load), and halves when a batch is cut by
+    the deadline before reaching the target (idle).
+    """
+
+    def __init__(self,
+                 max_size:int = conf.request_in_pre_prepare,
+                 max_bytes:int = conf.pre_prepare_content_thresh,
+                 max_wait:float = conf.batch_max_wait,
+                 adaptive:bool = conf.adaptive_batching):
+        """
+        :max_size: max request count in a batch
+        :max_bytes: max bytes of raw requests in a batch
+        :max_wait: seconds to hold a batch which is not full
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.adaptive = adaptive
+
+        # current target of batch size
+        self.size = 1 if adaptive else max_size
+
+        self.batch_count = 0
+        self.request_count = 0
+        self.byte_count = 0
+        self.max_batch_size = 0
+
+        # from arrival of the oldest request in batch to cut, in seconds
+        self.latency_sum = 0.0
+        self.max_latency = 0.0
+
+    def is_ready(self, pending:int, oldest:float, now:float) -> bool:
+        """Should a batch be cut now
+
+        :pending: count of pending requests
+        :oldest: arrival time of the oldest pending request
+        """
+        return pending >= self.size or now - oldest >= self.max_wait
+
+    def delay(self, oldest:float, now:float) -> float:
+        """Seconds to wait before the batch must be cut"""
+        return max(0.0, oldest + self.max_wait - now)
+
+    def record(self, pre_prepare, pending:int, now:float):
+        """Update counters and the target size after a batch is cut
+
+        :pending: count of requests left behind
+        """
+        requests = pre_prepare.requests
+        size = len(requests)
+
+        self.batch_count += 1
+        self.request_count += size
+        self.byte_count += len(pre_prepare.payload)
+        self.max_batch_size = max(self.max_batch_size, size)
+
+        arrivals = [r.arrival for r in requests
+                    if getattr(r, 'arrival', None) is not None]
+        if arrivals:
+            latency = now - min(arrivals)
+            self.latency_sum += latency
+            self.max_latency = max(self.max_latency, latency)
+
+        if not self.adaptive:
+            return
+
+        if size >= self.size and pending:
+            self.size = min(self.size * 2, self.max_size)
+        elif size < self.size:
+            self.size = max(self.size // 2, 1)
+
+    @property
+    def stats(self):
+        count = self.batch_count or 1
+        return {
+            'batch_size': self.size,
+            'batch_count': self.batch_count,
+            'request_count': self.request_count,
+            'byte_count': self.byte_count,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': self.request_count / count,
+            'avg_batch_latency': self.latency_sum / count,
+            'max_batch_latency': self.max_latency,
+        }
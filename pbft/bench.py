@@ -0,0 +1,143 @@
+import asyncio
+import random
+import struct
+
+class Workload():
+    """Commands of a benchmark
+
+    commands are command_size bytes, starting with a counter so that
+    no two are the same. readonly_ratio of them are readonly requests,
+    signed ones are authenticated by signatures instead of macs.
+    """
+
+    def __init__(self, command_size:int = 64, readonly_ratio:float = 0.0,
+                 signed:bool = False, seed:int = None):
+        self.command_size = command_size
+        self.readonly_ratio = readonly_ratio
+        self.signed = signed
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def submit(self, client) -> asyncio.Future:
+        self.count += 1
+        command = struct.pack('<Q', self.count)[:self.command_size]
+        command += bytes(self.command_size - len(command))
+        readonly = self.random.random() < self.readonly_ratio
+        return client.submit(command, readonly, signed = self.signed)
+
+class Latencies():
+    """Latencies of completed requests, in seconds"""
+
+    # upper bounds of histogram buckets, doubling from 100us
+    bucket_base = 0.0001
+
+    def __init__(self):
+        self.values = []
+        self.failed = 0 # not completed, e.g. cancelled at the end
+
+    def __len__(self):
+        return len(self.values)
+
+    def record(self, latency:float):
+        self.values.append(latency)
+
+    def percentile(self, p:float, values = None):
+        values = values or sorted(self.values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def histogram(self) -> list:
+        """[(bucket upper bound in ms, count)] of non empty buckets"""
+        counts = []
+        for v in self.values:
+            bucket, bound = 0, self.bucket_base
+            while v > bound:
+                bucket += 1
+                bound *= 2
+            if bucket >= len(counts):
+                counts.extend([0] * (bucket + 1 - len(counts)))
+            counts[bucket] += 1
+        return [(self.bucket_base * 2 ** i * 1000, c)
+                for i, c in enumerate(counts) if c]
+
+    @property
+    def stats(self):
+        values = sorted(self.values)
+        if not values:
+            return {'completed': 0, 'failed': self.failed}
+
+        def ms(seconds):
+            return seconds * 1000
+
+        return {
+            'completed': len(values),
+            'failed': self.failed,
+            'latency_ms': {
+                'mean': ms(sum(values) / len(values)),
+                'p50': ms(self.percentile(0.5, values)),
+                'p99': ms(self.percentile(0.99, values)),
+                'p999': ms(self.percentile(0.999, values)),
+                'max': ms(values[-1]),
+            },
+            'histogram_ms': self.histogram(),
+        }
+
+async def closed_loop(clients, workload:Workload, duration:float,
+                      window:int = 1, drain:float = 5.0) -> Latencies:
+    """Each client keeps window requests outstanding for duration
+
+    requests not completed drain seconds after that count as failed
+    """
+    loop = asyncio.get_event_loop()
+    latencies = Latencies()
+    end = loop.time() + duration
+
+    async def run(client):
+        while loop.time() < end:
+            start = loop.time()
+            try:
+                await workload.submit(client)
+            except asyncio.CancelledError:
+                latencies.failed += 1
+                return
+            latencies.record(loop.time() - start)
+
+    tasks = [loop.create_task(run(c))
+             for c in clients for _ in range(window)]
+    _, pending = await asyncio.wait(tasks, timeout = duration + drain)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending)
+    return latencies
+
+async def open_loop(clients, workload:Workload, duration:float,
+                    rate:float, drain:float = 5.0) -> Latencies:
+    """Submit rate requests per second for duration, round robin
+
+    requests are sent at fixed times whether or not earlier ones
+    completed, latencies count from then, time spent waiting for the
+    window of the client included. requests not completed drain
+    seconds after the last one was submitted count as failed.
+    """
+    loop = asyncio.get_event_loop()
+    latencies = Latencies()
+    futures = []
+
+    def done(future, scheduled):
+        if not future.cancelled():
+            latencies.record(loop.time() - scheduled)
+
+    start = loop.time()
+    for i in range(int(duration * rate)):
+        scheduled = start + i / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        future = workload.submit(clients[i % len(clients)])
+        future.add_done_callback(lambda f, s = scheduled: done(f, s))
+        futures.append(future)
+
+    if futures:
+        _, pending = await asyncio.wait(futures, timeout = drain)
+        latencies.failed = len(pending)
+    return latencies
@@ -0,0 +1,175 @@
+"""Many datagrams per syscall by sendmmsg/recvmmsg of libc
+
+Only ipv4 sockets on linux are supported, new_bulk_socket returns None
+elsewhere and callers fall back to one syscall per datagram.
+"""
+import ctypes
+import ctypes.util
+import errno
+import socket
+import sys
+
+MSG_DONTWAIT = 0x40
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class send_iovec(ctypes.Structure):
+    """iovec pointing to the buffer of bytes, which is kept alive"""
+    _fields_ = [
+        ('iov_base', ctypes.c_char_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class sockaddr_in(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_ushort), # network byte order
+        ('sin_addr', ctypes.c_ubyte * 4),
+        ('sin_zero', ctypes.c_ubyte * 8),
+    ]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint),
+        ('msg_iov', ctypes.c_void_p), # iovec or send_iovec
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        libc.sendmmsg.restype = ctypes.c_int
+        libc.recvmmsg.restype = ctypes.c_int
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+libc = load_libc()
+
+class BulkSocket():
+    """sendmmsg/recvmmsg on the socket of a datagram transport"""
+
+    def __init__(self, sock, batch:int, buffer_size:int = 65536):
+        self.fd = sock.fileno()
+        self.batch = batch
+        self.buffer_size = buffer_size
+
+        # buffers and headers are reused by every send/recv
+        self.buffers = [ctypes.create_string_buffer(buffer_size)
+                        for _ in range(batch)]
+        self.recv_addrs = (sockaddr_in * batch)()
+        self.recv_iovs = (iovec * batch)()
+        self.recv_msgs = (mmsghdr * batch)()
+        self.send_iovs = (send_iovec * batch)()
+        self.send_msgs = (mmsghdr * batch)()
+        for i in range(batch):
+            self.recv_iovs[i].iov_base = ctypes.addressof(self.buffers[i])
+            self.recv_iovs[i].iov_len = buffer_size
+            self.recv_msgs[i].msg_hdr.msg_iov = (
+                ctypes.addressof(self.recv_iovs[i]))
+            self.recv_msgs[i].msg_hdr.msg_iovlen = 1
+            self.recv_msgs[i].msg_hdr.msg_name = (
+                ctypes.addressof(self.recv_addrs[i]))
+
+            self.send_msgs[i].msg_hdr.msg_iov = (
+                ctypes.addressof(self.send_iovs[i]))
+            self.send_msgs[i].msg_hdr.msg_iovlen = 1
+
+        self.addrs = {} # (ip, port) => address of sockaddr_in
+
+    def sockaddr(self, addr) -> int:
+        sa = self.addrs.get(addr)
+        if not sa:
+            ip, port = addr
+            sa = sockaddr_in(socket.AF_INET, socket.htons(port),
+                             (ctypes.c_ubyte * 4)(*socket.inet_aton(ip)))
+            self.addrs[addr] = sa
+        return ctypes.addressof(sa)
+
+    def send(self, datagrams):
+        """Send [(data, addr)], return (sent count, syscall count)
+
+        stops early when the socket buffer is full
+        """
+        sent = syscalls = 0
+        addr_size = ctypes.sizeof(sockaddr_in)
+        for start in range(0, len(datagrams), self.batch):
+            chunk = datagrams[start:start + self.batch]
+            count = len(chunk)
+
+            for i, (data, addr) in enumerate(chunk):
+                if type(data) is not bytes:
+                    data = bytes(data)
+                iov = self.send_iovs[i]
+                iov.iov_base = data
+                iov.iov_len = len(data)
+                hdr = self.send_msgs[i].msg_hdr
+                hdr.msg_name = self.sockaddr(addr)
+                hdr.msg_namelen = addr_size
+
+            done = 0
+            while done < count:
+                n = libc.sendmmsg(self.fd, ctypes.byref(self.send_msgs[done]),
+                                  count - done, 0)
+                syscalls += 1
+                if n < 0:
+                    if ctypes.get_errno() in (errno.EAGAIN, errno.EINTR):
+                        return sent + done, syscalls
+                    raise OSError(ctypes.get_errno(), 'sendmmsg')
+                done += n
+
+            sent += done
+
+        return sent, syscalls
+
+    def recv(self):
+        """Receive ready datagrams without blocking, return [(data, addr)]"""
+        addr_size = ctypes.sizeof(sockaddr_in)
+        for i in range(self.batch):
+            # value-result, set by every recvmmsg
+            self.recv_msgs[i].msg_hdr.msg_namelen = addr_size
+
+        n = libc.recvmmsg(self.fd, self.recv_msgs, self.batch,
+                          MSG_DONTWAIT, None)
+        if n < 0:
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise OSError(ctypes.get_errno(), 'recvmmsg')
+
+        datagrams = []
+        for i in range(n):
+            sa = self.recv_addrs[i]
+            addr = (socket.inet_ntoa(bytes(sa.sin_addr)),
+                    socket.ntohs(sa.sin_port))
+            data = ctypes.string_at(self.buffers[i],
+                                    self.recv_msgs[i].msg_len)
+            datagrams.append((data, addr))
+        return datagrams
+
+def new_bulk_socket(transport, batch:int):
+    """BulkSocket of transport, None if not supported"""
+    if not libc or not transport:
+        return None
+
+    sock = transport.get_extra_info('socket')
+    if not sock or sock.family != socket.AF_INET:
+        return None
+
+    return BulkSocket(sock, batch)
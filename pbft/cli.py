@@ -1,4 +1,6 @@
+import asyncio
 import binascii
+import json
 import math
 import os
 import sys
@@ -12,7 +14,8 @@ from .node import Node
 from .replica import Replica
 from .principal import Principal
 from .client import Client
-from .message import Request
+from .basic import Configuration as conf
+from .bench import Workload, closed_loop, open_loop
 
 gintervals = dict({
     'auth': 30 * 60 * 1000,
@@ -131,8 +134,8 @@ def parse_args(replica_count, fault_count, client_count,
     replica_principals = []
     for i in range(n):
         r = replicas[i]
-        with open(r['public_key_file']) as f:
-            p = Principal(i, public_key = rsa.PublicKey.load_pkcs1(f.read()),
+        with open(r['public_key_file']) as kf:
+            p = Principal(i, public_key = rsa.PublicKey.load_pkcs1(kf.read()),
                           ip = r['ip'], port = r['port'])
             replica_principals.append(p)
 
@@ -140,8 +143,8 @@ def parse_args(replica_count, fault_count, client_count,
 
     client_principals = []
     for i, c in enumerate(clients):
-        with open(c['public_key_file']) as f:
-            p = Principal(i, public_key = rsa.PublicKey.load_pkcs1(f.read()),
+        with open(c['public_key_file']) as kf:
+            p = Principal(i, public_key = rsa.PublicKey.load_pkcs1(kf.read()),
                           ip = c['ip'], port = c['port'])
             client_principals.append(p)
 
@@ -159,9 +162,9 @@ client_keys = {
 }
 
 @cli_main.command()
-@click.option('--fault_count', '-f')
-@click.option('--replica_count', '-n')
-@click.option('--client_count', '-c')
+@click.option('--fault_count', '-f', type=int)
+@click.option('--replica_count', '-n', type=int)
+@click.option('--client_count', '-c', type=int)
 @click.option('--replica_configs', '-R',
                 type=click.File(mode='r'),
                 default='replica_configs.toml')
@@ -176,12 +179,7 @@ def client(**kwargs):
         client_config = { k: node_config[k] for k in client_keys }
         client = Client(**client_config)
 
-        reqs = [Request.from_client(client, False, False,
-                                  False, 0, b'Hello, world!'),
-                Request.from_client(client, False, False,
-                                  False, 0, b'Hello, world again!')]
-
-        client.process_requests(reqs)
+        client.process_requests([b'Hello, world!', b'Hello, world again!'])
     except KeyboardInterrupt:
         print('Interrupted by user')
     except:
@@ -189,15 +187,89 @@ def client(**kwargs):
     finally:
         print('client {} exited!'.format(node_config['index']))
 
-    
+@cli_main.command()
+@click.option('--fault_count', '-f', type=int)
+@click.option('--replica_count', '-n', type=int)
+@click.option('--client_count', '-c', default = 1,
+              help = 'clients run, by client_<i>.toml from 0 on')
+@click.option('--replica_configs', '-R', default='replica_configs.toml')
+@click.option('--client_configs', '-C', default='client_configs.toml')
+@click.option('--mode', type = click.Choice(['closed', 'open']),
+              default = 'closed')
+@click.option('--window', '-w', default = 1,
+              help = 'closed loop: outstanding requests per client')
+@click.option('--rate', '-r', default = 100.0,
+              help = 'open loop: requests per second of all clients')
+@click.option('--duration', '-d', default = 10.0, help = 'seconds')
+@click.option('--command_size', '-s', default = 64)
+@click.option('--readonly_ratio', default = 0.0)
+@click.option('--auth', type = click.Choice(['mac', 'signature']),
+              default = 'mac')
+@click.option('--output', '-o', type = click.File(mode = 'w'),
+              default = '-')
+def bench(fault_count, replica_count, client_count,
+          replica_configs, client_configs, mode, window, rate, duration,
+          command_size, readonly_ratio, auth, output):
+    """Load a running cluster, report throughput and latency as json
+
+    run in the folder of pbft gen, e.g. with 16 clients at 1000 req/s:
+
+        pbft bench -c 16 --mode open --rate 1000 --duration 30
+    """
+    # the clients share this process, rsa runs inline
+    conf.crypto_workers = 0
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    clients = []
+    for i in range(client_count):
+        node_config = parse_args(replica_count, fault_count, None,
+                                 replica_configs, client_configs,
+                                 'client_{}.toml'.format(i))
+        clients.append(Client(**{ k: node_config[k] for k in client_keys }))
+
+    workload = Workload(command_size, readonly_ratio, auth == 'signature')
+    try:
+        for c in clients:
+            loop.run_until_complete(c.connect())
+        loop.run_until_complete(asyncio.sleep(0.5)) # new_keys
+
+        start = loop.time()
+        if mode == 'closed':
+            run = closed_loop(clients, workload, duration, window)
+        else:
+            run = open_loop(clients, workload, duration, rate)
+        latencies = loop.run_until_complete(run)
+        elapsed = loop.time() - start
+    finally:
+        for c in clients:
+            c.close()
+
+    report = {
+        'mode': mode,
+        'clients': client_count,
+        'window': window if mode == 'closed' else None,
+        'rate': rate if mode == 'open' else None,
+        'duration': duration,
+        'command_size': command_size,
+        'readonly_ratio': readonly_ratio,
+        'auth': auth,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'retransmits': sum(c.retransmit_count for c in clients),
+    }
+    report.update(latencies.stats)
+    print(json.dumps(report), file = output)
+
 replica_keys = client_keys.union({
     '{}_interval'.format(name) for name in gintervals
 })
 
 @cli_main.command()
-@click.option('--fault_count', '-f')
-@click.option('--replica_count', '-n')
-@click.option('--client_count', '-c')
+@click.option('--fault_count', '-f', type=int)
+@click.option('--replica_count', '-n', type=int)
+@click.option('--client_count', '-c', type=int)
 @click.option('--replica_configs', '-R',
                 type=click.File(mode='r'),
                 default='replica_configs.toml')
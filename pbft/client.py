@@ -1,10 +1,29 @@
-import traceback
+import asyncio
+import collections
+import random
 
-from .types import Reqid, Seqno, View, TaskType, Task
+from .basic import Reqid, Seqno, View, TaskType, Task, Configuration as conf
 from .message import Request, Reply
-from .utils import print_task
+from .util import print_task
 from .principal import Principal
 from .node import Node
+from .reply_quorum import ReplyQuorum
+
+class Outstanding():
+    """A submitted request, its replies are in Client.replies"""
+    __slots__ = ('command', 'readonly', 'timeout', 'future', 'signed',
+                 'request', 'timer')
+
+    def __init__(self, command:bytes, readonly:bool, timeout:float,
+                 future:asyncio.Future, signed:bool = False):
+        self.command = command
+        self.readonly = readonly
+        self.timeout = timeout # of the next retransmission
+        self.future = future
+        self.signed = signed # by the private key, else by authenticators
+
+        self.request = None # created when sent
+        self.timer = None
 
 class Client(Node):
     type = 'Client'
@@ -20,16 +39,29 @@ class Client(Node):
                 self.index = index
                 p.private_key = private_key
 
-        self.current_request = None
+        # reqid -> Outstanding, sent and waiting for replies
+        self.outstanding = collections.OrderedDict()
+        self.waiting = collections.deque() # not sent yet, see submit
+        self.receiver = None # task of dispatch_replies
+
+        self.retransmit_count = 0
+        self.duplicate_reply_count = 0 # dropped before verification
 
         super().__init__(client_principals = client_principals,
                          *args, **kwargs)
 
+        self.replies = ReplyQuorum(self.f)
+
     @property
     def principal(self) -> Principal:
         """Get principal of this node."""
         return self.client_principals[self.index]
 
+    def gen_authenticators(self, hash_bytes):
+        """Clients authenticate requests by keys in their new_keys"""
+        return [p.gen_hmac('in', hash_bytes)
+                for p in self.replica_principals]
+
     async def handle(self, task:Task):
         print_task(task)
         res = None
@@ -51,54 +83,184 @@ class Client(Node):
     async def fetch(self) -> Task:
         return await self.task_queue.get()        
 
-    def send_request(self, request):
-        if self.current_request:
-            return False # do nothing
+    async def connect(self):
+        """Create the datagram endpoint and send our new_key"""
+        self.transport, self.protocol = await self.listen
+        task = await self.fetch()
+        assert task.type == TaskType.CONN_MADE
 
-        r = request
+        # send key auth keys, thus we can push requests to replicas
+        if self.crypto:
+            await self.sign_and_send_new_key()
+        else:
+            self.send_new_key()
+
+    def submit(self, command:bytes, readonly:bool = False,
+               timeout:float = conf.request_timeout,
+               signed:bool = False) -> asyncio.Future:
+        """Send a request of command, return the future of its result
+
+        requests are sent while their reqids are within client_window
+        from the oldest outstanding one, later ones wait. a random
+        replica sends the full result, the others its digest. a request
+        without a quorum of replies in timeout seconds is sent to all
+        replicas again, asking all of them for full results.
+        """
+        if not self.receiver or self.receiver.done():
+            self.receiver = self.loop.create_task(self.dispatch_replies())
+
+        pending = Outstanding(command, readonly, timeout,
+                              self.loop.create_future(), signed)
+        self.waiting.append(pending)
+        self.send_waiting()
+        return pending.future
+
+    def send_waiting(self):
+        while self.waiting:
+            oldest = next(iter(self.outstanding), None)
+            if (oldest is not None
+                and self.reqid + 1 >= oldest + conf.client_window):
+                return # window is full
+
+            pending = self.waiting.popleft()
+            if pending.future.done():
+                continue # cancelled
 
-        if r.readonly or len(r) > r.big_request_thresh:
+            pending.request = Request.from_client(
+                self, pending.readonly, pending.signed, False,
+                random.randrange(self.n), pending.command)
+            self.send_request(pending.request)
+            self.outstanding[pending.request.reqid] = pending
+            self.replies.open(pending.request.reqid, pending.readonly)
+            pending.timer = self.loop.call_later(
+                pending.timeout, self.retransmit, pending)
+
+    def send_request(self, request):
+        r = request
+        if (r.readonly
+            or len(r.command) > conf.pre_prepare_big_request_thresh):
             self.sendto(r, 'ALL_REPLICAS')
         else:
             self.sendto(r, self.primary)
 
-        self.current_request = r
+    def retransmit(self, pending):
+        """No quorum of replies in time, send to all replicas again"""
+        if self.outstanding.get(pending.request.reqid) is not pending:
+            return
 
-        # TODO: retransmit
-        return True
+        if pending.future.done():
+            self.finish(pending)
+            return
 
-    def recv_message(self):
-        task = self.loop.run_until_complete(self.fetch())
-        message = self.loop.run_until_complete(self.handle(task))
-        return message
+        self.request_full_replies(pending.request)
+        pending.timeout = min(pending.timeout * 2, conf.request_max_timeout)
+        pending.timer = self.loop.call_later(
+            pending.timeout, self.retransmit, pending)
+        self.retransmit_count += 1
 
+    def request_full_replies(self, request):
+        """Ask all replicas for full results of request
 
-    def process_requests(self, reqs):
-        # create datagram server
-        self.transport, self.protocol = self.loop.run_until_complete(self.listen)
-        task = self.loop.run_until_complete(self.fetch())
-        assert task.type == TaskType.CONN_MADE
+        for a timeout, the full replier may be faulty or its reply lost
+        """
+        r = request
+        if not r.reply_from_all:
+            r.reply_from_all = True
+            r.clear_digests()
+            r.gen_payload(self)
 
-        # send key auth keys, thus we can push requests to replicas
-        self.send_new_key()
+        self.sendto(r, 'ALL_REPLICAS')
+
+    def finish(self, pending, result = None):
+        """Forget an outstanding request, set its result if any"""
+        if pending.timer:
+            pending.timer.cancel()
+        self.outstanding.pop(pending.request.reqid, None)
+        self.replies.close(pending.request.reqid)
+        if result is not None and not pending.future.done():
+            pending.future.set_result(result)
+        self.send_waiting()
+
+    async def dispatch_replies(self):
+        """Count received replies for outstanding requests
+
+        datagrams queued by the time we run are handled together
+        """
+        while True:
+            tasks = [await self.fetch()]
+            while not self.task_queue.empty():
+                tasks.append(self.task_queue.get_nowait())
+
+            replies = []
+            for task in tasks:
+                try:
+                    message = await self.handle(task)
+                except IOError:
+                    return
+                if type(message) is Reply:
+                    replies.append(message)
+            self.recv_replies(replies)
+
+    def recv_replies(self, replies):
+        """Verify replies of a loop iteration in bulk, then count them
+
+        duplicates and replies to requests no longer outstanding are
+        dropped before verification
+        """
+        fresh = [r for r in replies if not self.replies.is_duplicate(r)]
+        self.duplicate_reply_count += len(replies) - len(fresh)
+        self.verify_messages(fresh)
+        for reply in fresh:
+            self.recv_reply(reply)
+
+    def recv_reply(self, reply):
+        """Count reply for its request, return the result on a quorum
+
+        see ReplyQuorum. replies may carry only the digest of the
+        result, the full result is checked against it. None is returned
+        until then. the view f + 1 matching repliers are in is taken,
+        requests go to its primary from then on.
+        """
+        pending = self.outstanding.get(reply.reqid)
+        if (not pending or self.replies.is_duplicate(reply)
+            or not reply.verify(self, self.find_sender(reply))):
+            return None
+
+        tally = self.replies.add(reply)
+        if not tally:
+            return None
+
+        self.view = max(self.view, tally.view(self.f))
+        self.finish(pending, tally.result)
+        return tally.result
 
-        # send requests and recv replies one by one
-        for request in reqs:
-            if not self.send_request(request):
-                print('error when send: {}'.format(request))
+    def close(self):
+        """Cancel outstanding requests and close the transport"""
+        if self.receiver:
+            self.receiver.cancel()
+            self.receiver = None
 
-            try:
-                while True:
-                    message = self.recv_message()
-                    if type(message) is not Reply:
-                        print('message: {}: '.format(message))                    
-                        continue
+        for pending in list(self.outstanding.values()) + list(self.waiting):
+            if pending.timer:
+                pending.timer.cancel()
+            pending.future.cancel()
+        self.outstanding.clear()
+        self.waiting.clear()
+        self.replies = ReplyQuorum(self.f)
 
-                    print('reply: {}: '.format(message))                    
-                    
+        if getattr(self, 'transport', None):
+            self.transport.close()
+        if self.crypto:
+            self.crypto.close()
 
-            except KeyboardInterrupt:
-                raise
-            except:
-                traceback.print_exc()
+    def process_requests(self, commands):
+        self.loop.run_until_complete(self.connect())
 
+        # all requests are outstanding at once
+        futures = [self.submit(command) for command in commands]
+        try:
+            for command, result in zip(commands, self.loop.run_until_complete(
+                    asyncio.gather(*futures))):
+                print('reply: {} => {}'.format(command, result))
+        finally:
+            self.close()
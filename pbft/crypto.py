@@ -0,0 +1,119 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import traceback
+
+import rsa
+
+from .principal import Principal
+
+# rsa operations in worker processes, they must be module level
+# functions to be pickled, failures are returned as None/False
+
+def sign(private_key, message:bytes) -> bytes:
+    try:
+        return rsa.sign(message, private_key, Principal.hash_method)
+    except:
+        return None
+
+def verify(public_key, message:bytes, signature) -> bool:
+    try:
+        rsa.verify(message, bytes(signature), public_key)
+        return True
+    except:
+        return False
+
+def decrypt(private_key, message:bytes) -> bytes:
+    try:
+        return rsa.decrypt(bytes(message), private_key)
+    except:
+        return None
+
+def run_batch(jobs) -> list:
+    """Run [(func, args)] in a worker, return their results"""
+    return [func(*args) for func, args in jobs]
+
+class CryptoService():
+    """RSA operations off the event loop
+
+    Operations submitted in the same loop iteration are queued and
+    split into one batch per worker, the awaiting handler resumes
+    when its result comes back.
+    """
+
+    def __init__(self, workers:int, loop = None):
+        self.workers = workers
+        self.loop = loop or asyncio.get_event_loop()
+
+        # created on the first operation, after the node has forked
+        self.executor = None
+
+        self.pending = [] # [(func, args, future)]
+        self.flush_handle = None
+
+        self.job_count = 0
+        self.batch_count = 0
+
+    def submit(self, func, *args) -> asyncio.Future:
+        # memoryviews into received frames, e.g. by the struct codec,
+        # cannot be pickled to the workers, they are copied
+        args = tuple(bytes(a) if isinstance(a, memoryview) else a
+                     for a in args)
+        future = self.loop.create_future()
+        self.pending.append((func, args, future))
+
+        if not self.flush_handle:
+            self.flush_handle = self.loop.call_soon(self.flush)
+
+        return future
+
+    def flush(self):
+        self.flush_handle = None
+
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(self.workers)
+
+        size = -(-len(pending) // self.workers) # ceil
+        for i in range(0, len(pending), size):
+            batch = pending[i:i + size]
+            done = self.loop.run_in_executor(
+                self.executor, run_batch,
+                [(func, args) for func, args, _ in batch])
+            done.add_done_callback(
+                lambda done, batch = batch: self.resolve(batch, done))
+
+            self.job_count += len(batch)
+            self.batch_count += 1
+
+    def resolve(self, batch, done):
+        try:
+            results = done.result()
+        except:
+            traceback.print_exc() # TODO: log
+            results = [None] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def sign(self, principal, message:bytes) -> bytes:
+        return await self.submit(sign, principal.private_key, message)
+
+    async def verify(self, principal, message:bytes, signature) -> bool:
+        return bool(await self.submit(verify, principal.public_key,
+                                      message, signature))
+
+    async def decrypt(self, principal, message:bytes) -> bytes:
+        return await self.submit(decrypt, principal.private_key, message)
+
+    def close(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        if self.executor:
+            self.executor.shutdown(cancel_futures = True)
+            self.executor = None
@@ -1,6 +1,6 @@
 import asyncio
 
-from .types import TaskType, Task
+from .basic import TaskType, Task
 
 class DatagramServer(asyncio.DatagramProtocol):
     def __init__(self, node):
@@ -21,11 +21,11 @@ class DatagramServer(asyncio.DatagramProtocol):
     def datagram_received(self, data, addr):
         """Messages are node kind specific
         """
-        self.node.notify(Task(TaskType.PEER_MSG, (data, addr)))
+        self.node.datagram_received(data, addr)
 
     def error_received(self, exc):
         # print('Node transport error: {}'.format(exc))
         self.node.notify(Task(TaskType.PEER_ERR, exc))
 
-    def sendto(data:bytes, addr):
+    def sendto(self, data:bytes, addr):
         self.transport.sendto(data, addr)
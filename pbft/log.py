@@ -1,57 +1,97 @@
-import collections
-
-from .types import Seqno
+from .basic import Seqno
 
 class BaseLog():
     def __init__(self, capacity:int, head:Seqno):
-        """
+        """Ring of capacity items for seqnos in [head, head + capacity)
+
         :capacity: should be a power of 2
         """
+        assert capacity > 0 and capacity & (capacity - 1) == 0
+
         self.head = head
         self.capacity = capacity
+        self.mask = capacity - 1
         self.items = []
 
-    def truncate(self. new_head):
+    def truncate(self, new_head):
         if new_head <= self.head:
             return
 
-        for i in range(min(self.capacity, new_head - self.head)):
-            index = head + i & self.capacity - 1
-            self.items[index].init(Seqno(new_head + index))
+        # recycle items which fall out of the window, in place
+        for seqno in range(max(new_head, self.head + self.capacity),
+                           new_head + self.capacity):
+            self.items[seqno & self.mask].init(Seqno(seqno))
 
         self.head = new_head
 
     def __getitem__(self, key:int):
-        if key < self.head or key >= self.head + self.capacity:
+        if not 0 <= key - self.head < self.capacity:
             return None
 
-        index = key & self.capacity - 1
-        return self.items[index]
+        return self.items[key & self.mask]
 
     def __len__(self):
-        return self._capacity
+        return self.capacity
 
 class PrepareCertificate():
+    """Votes of a seqno in arrays indexed by replica
+
+    bit i of prepare_mask/commit_mask is set when replica i voted,
+    counters are updated by each vote so quorum checks are O(1).
+    certificates are preallocated by the log and recycled by init.
+    last_pre_prepare, last_prepared and executed survive view changes,
+    see init_view.
+    """
+    __slots__ = ('plog', 'seqno', 'pre_prepare',
+                 'prepares', 'prepare_mask', 'prepare_count',
+                 'matching_prepares',
+                 'commits', 'commit_mask', 'commit_count',
+                 'last_pre_prepare', 'last_prepared', 'executed')
+
     def __init__(self, plog):
         self.plog = plog
-        self.prepares = collections.OrderedDict() # replica index -> prepare
+        n = plog.replica.n
+        self.prepares = [None] * n # replica index -> prepare
+        self.prepare_mask = 0
         self.prepare_count = dict() # pre_prepare digest -> count of prepare
-        self.commits = collections.OrderedDict()  # replica index -> commit
+        # prepares matching the digest of pre_prepare
+        self.matching_prepares = 0
+        self.commits = [None] * n  # replica index -> commit
+        self.commit_mask = 0
+        self.commit_count = 0
+        self.pre_prepare = None
+        # latest pre_prepare and latest prepared one, of any view
+        self.last_pre_prepare = None
+        self.last_prepared = None
+        # requests of the seqno executed by us, duplicates are not
+        self.executed = []
 
     def init(self, seqno:Seqno):
         self.seqno = seqno
+        self.last_pre_prepare = None
+        self.last_prepared = None
+        self.executed = []
+        self.init_view()
 
+    def init_view(self):
+        """Drop the pre_prepare and votes of the last view"""
         if self.pre_prepare and self.pre_prepare.requests:
-            for r in pre_prepare.requests:
-                del self.plog.requests[(request.sender_type,
-                                       request.sender,
-                                       request.reqid)]
+            for r in self.pre_prepare.requests:
+                self.plog.requests.pop((r.sender_type,
+                                        r.sender,
+                                        r.reqid), None)
 
         self.pre_prepare = None
-        self.prepares.clear()
-        self.prepare_count.clear()
-        self.commits.clear()
-        
+        if self.prepare_mask:
+            self.prepares[:] = self.plog.no_votes
+            self.prepare_mask = 0
+            self.prepare_count.clear()
+        self.matching_prepares = 0
+        if self.commit_mask:
+            self.commits[:] = self.plog.no_votes
+            self.commit_mask = 0
+            self.commit_count = 0
+
     @property
     def my_prepare(self):
         return self.prepares[self.plog.replica.index]
@@ -60,14 +100,23 @@ class PrepareCertificate():
     def my_commit(self):
         return self.commits[self.plog.replica.index]
 
+    def has_prepare(self, index:int) -> bool:
+        return bool(self.prepare_mask >> index & 1)
+
+    def has_commit(self, index:int) -> bool:
+        return bool(self.commit_mask >> index & 1)
+
     def add_pre_prepare(self, pre_prepare):
         for i, r in enumerate(pre_prepare.requests):
             r.seqno = self.seqno
             r.in_pre_prepare_index = i
-            assert not self.plog.requests[(r.sender_type, r.sender, r.reqid)]
+            assert not self.plog.requests.get((r.sender_type, r.sender, r.reqid))
             self.plog.requests[(r.sender_type, r.sender, r.reqid)] = r
 
         self.pre_prepare = pre_prepare
+        self.last_pre_prepare = pre_prepare
+        self.matching_prepares = self.prepare_count.get(
+            pre_prepare.consensus_digest, 0)
 
     @property
     def is_pre_prepared(self):
@@ -79,40 +128,42 @@ class PrepareCertificate():
         return False
 
     def add_prepare(self, prepare):
-        if not self.prepares.get(prepare.sender):
-            self.prepares[prepeare.sender] = prepare
-            count = self.prepare_count.get(prepare.consensus_digest, 0)
-            self.prepare_count[prepare.consensus_digest] = count + 1
-            return True
-
-        return False
+        bit = 1 << prepare.sender
+        if self.prepare_mask & bit:
+            return False
+
+        self.prepare_mask |= bit
+        self.prepares[prepare.sender] = prepare
+        digest = prepare.consensus_digest
+        self.prepare_count[digest] = self.prepare_count.get(digest, 0) + 1
+        if self.pre_prepare and digest == self.pre_prepare.consensus_digest:
+            self.matching_prepares += 1
+        return True
 
     @property
     def is_prepared(self):
-        if self.is_pre_prepared:
-            c = self.prepare_count.get(pre_prepare.consensus_digest, 0)
-            return c >= 2 * self.plog.replica.f
-
-        return False
+        return (self.matching_prepares >= 2 * self.plog.replica.f
+                and self.is_pre_prepared)
 
     def add_commit(self, commit):
-        if not self.commits.get(commit.sender):
-            self.commits[commit.sender] = commit
-            return True
+        bit = 1 << commit.sender
+        if self.commit_mask & bit:
+            return False
 
-        return False
+        self.commit_mask |= bit
+        self.commits[commit.sender] = commit
+        self.commit_count += 1
+        return True
 
     @property
     def is_committed(self):
-        if self.is_prepared:
-            # include mine
-            return len(self.commits) > self.plog.replica.f * 2
+        # include mine
+        return (self.commit_count > self.plog.replica.f * 2
+                and self.is_prepared)
 
-        return False
-                
 class PrepareCertificateLog(BaseLog):
     def __init__(self, replica, capacity, head):
-        super().__init__(self, capacity,  head)
+        super().__init__(capacity,  head)
 
         self.replica = replica
 
@@ -120,17 +171,13 @@ class PrepareCertificateLog(BaseLog):
         # (sender_type, sender_index, reqid) => request
         self.requests = dict()
 
-        # init with proper seqno
-        head_index = head & capacity - 1
-        for i in range(head_index):
-            pcert = PrepareCertificate(self)
-            pcert.init(head + capacity - head_index + i)
-            self.items.append(pcert)
-
-        for i in range(self.capacity - head_index):
-            pcert = PrepareCertificate(self)
-            pcert.init(head + i)
-            self.items.append(pcert)
+        # copied into vote arrays of recycled certificates
+        self.no_votes = (None,) * replica.n
+
+        # init with proper seqno, item of seqno is at seqno & mask
+        self.items = [PrepareCertificate(self) for _ in range(capacity)]
+        for seqno in range(head, head + capacity):
+            self.items[seqno & self.mask].init(Seqno(seqno))
 
     def get_request(self, request):
         return self.requests.get((request.sender_type,
@@ -4,3 +4,13 @@ from .new_key import NewKey
 from .request import Request
 from .reply import Reply
 from .pre_prepare import PrePrepare
+from .prepare import Prepare
+from .commit import Commit
+from .checkpoint import Checkpoint
+from .fetch import Fetch
+from .meta_data import MetaData
+from .meta_data_d import MetaDataD
+from .data import Data
+from .view_change import ViewChange
+from .view_change_ack import ViewChangeAck
+from .new_view import NewView
@@ -1,8 +1,11 @@
 from enum import IntEnum
+import hmac
 import re
 
+import rlp
 from rlp.sedes import CountableList, raw
 
+from ..basic import Configuration as conf
 from .message_tag import MessageTag
 
 class BaseMessage():
@@ -14,8 +17,26 @@ class BaseMessage():
     """
     prefix = b'\x55\x01'
 
+    """Versions of payload codec
+
+    :1 rlp, payload is bytes
+    :2 struct, payload is a memoryview of the frame, see struct_codec
+    """
+    rlp_version = 1
+    struct_version = 2
+    versions = (rlp_version, struct_version)
+
     authenticators_sedes = CountableList(raw)
 
+    # key of the sender principal checking our entry in authenticators,
+    # see Node.gen_authenticators and Client.gen_authenticators
+    hmac_key = 'in'
+
+    # messages are kept by thousands in the plog window, no __dict__,
+    # subclasses declare slots of their own fields
+    __slots__ = ('verified', 'version', 'sender',
+                 'content', 'auth', 'payload', 'from_addr')
+
     def __init__(self):
         """Initialization, BaseMessage shall NOT on wire
 
@@ -23,16 +44,20 @@ class BaseMessage():
         """
         self.verified = False
 
-    @property:
+        # codec of payload, overridden when parsed from a frame
+        self.version = conf.wire_version
+
+    @property
     def raw_auth(self):
+        """auth encoded for rlp payload"""
         if not self.auth:
             auth = b''
         elif self.use_signature:
-            auth = self.auth
+            auth = bytes(self.auth)
         else:
-            assert type(message.auth) is list
-            auth = rlp.encode(message.auth,
-                              cls.authenticators_sedes)
+            # authenticators may be slices of a struct frame
+            auth = rlp.encode([bytes(a) for a in self.auth],
+                              self.authenticators_sedes)
 
         return auth
 
@@ -44,21 +69,40 @@ class BaseMessage():
 
         return self.auth
 
+    def authenticator(self, node):
+        """The hmac in auth for node, None if auth is not hmac based"""
+        if self.use_signature or not self.auth:
+            return None
+        if len(node.replica_principals) != len(self.auth):
+            return None
+
+        return self.auth[node.index]
+
     def verify(self, node, peer_principal):
         pp = peer_principal
+        cache = node.verify_cache
 
         if self.verified:
-            pass
-        elif self.use_signature:
+            return True
+
+        if cache is not None and self.auth and cache.lookup(self, pp):
+            self.verified = True
+            return True
+
+        if self.use_signature:
             self.verified = pp.verify(self.content_digest, self.auth)
         else:
-            if len(node.replica_principals) != len(self.auth):
+            entry = self.authenticator(node)
+            if entry is None:
                 self.verified = False
             else:
                 assert pp.index == self.sender
-                self.verified = (pp.gen_hmac('in', self.content_digest)
-                        == self.auth[node.sender]))
-        
+                self.verified = hmac.compare_digest(
+                    pp.gen_hmac(self.hmac_key, self.content_digest), entry)
+
+        if self.verified and cache is not None:
+            cache.add(self, pp)
+
         return self.verified
 
     @property
@@ -66,16 +110,15 @@ class BaseMessage():
         return MessageTag[type(self).__name__]
 
     @property
-    def sender_type:
+    def sender_type(self):
         if hasattr(self, 'extra'):
-            return 'Replica' if (self.extra >> 4) & 1) else 'Client'
+            return 'Client' if (self.extra >> 4) & 1 else 'Replica'
         else:
             return 'Replica'
 
     @property
     def frame_head(self):
-        return (self.prefix
-                + self.tag.to_bytes(1, byteorder='big'))
+        return bytes((self.prefix[0], self.version, self.tag))
 
     @property
     def frame(self):
@@ -101,16 +144,21 @@ class BaseMessage():
         further parse is needed
         
         :data should begin with prefix + MessageTag + infix
+        :return (tag, version, payload)
         """
-        if cls.prefix != frame[:2]
+        if frame[0] != cls.prefix[0] or frame[1] not in cls.versions:
             raise ValueError('illegal frame head')
-        
+
+        version = frame[1]
         tag = MessageTag(frame[2])
-        payload = frame[3:]
+        if version == cls.struct_version:
+            payload = memoryview(frame)[3:] # decoded without copy
+        else:
+            payload = frame[3:]
 
         if not min(MessageTag) < tag <= max(MessageTag):
             raise ValueError('illegal frame tag')
         elif not payload:
             raise ValueError('illegal frame payload')
 
-        return tag, payload
+        return tag, version, payload
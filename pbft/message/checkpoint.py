@@ -1,5 +1,115 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
 from .base_message import BaseMessage
+from .struct_codec import pack_auth, unpack_auth, check_end
 
 class Checkpoint(BaseMessage):
-    pass
+    """Digest of the state after executing seqno
+
+    quorum matching checkpoints of a seqno make it stable.
+    """
+
+    content_sedes = List([
+        big_endian_int, # seqno
+        big_endian_int, # sender
+        raw, # digest of state
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # seqno, sender, then 32 bytes of digest
+    content_struct = struct.Struct('!QI')
+
+    # checkpoints are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('seqno', 'digest')
+
+    def __init__(self, seqno, sender, digest):
+        super().__init__()
+
+        self.seqno = seqno
+        self.sender = sender
+        self.digest = digest
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.seqno).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update(self.digest)
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(self.seqno, self.sender)
+                            + self.digest)
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.seqno, self.sender,
+                                   bytes(self.digest)],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_replica(cls, replica, seqno, digest):
+        message = cls(seqno, replica.index, digest)
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [seqno, sender, digest] = rlp.decode(content, cls.content_sedes)
+
+            message = cls(seqno, sender, digest)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [seqno, sender] = cls.content_struct.unpack_from(payload, 0)
+            offset = cls.content_struct.size + 32
+            check_end(payload, offset)
+
+            message = cls(seqno, sender,
+                          payload[cls.content_struct.size:offset])
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
 
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
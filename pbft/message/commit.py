@@ -1,4 +1,5 @@
 import hashlib
+import struct
 
 import rlp
 from rlp.sedes import List, CountableList, big_endian_int, raw
@@ -6,8 +7,9 @@ from rlp.sedes import List, CountableList, big_endian_int, raw
 from ..basic import Configuration as conf
 from .base_message import BaseMessage
 from .request import Request
+from .struct_codec import pack_auth, unpack_auth
 
-class Commit():
+class Commit(BaseMessage):
 
     content_sedes = List([
         big_endian_int, # view
@@ -17,10 +19,20 @@ class Commit():
 
     payload_sedes = List([
         raw, # content
-        raw, # auth(signature)
+        raw, # auth(authenticators)
     ])
 
-    def __init__(self, view, seqno, extra, sender):
+    # view, seqno, sender
+    content_struct = struct.Struct('!QQI')
+
+    # commits are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('view', 'seqno')
+
+    def __init__(self, view, seqno, sender):
+        super().__init__()
+
         self.view  = view
         self.seqno = seqno
         self.sender = sender
@@ -29,9 +41,37 @@ class Commit():
         self.auth = None
         self.payload = None
 
+        self.from_addr = None
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.view).encode())
+        d.update('{}'.format(self.seqno).encode())
+        d.update('{}'.format(self.sender).encode())
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = self.content_struct.pack(self.view, self.seqno,
+                                                    self.sender)
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.view, self.seqno, self.sender],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
     @classmethod
     def from_replica(cls, replica, view, seqno):
-        return cls(view, seqno, replica.index)
+        message = cls(view, seqno, replica.index)
+        message.gen_payload(replica)
+
+        return message
 
     @classmethod
     def from_payload(cls, payload, addr, _node):
@@ -41,9 +81,30 @@ class Commit():
 
             message = cls(view, seqno, sender)
             message.content = content
-            message.auth = auth
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
             message.payload = payload
+            message.from_addr = addr
 
             return message
         except rlp.DecodingError as exc:
             raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, seqno, sender] = cls.content_struct.unpack_from(payload, 0)
+            offset = cls.content_struct.size
+
+            message = cls(view, seqno, sender)
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
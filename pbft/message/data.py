@@ -0,0 +1,100 @@
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_bytes, unpack_bytes
+
+class Data(BaseMessage):
+    """Page of leaf index at a checkpoint
+
+    not authenticated, the fetcher checks the page against the digest
+    of the leaf it already trusts. a page never written is sent empty.
+    """
+
+    content_sedes = List([
+        big_endian_int, # checkpoint
+        big_endian_int, # index
+        big_endian_int, # last_mod_checkpoint
+        big_endian_int, # sender
+        raw, # block
+    ])
+
+    # checkpoint, index, last_mod_checkpoint, sender,
+    # then block with a length prefix
+    content_struct = struct.Struct('!QQQI')
+
+    use_signature = False
+
+    __slots__ = ('checkpoint', 'index', 'last_mod', 'block')
+
+    def __init__(self, checkpoint, index, last_mod, sender, block):
+        super().__init__()
+
+        self.checkpoint = checkpoint
+        self.index = index
+        self.last_mod = last_mod
+        self.sender = sender
+        self.block = block
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.checkpoint, self.index, self.last_mod, self.sender)
+                            + pack_bytes(self.block))
+        else:
+            self.content = rlp.encode([self.checkpoint, self.index,
+                                       self.last_mod, self.sender,
+                                       bytes(self.block)],
+                                      self.content_sedes)
+
+        self.payload = self.content
+
+    @classmethod
+    def from_replica(cls, replica, checkpoint, index, last_mod, block):
+        message = cls(checkpoint, index, last_mod, replica.index, block)
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [checkpoint, index, last_mod, sender, block] = rlp.decode(
+                payload, cls.content_sedes)
+
+            message = cls(checkpoint, index, last_mod, sender, block)
+            message.content = payload
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [checkpoint, index, last_mod, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            block, offset = unpack_bytes(payload, cls.content_struct.size)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+
+            message = cls(checkpoint, index, last_mod, sender, block)
+            message.version = cls.struct_version
+            message.content = payload
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
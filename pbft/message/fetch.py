@@ -0,0 +1,122 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_auth, unpack_auth
+
+class Fetch(BaseMessage):
+    """Ask a replica for partition (level, index) at a checkpoint
+
+    interior partitions are answered by MetaData, leaves by Data,
+    the latest checkpoint (latest) by MetaDataD of the partition.
+    """
+
+    content_sedes = List([
+        big_endian_int, # level
+        big_endian_int, # index
+        big_endian_int, # checkpoint
+        big_endian_int, # sender
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # level, index, checkpoint, sender
+    content_struct = struct.Struct('!BQQI')
+
+    """Checkpoint of a fetch for the latest one of the replier"""
+    latest = 2 ** 64 - 1
+
+    # fetches are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('level', 'index', 'checkpoint')
+
+    def __init__(self, level, index, checkpoint, sender):
+        super().__init__()
+
+        self.level = level
+        self.index = index
+        self.checkpoint = checkpoint
+        self.sender = sender
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.level).encode())
+        d.update('{}'.format(self.index).encode())
+        d.update('{}'.format(self.checkpoint).encode())
+        d.update('{}'.format(self.sender).encode())
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = self.content_struct.pack(
+                self.level, self.index, self.checkpoint, self.sender)
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.level, self.index,
+                                   self.checkpoint, self.sender],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_replica(cls, replica, level, index, checkpoint):
+        message = cls(level, index, checkpoint, replica.index)
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [level, index, checkpoint, sender] = rlp.decode(
+                content, cls.content_sedes)
+
+            message = cls(level, index, checkpoint, sender)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [level, index, checkpoint, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            offset = cls.content_struct.size
+
+            message = cls(level, index, checkpoint, sender)
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -0,0 +1,125 @@
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_bytes, unpack_bytes
+
+class MetaData(BaseMessage):
+    """Children of interior partition (level, index) at a checkpoint
+
+    not authenticated, the fetcher checks the children against the
+    digest of the partition it already trusts.
+    """
+
+    content_sedes = List([
+        big_endian_int, # checkpoint
+        big_endian_int, # level
+        big_endian_int, # index
+        big_endian_int, # sender
+        raw, # children, see child_struct
+    ])
+
+    # checkpoint, level, index, sender, then children with a length prefix
+    content_struct = struct.Struct('!QBQI')
+
+    # last_mod_checkpoint, then 32 bytes of digest, of each child
+    child_struct = struct.Struct('!Q')
+    child_size = child_struct.size + 32
+
+    use_signature = False
+
+    __slots__ = ('checkpoint', 'level', 'index', 'children')
+
+    def __init__(self, checkpoint, level, index, sender, children:bytes):
+        super().__init__()
+
+        self.checkpoint = checkpoint
+        self.level = level
+        self.index = index
+        self.sender = sender
+        self.children = children
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @classmethod
+    def pack_children(cls, children) -> bytes:
+        """[(last_mod_checkpoint, digest)] to bytes"""
+        return b''.join(cls.child_struct.pack(last_mod) + digest
+                        for last_mod, digest in children)
+
+    def unpack_children(self) -> list:
+        """[(last_mod_checkpoint, digest)] of children in order"""
+        if len(self.children) % self.child_size:
+            raise ValueError('illegal children')
+
+        children = []
+        for offset in range(0, len(self.children), self.child_size):
+            (last_mod,) = self.child_struct.unpack_from(self.children,
+                                                        offset)
+            start = offset + self.child_struct.size
+            children.append((last_mod,
+                             bytes(self.children[start:start + 32])))
+        return children
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.checkpoint, self.level, self.index, self.sender)
+                            + pack_bytes(self.children))
+        else:
+            self.content = rlp.encode([self.checkpoint, self.level,
+                                       self.index, self.sender,
+                                       bytes(self.children)],
+                                      self.content_sedes)
+
+        self.payload = self.content
+
+    @classmethod
+    def from_replica(cls, replica, checkpoint, level, index, children):
+        message = cls(checkpoint, level, index, replica.index,
+                      cls.pack_children(children))
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [checkpoint, level, index, sender, children] = rlp.decode(
+                payload, cls.content_sedes)
+
+            message = cls(checkpoint, level, index, sender, children)
+            message.content = payload
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [checkpoint, level, index, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            children, offset = unpack_bytes(payload,
+                                            cls.content_struct.size)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+
+            message = cls(checkpoint, level, index, sender, children)
+            message.version = cls.struct_version
+            message.content = payload
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -0,0 +1,134 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_auth, unpack_auth, check_end
+
+class MetaDataD(BaseMessage):
+    """Digest of partition (level, index) at the latest checkpoint
+
+    answers a Fetch for Fetch.latest, f + 1 matching ones from different
+    replicas make the checkpoint a target of state transfer.
+    """
+
+    content_sedes = List([
+        big_endian_int, # checkpoint
+        big_endian_int, # level
+        big_endian_int, # index
+        big_endian_int, # last_mod_checkpoint
+        big_endian_int, # sender
+        raw, # digest of partition
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # checkpoint, level, index, last_mod_checkpoint, sender,
+    # then 32 bytes of digest
+    content_struct = struct.Struct('!QBQQI')
+
+    # votes are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('checkpoint', 'level', 'index', 'last_mod', 'digest')
+
+    def __init__(self, checkpoint, level, index, last_mod,
+                 sender, digest):
+        super().__init__()
+
+        self.checkpoint = checkpoint
+        self.level = level
+        self.index = index
+        self.last_mod = last_mod
+        self.sender = sender
+        self.digest = digest
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.checkpoint).encode())
+        d.update('{}'.format(self.level).encode())
+        d.update('{}'.format(self.index).encode())
+        d.update('{}'.format(self.last_mod).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update(self.digest)
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.checkpoint, self.level, self.index,
+                self.last_mod, self.sender) + self.digest)
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.checkpoint, self.level, self.index,
+                                   self.last_mod, self.sender,
+                                   bytes(self.digest)],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_replica(cls, replica, checkpoint, level, index,
+                     last_mod, digest):
+        message = cls(checkpoint, level, index, last_mod,
+                      replica.index, digest)
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [checkpoint, level, index, last_mod, sender, digest] = (
+                rlp.decode(content, cls.content_sedes))
+
+            message = cls(checkpoint, level, index, last_mod,
+                          sender, digest)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [checkpoint, level, index, last_mod, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            offset = cls.content_struct.size + 32
+            check_end(payload, offset)
+
+            message = cls(checkpoint, level, index, last_mod, sender,
+                          payload[cls.content_struct.size:offset])
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
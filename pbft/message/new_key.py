@@ -21,6 +21,11 @@ class NewKey(BaseMessage):
         raw, # auth(signature)
     ])
 
+    # new keys are always signed
+    use_signature = True
+
+    __slots__ = ('reqid', 'extra', 'hmac_keys', 'outkey', 'inkeys')
+
     def __init__(self,
                  sender:int, reqid:Reqid,
                  extra, hmac_keys):
@@ -28,6 +33,9 @@ class NewKey(BaseMessage):
         """
         super().__init__()
 
+        # new keys are rare, always encoded by rlp
+        self.version = self.rlp_version
+
         self.sender = sender
         self.reqid = reqid
         self.extra = extra
@@ -39,8 +47,16 @@ class NewKey(BaseMessage):
 
         self.from_addr = None
 
-    def verify(self, peer_principal):
-        return peer_principal.verify(self.content_digest, self.auth)
+        # hmac key for the receiver, when decrypted by the crypto service
+        self.outkey = None
+        # keys of the sender in hmac_keys, until it takes them into use
+        self.inkeys = None
+
+    def verify(self, node, peer_principal):
+        if not self.verified:
+            self.verified = peer_principal.verify(self.content_digest,
+                                                  self.auth)
+        return self.verified
 
     def __str__(self):
         return '{}:{}\n{}\n{}\n{}'.format(self.sender, self.reqid,
@@ -57,32 +73,53 @@ class NewKey(BaseMessage):
             d.update(k)
         return d.digest()
 
+    def set_signature(self, signature:bytes):
+        self.auth = signature
+        self.payload = rlp.encode([self.content, self.auth],
+                                  self.payload_sedes)
+
     @classmethod
-    def from_node(cls, node):
+    def from_node(cls, node, sign:bool = True):
+        """New session keys of node
 
+        :sign: sign it here, otherwise the caller shall set_signature
+
+        the keys of node are unchanged, see use_inkeys.
+        """
+
+        inkeys = []
         hmac_keys = []
         for p in node.replica_principals:
             if p is node.principal:
                 nonce = p.zero_hmac_nounce
             else:
-                nonce = p.gen_inkey()
+                nonce = secrets.token_bytes(p.hmac_nounce_length)
 
+            inkeys.append(nonce)
             hmac_keys.append(p.encrypt(nonce))
 
         extra = 0
-        if node.type is 'Client':
+        if node.type == 'Client':
             extra |= 1 << 4
 
-        message = cls(node.sender, node.next_reqid(), extra, hmac_keys)
+        message = cls(node.index, node.next_reqid(), extra, hmac_keys)
         message.content = rlp.encode([message.sender, message.reqid,
                                        message.extra, message.hmac_keys],
                                       cls.content_sedes)
 
-        message.auth = node.principal.sign(message.content_digest)
-        message.payload = rlp.encode([message.content, message.auth],
-                                      cls.payload_sedes)
+        message.inkeys = inkeys
+
+        if sign:
+            message.set_signature(node.principal.sign(message.content_digest))
         return message
 
+    def use_inkeys(self, node):
+        """Replace the inkeys of node with the keys sent in this new_key"""
+        for p, key in zip(node.replica_principals, self.inkeys):
+            if p is not node.principal:
+                p.inkey = key
+        self.inkeys = None
+
     @classmethod
     def from_payload(cls, payload, addr, _node):
         try:
@@ -0,0 +1,169 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_bytes, unpack_bytes, pack_auth, unpack_auth
+
+class NewView(BaseMessage):
+    """Start view, sent by its primary
+
+    names the view changes it was computed from by their digests,
+    checkpoint is the stable checkpoint the view starts from, chosen
+    is the consensus digest of each seqno after it, which is re-issued
+    as a pre_prepare of view. every replica checks chosen against the
+    view changes it received itself.
+    """
+
+    content_sedes = List([
+        big_endian_int, # view
+        big_endian_int, # sender
+        big_endian_int, # checkpoint
+        raw, # view changes, see view_change_struct
+        raw, # chosen, see chosen_struct
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # view, sender, checkpoint, then view changes and chosen
+    # with length prefixes
+    content_struct = struct.Struct('!QIQ')
+
+    # replica, then 32 bytes of view change digest, of each view change
+    view_change_struct = struct.Struct('!I')
+    # seqno, then 32 bytes of consensus digest, of each chosen
+    chosen_struct = struct.Struct('!Q')
+
+    # new views are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('view', 'checkpoint', 'view_changes', 'chosen')
+
+    def __init__(self, view, sender, checkpoint,
+                 view_changes:bytes, chosen:bytes):
+        super().__init__()
+
+        self.view = view
+        self.sender = sender
+        self.checkpoint = checkpoint
+        self.view_changes = view_changes
+        self.chosen = chosen
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @staticmethod
+    def pack_pairs(fixed, pairs) -> bytes:
+        return b''.join(fixed.pack(k) + digest for k, digest in pairs)
+
+    @staticmethod
+    def unpack_pairs(fixed, buf) -> list:
+        size = fixed.size + 32
+        if len(buf) % size:
+            raise ValueError('illegal entries')
+
+        pairs = []
+        for offset in range(0, len(buf), size):
+            (k,) = fixed.unpack_from(buf, offset)
+            start = offset + fixed.size
+            pairs.append((k, bytes(buf[start:start + 32])))
+        return pairs
+
+    def unpack_view_changes(self) -> list:
+        """[(replica, view change digest)]"""
+        return self.unpack_pairs(self.view_change_struct, self.view_changes)
+
+    def unpack_chosen(self) -> list:
+        """[(seqno, consensus digest)] in order of seqno"""
+        return self.unpack_pairs(self.chosen_struct, self.chosen)
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.view).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update('{}'.format(self.checkpoint).encode())
+        d.update(hashlib.sha256(self.view_changes).digest())
+        d.update(hashlib.sha256(self.chosen).digest())
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.view, self.sender, self.checkpoint)
+                            + pack_bytes(self.view_changes)
+                            + pack_bytes(self.chosen))
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.view, self.sender, self.checkpoint,
+                                   bytes(self.view_changes),
+                                   bytes(self.chosen)],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_primary(cls, primary, view, checkpoint, view_changes, chosen):
+        """
+        :view_changes: [(replica, view change digest)]
+        :chosen: [(seqno, consensus digest)]
+        """
+        message = cls(view, primary.index, checkpoint,
+                      cls.pack_pairs(cls.view_change_struct, view_changes),
+                      cls.pack_pairs(cls.chosen_struct, chosen))
+        message.gen_payload(primary)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [view, sender, checkpoint, view_changes, chosen] = (
+                rlp.decode(content, cls.content_sedes))
+
+            message = cls(view, sender, checkpoint, view_changes, chosen)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, sender, checkpoint] = (
+                cls.content_struct.unpack_from(payload, 0))
+            view_changes, offset = unpack_bytes(payload,
+                                                cls.content_struct.size)
+            chosen, offset = unpack_bytes(payload, offset)
+
+            message = cls(view, sender, checkpoint,
+                          bytes(view_changes), bytes(chosen))
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -1,4 +1,5 @@
 import hashlib
+import struct
 
 import rlp
 from rlp.sedes import List, CountableList, big_endian_int, raw
@@ -6,6 +7,7 @@ from rlp.sedes import List, CountableList, big_endian_int, raw
 from ..basic import Configuration as conf
 from .base_message import BaseMessage
 from .request import Request
+from .struct_codec import pack_bytes, unpack_bytes, pack_auth, unpack_auth
 
 class PrePrepare(BaseMessage):
 
@@ -23,6 +25,13 @@ class PrePrepare(BaseMessage):
         raw, # auth(signature)
     ])
 
+    # view, seqno, extra, count of requests, then requests
+    # and non_det_choices, each with a length prefix, and auth
+    content_struct = struct.Struct('!QQHH')
+
+    __slots__ = ('view', 'seqno', 'extra', 'requests', 'non_det_choices',
+                 '_consensus_digest', '_content_digest', 'mine')
+
     def __init__(self, view, seqno, extra,
                  requests, non_det_choices):
         super().__init__()
@@ -37,6 +46,14 @@ class PrePrepare(BaseMessage):
         self.auth = None
         self.payload = None
 
+        # digests are computed once, see clear_digests
+        self._consensus_digest = None
+        self._content_digest = None
+
+        self.sender = None # primary of the view
+        self.mine = False # sent by this replica
+        self.from_addr = None
+
     @property
     def use_signature(self):
         return True if self.extra & 2 else False
@@ -47,21 +64,37 @@ class PrePrepare(BaseMessage):
             self.extra |= 2
         else:
             self.extra &= ~2
+        self.clear_digests()
+
+    def clear_digests(self):
+        """Forget cached consensus and content digests
+
+        should be called whenever a field or a request is changed
+        """
+        self._consensus_digest = None
+        self._content_digest = None
 
     @property
     def consensus_digest(self):
         """Used to make sure that primary did NOT tamper the requests
         including all request.consensus_digest and non_det_choices
         """
+        if self._consensus_digest is not None:
+            return self._consensus_digest
+
         d = hashlib.sha256()
         for r in self.requests:
             d.update(r.consensus_digest)
         d.update(self.non_det_choices)
+        self._consensus_digest = d.digest()
 
-        return d.digest()
+        return self._consensus_digest
 
     @property
     def content_digest(self):
+        if self._content_digest is not None:
+            return self._content_digest
+
         d = hashlib.sha256()
         d.update('{}'.format(self.view).encode())
         d.update('{}'.format(self.seqno).encode())
@@ -69,10 +102,11 @@ class PrePrepare(BaseMessage):
         for r in self.requests:
             d.update(r.content_digest)
         d.update(self.non_det_choices)
-        return d.digest()
+        self._content_digest = d.digest()
+        return self._content_digest
 
     @property
-    def is_requests_verified(self, node):
+    def is_requests_verified(self):
         count = 0
         for r in self.requests:
             if r.verified:
@@ -80,18 +114,47 @@ class PrePrepare(BaseMessage):
         return count == len(self.requests)
 
     def gen_payload(self, primary):
+        # requests may have been changed since last time
+        self.clear_digests()
+
+        for r in self.requests:
+            if r.version != self.version:
+                # requests are encoded as the pre_prepare
+                r.version = self.version
+                r.gen_payload()
+
         raw_requests = [r.payload_in_pre_prepare for r in self.requests]
+
+        if self.version == self.struct_version:
+            self.content = b''.join(
+                [self.content_struct.pack(self.view, self.seqno,
+                                          self.extra, len(raw_requests))]
+                + [pack_bytes(r) for r in raw_requests]
+                + [pack_bytes(self.non_det_choices)])
+            self.authenticate(primary)
+            self.payload = self.content + pack_auth(self.auth,
+                                                    self.use_signature)
+            return
+
         self.content = rlp.encode([self.view, self.seqno,
                                    self.extra, raw_requests,
-                                   self.non_det_choices],
-                                  cls.content_sedes)
+                                   bytes(self.non_det_choices)],
+                                  self.content_sedes)
 
         self.authenticate(primary)
-        self.payload = rlp.encode([self,content, self.raw_auth],
-                                  cls.payload_sedes)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
 
     @classmethod
-    def from_primary(cls, primary, use_signature:bool):
+    def from_primary(cls, primary, use_signature:bool,
+                     max_count:int = conf.request_in_pre_prepare,
+                     max_bytes:int = conf.pre_prepare_content_thresh):
+        """Batch pending requests of primary into a new pre_prepare
+
+        requests are taken round robin over principals, oldest first,
+        until max_count requests or max_bytes of raw requests is reached,
+        at least one request is taken regardless of max_bytes
+        """
         extra = 0
         if use_signature:
             extra |= 2
@@ -99,15 +162,29 @@ class PrePrepare(BaseMessage):
         non_det_choices = b'' # TODO: non deterministic choices
         message = cls(primary.view, primary.seqno, extra,
                       None, non_det_choices)
-
-        requests = [] # request payload
-        for rs in primary.rw_requests:
-            if rs and rs[-1].pre_prepare_candidate:
-                r = rs.pop(-1)
-                requests.append(r)
-
-            if len(requests) >= conf.request_in_pre_prepare:
-                break
+        message.sender = primary.index
+
+        requests = []
+        size = 0 # bytes of raw requests
+        rw_requests = primary.rw_requests
+        full = False
+        while rw_requests and not full:
+            # one request from each principal per round
+            for p in list(rw_requests):
+                rs = rw_requests[p]
+                length = len(rs[0].payload_in_pre_prepare)
+                if (len(requests) >= max_count
+                    or (requests and size + length > max_bytes)):
+                    full = True
+                    break
+
+                requests.append(rs.pop(0))
+                size += length
+
+                if rs:
+                    rw_requests.move_to_end(p)
+                else:
+                    del rw_requests[p]
 
         message.requests = requests
         message.gen_payload(primary)
@@ -121,11 +198,13 @@ class PrePrepare(BaseMessage):
             [view, seqno, extra, requests, non_det_choices] = rlp.decode(
                 content, cls.content_sedes)
 
-            for i, r in enumerate(requests):
-                requests[i] = Request.from_payload(r, addr, node)
+            requests = [Request.from_payload(r, addr, node)
+                        for r in requests]
             
             message = cls(view, seqno, extra, requests, non_det_choices)
+            message.sender = view % node.n
 
+            message.version = cls.rlp_version
             message.content = content
             if message.use_signature:
                 message.auth = auth
@@ -137,3 +216,32 @@ class PrePrepare(BaseMessage):
             return message
         except rlp.DecodingError as exc:
             raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, node):
+        try:
+            [view, seqno, extra, count] = (
+                cls.content_struct.unpack_from(payload, 0))
+            offset = cls.content_struct.size
+
+            requests = []
+            for _ in range(count):
+                r, offset = unpack_bytes(payload, offset)
+                requests.append(Request.from_struct_payload(r, addr, node))
+            non_det_choices, offset = unpack_bytes(payload, offset)
+
+            message = cls(view, seqno, extra, requests, non_det_choices)
+            message.sender = view % node.n
+
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset,
+                                               message.use_signature)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -1,4 +1,5 @@
 import hashlib
+import struct
 
 import rlp
 from rlp.sedes import List, CountableList, big_endian_int, raw
@@ -6,8 +7,9 @@ from rlp.sedes import List, CountableList, big_endian_int, raw
 from ..basic import Configuration as conf
 from .base_message import BaseMessage
 from .request import Request
+from .struct_codec import pack_auth, unpack_auth, check_end
 
-class Prepare():
+class Prepare(BaseMessage):
 
     content_sedes = List([
         big_endian_int, # view
@@ -22,8 +24,15 @@ class Prepare():
         raw, # auth(signature)
     ])
 
+    # view, seqno, extra, sender, then 32 bytes of consensus_digest
+    content_struct = struct.Struct('!QQHI')
+
+    __slots__ = ('view', 'seqno', 'extra', 'consensus_digest')
+
     def __init__(self, view, seqno, extra,
                  sender, consensus_digest):
+        super().__init__()
+
         self.view  = view
         self.seqno = seqno
         self.extra = extra
@@ -34,6 +43,8 @@ class Prepare():
         self.auth = None
         self.payload = None
 
+        self.from_addr = None
+
     @property
     def use_signature(self):
         return True if self.extra & 2 else False
@@ -45,6 +56,35 @@ class Prepare():
         else:
             self.extra &= ~2
 
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.view).encode())
+        d.update('{}'.format(self.seqno).encode())
+        d.update('{}'.format(self.extra).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update(self.consensus_digest)
+        return d.digest()
+
+    def gen_payload(self, backup):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(self.view, self.seqno,
+                                                     self.extra, self.sender)
+                            + self.consensus_digest)
+            self.authenticate(backup)
+            self.payload = self.content + pack_auth(self.auth,
+                                                    self.use_signature)
+            return
+
+        self.content = rlp.encode([self.view, self.seqno, self.extra,
+                                   self.sender,
+                                   bytes(self.consensus_digest)],
+                                  self.content_sedes)
+
+        self.authenticate(backup)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
     @classmethod
     def from_backup(cls, backup, view, seqno,
                     use_signature:bool, consensus_digest):
@@ -53,8 +93,11 @@ class Prepare():
         if use_signature:
             extra |= 2
 
-        return cls(view, seqno, extra,
-                   backup.index, consensus_digest)
+        message = cls(view, seqno, extra,
+                      backup.index, consensus_digest)
+        message.gen_payload(backup)
+
+        return message
 
     @classmethod
     def from_payload(cls, payload, addr, _node):
@@ -65,9 +108,37 @@ class Prepare():
 
             message = cls(view, seqno, extra, sender, consensus_digest)
             message.content = content
-            message.auth = auth
+            if message.use_signature:
+                message.auth = auth
+            else:
+                message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
             message.payload = payload
+            message.from_addr = addr
 
             return message
         except rlp.DecodingError as exc:
             raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, seqno, extra, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            offset = cls.content_struct.size + 32
+            check_end(payload, offset)
+
+            message = cls(view, seqno, extra, sender,
+                          payload[cls.content_struct.size:offset])
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset,
+                                               message.use_signature)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -1,12 +1,14 @@
 import hashlib
 import hmac
+import struct
 
 import rlp
 from rlp.sedes import List, CountableList, big_endian_int, raw
 
-from . import BaseMessage
+from .base_message import BaseMessage
+from .struct_codec import hmac_length, pack_bytes, unpack_bytes, check_end
 
-from ..basic import View, Reqid
+from ..basic import View, Reqid, Configuration as conf
 
 class Reply(BaseMessage):
     content_sedes = List([
@@ -23,32 +25,58 @@ class Reply(BaseMessage):
         raw, # auth(hmac)
     ])
 
+    # view, reqid, extra, requestor, replier,
+    # then result with a length prefix and a hmac
+    content_struct = struct.Struct('!QQHII')
+
+    __slots__ = ('view', 'reqid', 'extra', 'requestor', 'result',
+                 # set by the replier, the result a digest reply is of
+                 'full_result')
+
     def __init__(self, view, reqid,  extra,
-                 sender, replier, result:bytes):
+                 requestor, sender, result:bytes):
         """
-        :sender index id of replica sending this message
-        :reqid reqid from the sender
-        :node_type  always be replica
+        :extra bit 1: 0 committed,          1 tentative
+               bit 2: 0 full result,        1 digest of the result
+               bit 5: 0 send from replica   1 send from client
+        :requestor index of the node sending the request
+        :sender index of replica sending this message
+        :reqid reqid from the requestor
+        :auth a single hmac for the requestor
         """
         super().__init__()
 
         self.view = view
         self.reqid = reqid
         self.extra = extra
-        self.sender = sender # sender of request
-        self.replier = replier
+        self.requestor = requestor
+        self.sender = sender
         self.result = result
-
-        self.requestor = None # principal
+        self.full_result = None
 
         self.content = None
         self.auth = None
         self.payload = None
 
+        self.from_addr = None
+
+    @property
+    def is_tentative(self):
+        """Result of a tentative execution, before the request commits"""
+        return bool(self.extra & 1)
+
+    @property
+    def is_digest(self):
+        """result is only reply_digest of the result"""
+        return bool(self.extra & 2)
+
     @property
     def reply_digest(self):
+        if self.is_digest:
+            return bytes(self.result)
+
         d = hashlib.sha256()
-        d.update(self.reply)
+        d.update(self.result)
         return d.digest()
 
     @property
@@ -57,19 +85,68 @@ class Reply(BaseMessage):
         d.update('{}'.format(self.view).encode())
         d.update('{}'.format(self.reqid).encode())
         d.update('{}'.format(self.extra).encode())
+        d.update('{}'.format(self.requestor).encode())
         d.update('{}'.format(self.sender).encode())
-        d.update('{}'.format(self.replier).encode())
-        d.update('{}'.format(self.reply_digest).encode())
+        d.update(self.reply_digest)
         return d.digest()
 
+    def gen_payload(self, requestor_principal):
+        """Authenticate for the requestor only"""
+        self.auth = requestor_principal.gen_hmac('out',
+                                                 self.content_digest)
+
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(self.view, self.reqid,
+                                                     self.extra,
+                                                     self.requestor,
+                                                     self.sender)
+                            + pack_bytes(self.result))
+            self.payload = self.content + self.auth
+            return
+
+        self.content = rlp.encode([self.view, self.reqid, self.extra,
+                                   self.requestor, self.sender,
+                                   bytes(self.result)],
+                                  self.content_sedes)
+        self.payload = rlp.encode([self.content, self.auth],
+                                  self.payload_sedes)
+
+    def authenticator(self, node):
+        return self.auth or None
+
+    def verify(self, node, peer_principal):
+        pp = peer_principal
+
+        if not self.verified:
+            assert pp.index == self.sender
+            self.verified = hmac.compare_digest(
+                pp.gen_hmac('in', self.content_digest), self.auth)
+
+        return self.verified
+
     @classmethod
-    def from_node(cls, node, request, reply):
+    def from_node(cls, node, request, result:bytes, tentative = False):
+        """Reply to request, with the digest of a large result
 
+        unless node is the full replier of request or all should reply
+        with the full result
+        """
         extra = 0
-        if node.type is 'Client':
+        if tentative:
+            extra |= 1
+        if node.type == 'Client':
             extra |= 1 << 4
 
-        Message = cls(node.index, request.reqid, extra, node.view, reply)
+        content = result
+        if (len(result) > conf.reply_digest_thresh
+            and not request.reply_with_full):
+            extra |= 2
+            content = hashlib.sha256(result).digest()
+
+        message = cls(node.view, request.reqid, extra,
+                      request.sender, node.index, content)
+        message.full_result = result
+        message.gen_payload(node.find_sender(request))
 
         return message
 
@@ -78,15 +155,36 @@ class Reply(BaseMessage):
         try:
             [content, auth] = rlp.decode(payload, cls.payload_sedes)
 
-            [sender, reqid, extra, view, reply_digest, reply] = (
+            [view, reqid, extra, requestor, sender, result] = (
                 rlp.decode(content, cls.content_sedes))
 
-            message = cls(sender, reqid, extra, view, reply)
-            if message.reply_digest != reply_digest:
-                raise ValueError('digest error')
-
+            message = cls(view, reqid, extra, requestor, sender, result)
+            message.version = cls.rlp_version
+            message.content = content
             message.auth = auth
+            message.payload = payload
+            message.from_addr = addr
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, reqid, extra, requestor, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            result, offset = unpack_bytes(payload, cls.content_struct.size)
+            end = offset + hmac_length
+            check_end(payload, end)
+            if end != len(payload):
+                raise ValueError('trailing bytes')
+
+            message = cls(view, reqid, extra, requestor, sender, result)
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth = payload[offset:end]
+            message.payload = payload
             message.from_addr = addr
             return message
-        except rlp.DecodingErr as exc:
+        except struct.error as exc:
             raise ValueError('decoding error: {}'.format(exc))
@@ -1,4 +1,5 @@
 import hashlib
+import struct
 
 import rlp
 from rlp.sedes import List, CountableList, big_endian_int, raw
@@ -6,6 +7,7 @@ from rlp.sedes import List, CountableList, big_endian_int, raw
 from ..basic import Reqid, Configuration as conf
 from .message_tag import MessageTag
 from .base_message import BaseMessage
+from .struct_codec import pack_bytes, unpack_bytes, pack_auth, unpack_auth
 
 class Request(BaseMessage):
 
@@ -23,6 +25,19 @@ class Request(BaseMessage):
              # maybe empty(b'') if content contains command_digest
     ])
 
+    # sender, reqid, extra, full_replier, flags,
+    # then command(or command_digest if flags & 1) and auth
+    content_struct = struct.Struct('!IQHIB')
+
+    # clients authenticate requests with the keys in their new_keys
+    hmac_key = 'out'
+
+    __slots__ = ('reqid', 'extra', 'full_replier', 'reply_with_full',
+                 'command', '_command_digest', '_consensus_digest',
+                 '_content_digest',
+                 # set by replicas, see recv_request and plog
+                 'arrival', 'seqno', 'in_pre_prepare_index', 'pre_prepare')
+
     def __init__(self, sender:int, reqid:Reqid, extra:int,
                  full_replier:int, command:bytes):
         """
@@ -41,10 +56,14 @@ class Request(BaseMessage):
         self.reqid = reqid
         self.extra = extra
         self.full_replier = full_replier
-        self.reply_will_full = False
+        self.reply_with_full = False
 
         self.command = command
+
+        # digests are computed once, see clear_digests
         self._command_digest = None
+        self._consensus_digest = None
+        self._content_digest = None
 
         self.content = None
         self.auth = None
@@ -52,6 +71,11 @@ class Request(BaseMessage):
 
         self.from_addr = None
 
+        self.arrival = None # loop time when a replica learned of it
+        self.seqno = None
+        self.in_pre_prepare_index = None
+        self.pre_prepare = None
+
     @property
     def readonly(self):
         return True if self.extra & 1 else False
@@ -62,6 +86,7 @@ class Request(BaseMessage):
             self.extra |= 1
         else:
             self.extra &= ~1
+        self.clear_digests()
 
     @property
     def use_signature(self):
@@ -73,6 +98,7 @@ class Request(BaseMessage):
             self.extra |= 2
         else:
             self.extra &= ~2
+        self.clear_digests()
 
     @property
     def reply_from_all(self):
@@ -84,42 +110,59 @@ class Request(BaseMessage):
             self.extra |= 1 << 5
         else:
             self.extra &= ~(1 << 5)
+        self.clear_digests()
+
+    def clear_digests(self):
+        """Forget cached consensus and content digests
+
+        should be called whenever sender, reqid, extra or full_replier
+        is changed, command_digest never changes with the command
+        """
+        self._consensus_digest = None
+        self._content_digest = None
 
     @property
     def command_digest(self):
         """compute digest for command"""
-        if self.command:
+        if self._command_digest is None and self.command:
             d = hashlib.sha256()
             # dx: i am going to use the data instead of hahs
             # so I am commenting them out.
             # d.update('{}'.format(self.sender).encode())    # useless
             # d.update('{}'.format(self.reqid).encode())     # useless
             d.update(self.command)                           # useful
-            return d.digest()
+            self._command_digest = d.digest()
 
         return self._command_digest
 
-    @property.setter
+    @command_digest.setter
     def command_digest(self, new_command_digest):
         if not self.command:
             self._command_digest = new_command_digest
 
     @property
     def consensus_digest(self):
+        if self._consensus_digest is not None:
+            return self._consensus_digest
+
         d = hashlib.sha256()
-        if self.sender_type is 'Client':
+        if self.sender_type == 'Client':
             d.update('{}'.format(1).encode())
         else:
             d.update('{}'.format(0).encode())
         d.update('{}'.format(self.sender).encode())
         d.update('{}'.format(self.reqid).encode())
         d.update(self.command_digest)
-        return d.digest()
+        self._consensus_digest = d.digest()
+        return self._consensus_digest
 
     @property
     def content_digest(self):
+        if self._content_digest is not None:
+            return self._content_digest
+
         d = hashlib.sha256()
-        if self.sender_type is 'Client':
+        if self.sender_type == 'Client':
             d.update('{}'.format(1).encode())
         else:
             d.update('{}'.format(0).encode())
@@ -128,15 +171,33 @@ class Request(BaseMessage):
         d.update('{}'.format(self.extra).encode())
         d.update('{}'.format(self.full_replier).encode())
         d.update(self.command_digest) # includes command and len(command)
-        return d.digest()
+        self._content_digest = d.digest()
+        return self._content_digest
+
+    def gen_payload(self, node = None):
+        """Encode content and payload
+
+        :node authenticate with keys of node, None keeps current auth
+        """
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(self.sender,
+                                                     self.reqid,
+                                                     self.extra,
+                                                     self.full_replier, 0)
+                            + pack_bytes(self.command))
+            if node:
+                self.authenticate(node)
+            self.payload = self.content + pack_auth(self.auth,
+                                                    self.use_signature)
+            return
 
-    def gen_payload(self, node):
         self.content = rlp.encode([
             self.sender, self.reqid, self.extra,
-            self.full_replier, self.command,
+            self.full_replier, bytes(self.command),
         ], self.content_sedes)
 
-        self.authenticate(node)
+        if node:
+            self.authenticate(node)
         self.payload = rlp.encode([self.content, self.raw_auth],
                                   self.payload_sedes)
 
@@ -150,6 +211,8 @@ class Request(BaseMessage):
         if self.full_replier != request.full_replier:
             self.full_replier = request.full_replier
             changed = True
+        if changed:
+            self.clear_digests()
         if self.auth != request.auth:
             self.auth = request.auth
             changed = True # re-authenticated
@@ -161,7 +224,7 @@ class Request(BaseMessage):
         if changed:
             self.gen_payload()
 
-       return changed
+        return changed
 
     def change_by_backup(self, request, backup):
         assert request.verified # only allow verified request
@@ -176,6 +239,8 @@ class Request(BaseMessage):
         if self.full_replier != request.full_replier:
             self.full_replier = request.full_replier
             changed = True
+        if changed:
+            self.clear_digests()
         if self.auth != request.auth:
             self.auth = request.auth
             changed = True # re-authenticated
@@ -191,35 +256,26 @@ class Request(BaseMessage):
 
         return changed
 
-    def verify(self, node, peer_principal):
-        pp = peer_principal
-
-        if self.verified or not self.auth:
-            pass # already verified or no auth to verify
-        elif self.use_signature:
-            self.verified = pp.verify(self.content_digest, self.auth)
-        else:
-            if len(node.replica_principals) != len(self.auth):
-                self.verifed = False
-            else:
-                # for request, we use 'out' key for the authentication
-                assert pp.index == self.sender
-                self.verified = (pp.gen_hmac('out', self.content_digest)
-                                 == self.auth[self.sender])
-
-        return self.verified
-
     @property
     def payload_in_pre_prepare(self):
-        if len(self.command) <= conf.pre_prepare_big_request_thresh:
+        # a big request may be known by its digest only, see from_payload
+        if (self.command is not None
+            and len(self.command) <= conf.pre_prepare_big_request_thresh):
             return self.payload
 
+        if self.version == self.struct_version:
+            return (self.content_struct.pack(self.sender, self.reqid,
+                                             self.extra, self.full_replier,
+                                             1)
+                    + pack_bytes(self.command_digest)
+                    + pack_auth(None, self.use_signature))
+
         content = rlp.encode([
             self.sender, self.reqid, self.extra,
             self.full_replier, self.command_digest
-        ], message.content_sedes)
+        ], self.content_sedes)
 
-        payload = rlp.encode([content, b''], message.payload_sedes)
+        payload = rlp.encode([content, b''], self.payload_sedes)
 
         return payload
 
@@ -234,14 +290,14 @@ class Request(BaseMessage):
             extra |= 1
         if use_signature:
             extra |= 2
-        if node.type is 'Client':
+        if node.type == 'Client':
             extra |= 1 << 4
         if reply_from_all:
             extra |= 1 << 5
 
-        message = cls(node.sender, node.next_reqid(), extra,
+        message = cls(node.index, node.next_reqid(), extra,
                       full_replier, command)
-        message.gen_payload()
+        message.gen_payload(node)
 
         return message
 
@@ -249,7 +305,7 @@ class Request(BaseMessage):
     def from_payload(cls, payload, addr, node):
         try:
             [content, auth] = rlp.decode(payload, cls.payload_sedes)
-            [sender, reqid, extra, full_replier, extra, command] = (
+            [sender, reqid, extra, full_replier, command] = (
                 rlp.decode(content, cls.content_sedes))
 
             if not auth:
@@ -265,6 +321,7 @@ class Request(BaseMessage):
                 else:
                     message.auth = rlp.decode(auth, cls.authenticators_sedes)
 
+            message.version = cls.rlp_version
             message.content = content
             message.payload = payload
             
@@ -277,3 +334,39 @@ class Request(BaseMessage):
             return message
         except rlp.DecodingError as exc:
             raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, node):
+        try:
+            [sender, reqid, extra, full_replier, flags] = (
+                cls.content_struct.unpack_from(payload, 0))
+            command, offset = unpack_bytes(payload,
+                                           cls.content_struct.size)
+
+            if flags & 1:
+                # this should be a request inside of a pre_prepare
+                # it has no auth attached, get the full request form client
+                message = cls(sender, reqid, extra, full_replier, None)
+                message.command_digest = command
+            else:
+                message = cls(sender, reqid, extra, full_replier, command)
+
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            auth, offset = unpack_auth(payload, offset,
+                                       message.use_signature)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            if not flags & 1:
+                message.auth = auth
+            message.payload = payload
+
+            if (message.reply_from_all
+                or message.full_replier == node.index):
+                message.reply_with_full = True
+
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -0,0 +1,93 @@
+"""Helpers of the struct codec (frame version 2)
+
+Fixed fields are packed in network byte order by each message class,
+variable fields are prefixed by their lengths. When decoding, variable
+fields are returned as slices of the memoryview of the frame, thus no
+bytes are copied.
+"""
+import struct
+
+hmac_length = 32
+zero_hmac = bytes(hmac_length)
+
+uint8  = struct.Struct('!B')
+uint16 = struct.Struct('!H')
+uint32 = struct.Struct('!I')
+
+def check_end(buf, end):
+    if end > len(buf):
+        raise ValueError('truncated payload')
+
+def pack_bytes(data) -> bytes:
+    return uint32.pack(len(data)) + data
+
+def unpack_bytes(buf, offset:int):
+    """Return (slice, new offset)"""
+    (length,) = uint32.unpack_from(buf, offset)
+    offset += uint32.size
+    end = offset + length
+    check_end(buf, end)
+    return buf[offset:end], end
+
+class Authenticators():
+    """Authenticators in a frame, each one is sliced when indexed
+
+    a single object is kept instead of a memoryview per replica
+    """
+    __slots__ = ('buf',)
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __len__(self):
+        return len(self.buf) // hmac_length
+
+    def __getitem__(self, index:int):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('authenticator index out of range')
+
+        start = index * hmac_length
+        return self.buf[start:start + hmac_length]
+
+    def __iter__(self):
+        for start in range(0, len(self.buf), hmac_length):
+            yield self.buf[start:start + hmac_length]
+
+    def __eq__(self, other):
+        # by contents, those of a retransmitted request are equal
+        if isinstance(other, Authenticators):
+            return self.buf == other.buf
+        elif isinstance(other, list):
+            return len(self) == len(other) and all(
+                a == (b or zero_hmac) for a, b in zip(self, other))
+        return NotImplemented
+
+def pack_auth(auth, use_signature:bool) -> bytes:
+    """Signature or authenticators
+
+    empty authenticator(of the sender itself) is packed as zeros
+    """
+    if use_signature:
+        auth = auth or b''
+        return uint16.pack(len(auth)) + auth
+
+    auth = auth or []
+    return uint8.pack(len(auth)) + b''.join(a or zero_hmac for a in auth)
+
+def unpack_auth(buf, offset:int, use_signature:bool):
+    """Return (signature or Authenticators, new offset)"""
+    if use_signature:
+        (length,) = uint16.unpack_from(buf, offset)
+        offset += uint16.size
+        end = offset + length
+        check_end(buf, end)
+        return buf[offset:end], end
+
+    (count,) = uint8.unpack_from(buf, offset)
+    offset += uint8.size
+    end = offset + count * hmac_length
+    check_end(buf, end)
+    return Authenticators(buf[offset:end]), end
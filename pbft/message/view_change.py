@@ -0,0 +1,180 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_bytes, unpack_bytes, pack_auth, unpack_auth
+
+class ViewChange(BaseMessage):
+    """Move to view, with what the sender prepared after last_stable
+
+    checkpoints: (seqno, view 0, state digest) of checkpoints the sender
+    holds, last_stable and later ones. certificates are sent as
+    (seqno, view, consensus_digest) only, prepared: the latest prepared
+    pre_prepare of each seqno, pre_prepared: the latest pre_prepare of
+    each seqno. the requests themselves stay with the replicas.
+    """
+
+    content_sedes = List([
+        big_endian_int, # view
+        big_endian_int, # last_stable
+        big_endian_int, # sender
+        raw, # checkpoints, see entry_struct
+        raw, # prepared, see entry_struct
+        raw, # pre_prepared, see entry_struct
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # view, last_stable, sender, then checkpoints, prepared and
+    # pre_prepared with length prefixes
+    content_struct = struct.Struct('!QQI')
+
+    # seqno, view, then 32 bytes of consensus digest, of each entry
+    entry_struct = struct.Struct('!QQ')
+    entry_size = entry_struct.size + 32
+
+    # view changes are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('view', 'last_stable', 'checkpoints',
+                 'prepared', 'pre_prepared', '_content_digest')
+
+    def __init__(self, view, last_stable, sender, checkpoints:bytes,
+                 prepared:bytes, pre_prepared:bytes):
+        super().__init__()
+
+        self.view = view
+        self.last_stable = last_stable
+        self.sender = sender
+        self.checkpoints = checkpoints
+        self.prepared = prepared
+        self.pre_prepared = pre_prepared
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self._content_digest = None
+
+        self.from_addr = None
+
+    @classmethod
+    def pack_entries(cls, entries) -> bytes:
+        """[(seqno, view, digest)] to bytes"""
+        return b''.join(cls.entry_struct.pack(seqno, view) + digest
+                        for seqno, view, digest in entries)
+
+    @classmethod
+    def unpack_entries(cls, buf) -> list:
+        """[(seqno, view, digest)] in order"""
+        if len(buf) % cls.entry_size:
+            raise ValueError('illegal entries')
+
+        entries = []
+        for offset in range(0, len(buf), cls.entry_size):
+            seqno, view = cls.entry_struct.unpack_from(buf, offset)
+            start = offset + cls.entry_struct.size
+            entries.append((seqno, view, bytes(buf[start:start + 32])))
+        return entries
+
+    @property
+    def content_digest(self):
+        """Also names this view change in acks and new views"""
+        if self._content_digest is not None:
+            return self._content_digest
+
+        d = hashlib.sha256()
+        d.update('{}'.format(self.view).encode())
+        d.update('{}'.format(self.last_stable).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update(hashlib.sha256(self.checkpoints).digest())
+        d.update(hashlib.sha256(self.prepared).digest())
+        d.update(hashlib.sha256(self.pre_prepared).digest())
+        self._content_digest = d.digest()
+        return self._content_digest
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.view, self.last_stable, self.sender)
+                            + pack_bytes(self.checkpoints)
+                            + pack_bytes(self.prepared)
+                            + pack_bytes(self.pre_prepared))
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.view, self.last_stable,
+                                   self.sender, bytes(self.checkpoints),
+                                   bytes(self.prepared),
+                                   bytes(self.pre_prepared)],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_replica(cls, replica, view, last_stable, checkpoints,
+                     prepared, pre_prepared):
+        """
+        :checkpoints: [(seqno, 0, state digest)]
+        :prepared: [(seqno, view, digest)]
+        :pre_prepared: [(seqno, view, digest)]
+        """
+        message = cls(view, last_stable, replica.index,
+                      cls.pack_entries(checkpoints),
+                      cls.pack_entries(prepared),
+                      cls.pack_entries(pre_prepared))
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [view, last_stable, sender, checkpoints,
+             prepared, pre_prepared] = rlp.decode(content, cls.content_sedes)
+
+            message = cls(view, last_stable, sender, checkpoints,
+                          prepared, pre_prepared)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, last_stable, sender] = (
+                cls.content_struct.unpack_from(payload, 0))
+            checkpoints, offset = unpack_bytes(payload,
+                                               cls.content_struct.size)
+            prepared, offset = unpack_bytes(payload, offset)
+            pre_prepared, offset = unpack_bytes(payload, offset)
+
+            message = cls(view, last_stable, sender, bytes(checkpoints),
+                          bytes(prepared), bytes(pre_prepared))
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -0,0 +1,122 @@
+import hashlib
+import struct
+
+import rlp
+from rlp.sedes import List, big_endian_int, raw
+
+from .base_message import BaseMessage
+from .struct_codec import pack_auth, unpack_auth, check_end
+
+class ViewChangeAck(BaseMessage):
+    """Tell the primary of view the view change of replica was received
+
+    authenticators can not be checked by a third replica, the primary
+    trusts a view change whose digest is acked by 2f - 1 other replicas.
+    """
+
+    content_sedes = List([
+        big_endian_int, # view
+        big_endian_int, # sender
+        big_endian_int, # replica, sender of the view change
+        raw, # digest of the view change
+    ])
+
+    payload_sedes = List([
+        raw, # content
+        raw, # auth(authenticators)
+    ])
+
+    # view, sender, replica, then 32 bytes of digest
+    content_struct = struct.Struct('!QII')
+
+    # acks are always authenticated by authenticators
+    use_signature = False
+
+    __slots__ = ('view', 'replica', 'digest')
+
+    def __init__(self, view, sender, replica, digest):
+        super().__init__()
+
+        self.view = view
+        self.sender = sender
+        self.replica = replica
+        self.digest = digest
+
+        self.content = None
+        self.auth = None
+        self.payload = None
+
+        self.from_addr = None
+
+    @property
+    def content_digest(self):
+        d = hashlib.sha256()
+        d.update('{}'.format(self.view).encode())
+        d.update('{}'.format(self.sender).encode())
+        d.update('{}'.format(self.replica).encode())
+        d.update(self.digest)
+        return d.digest()
+
+    def gen_payload(self, replica):
+        if self.version == self.struct_version:
+            self.content = (self.content_struct.pack(
+                self.view, self.sender, self.replica) + self.digest)
+            self.authenticate(replica)
+            self.payload = self.content + pack_auth(self.auth, False)
+            return
+
+        self.content = rlp.encode([self.view, self.sender, self.replica,
+                                   bytes(self.digest)],
+                                  self.content_sedes)
+
+        self.authenticate(replica)
+        self.payload = rlp.encode([self.content, self.raw_auth],
+                                  self.payload_sedes)
+
+    @classmethod
+    def from_replica(cls, replica, view_change):
+        message = cls(view_change.view, replica.index, view_change.sender,
+                      view_change.content_digest)
+        message.gen_payload(replica)
+
+        return message
+
+    @classmethod
+    def from_payload(cls, payload, addr, _node):
+        try:
+            [content, auth] = rlp.decode(payload, cls.payload_sedes)
+            [view, sender, replica, digest] = rlp.decode(content,
+                                                         cls.content_sedes)
+
+            message = cls(view, sender, replica, digest)
+            message.content = content
+            message.auth = rlp.decode(auth, cls.authenticators_sedes)
+            message.version = cls.rlp_version
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except rlp.DecodingError as exc:
+            raise ValueError('decoding error: {}'.format(exc))
+
+    @classmethod
+    def from_struct_payload(cls, payload, addr, _node):
+        try:
+            [view, sender, replica] = cls.content_struct.unpack_from(payload,
+                                                                     0)
+            offset = cls.content_struct.size + 32
+            check_end(payload, offset)
+
+            message = cls(view, sender, replica,
+                          bytes(payload[cls.content_struct.size:offset]))
+            message.version = cls.struct_version
+            message.content = payload[:offset]
+            message.auth, offset = unpack_auth(payload, offset, False)
+            if offset != len(payload):
+                raise ValueError('trailing bytes')
+            message.payload = payload
+            message.from_addr = addr
+
+            return message
+        except struct.error as exc:
+            raise ValueError('decoding error: {}'.format(exc))
@@ -1,15 +1,22 @@
 import asyncio
 from datetime import datetime
+import hmac
 import math
 import sys
 import traceback
 
-from .types import Reqid, Seqno, View, TaskType, Task
+from .basic import Reqid, Seqno, View, TaskType, Task, Configuration as conf
+from .crypto import CryptoService
+from .bulk_io import new_bulk_socket
 from .datagram_server import DatagramServer
 from .principal import Principal
-from .message import MessageTag, BaseMessage, NewKey, Request, Reply
+from .message import (MessageTag, BaseMessage, NewKey, Request, Reply,
+                      PrePrepare, Prepare, Commit, Checkpoint,
+                      Fetch, MetaData, MetaDataD, Data,
+                      ViewChange, ViewChangeAck, NewView)
 from .timer import Timer
-from .utils import utcnow_reqid, print_new_key
+from .util import utcnow_reqid, print_new_key
+from .verify_cache import VerifyCache
 
 class Node():
 
@@ -19,6 +26,8 @@ class Node():
                  replica_principals = [], client_principals = [],
                  *args, **kwargs):
 
+        self.loop = asyncio.get_event_loop()
+
         self.n = n
         self.f = f
 
@@ -28,7 +37,7 @@ class Node():
         self.view = View(0)
 
         # use task queue to queue tasks
-        self.task_queue = asyncio.Queue(loop=self.loop)
+        self.task_queue = asyncio.Queue()
 
         self.reqid = utcnow_reqid()
         self.last_new_key = None
@@ -41,6 +50,26 @@ class Node():
         self.auth_timer = Timer(auth_interval / 1000.0,
                                 self.auth_timer_handler)
 
+        # frames to send in this loop iteration, see flush_outbox
+        self.outbox = []
+        self.flush_handle = None
+        self._bulk_socket = None # created with the first flush
+
+        self.sent_datagrams = 0
+        self.send_syscalls = 0
+        self.received_datagrams = 0
+        self.recv_syscalls = 0
+
+        # positive results of verify, see VerifyCache
+        self.verify_cache = None
+        if conf.verify_cache_size:
+            self.verify_cache = VerifyCache(conf.verify_cache_size)
+
+        # rsa operations run inline when there is no crypto service
+        self.crypto = None
+        if conf.crypto_workers:
+            self.crypto = CryptoService(conf.crypto_workers, self.loop)
+
         super().__init__(*args, **kwargs)
 
     @property
@@ -55,7 +84,7 @@ class Node():
     @property
     def is_valid(self):
         if (self.f * 3 + 1 > self.n
-            or len(self.replica_principals) < n
+            or len(self.replica_principals) < self.n
             or self.index == None):
             return False
 
@@ -72,7 +101,7 @@ class Node():
             elif message.sender_type == 'Client':
                 principal = self.client_principals[message.sender]
 
-            assert principal.index == message.index
+            assert principal.index == message.sender
 
             # TODO: restrict addr in ip range?
             # assert principal.addr == message.from_addr
@@ -92,6 +121,48 @@ class Node():
                 authenticators.append(p.gen_hmac('out', hash_bytes))
         return authenticators
 
+    def verify_messages(self, messages) -> list:
+        """Verify a batch of received messages in one call
+
+        hmacs of the same sender principal and key are generated
+        together from one keyed state, see Principal.gen_hmacs.
+        signed messages are verified one by one.
+        cached results are used and new ones are cached.
+
+        return a list of verified flags, in the order of messages
+        """
+        results = [False] * len(messages)
+        batches = {} # (principal, hmac_key) => [(index, authenticator)]
+
+        for i, m in enumerate(messages):
+            if m.verified:
+                results[i] = True
+                continue
+
+            pp = self.find_sender(m)
+            if not pp:
+                continue
+
+            entry = m.authenticator(self)
+            if (entry is not None and self.verify_cache is not None
+                and self.verify_cache.lookup(m, pp)):
+                m.verified = results[i] = True
+            elif entry is None:
+                results[i] = m.verify(self, pp)
+            else:
+                batches.setdefault((pp, m.hmac_key), []).append((i, entry))
+
+        for (pp, hmac_key), entries in batches.items():
+            hmacs = pp.gen_hmacs(hmac_key, [messages[i].content_digest
+                                            for i, _ in entries])
+            for (i, entry), h in zip(entries, hmacs):
+                m = messages[i]
+                m.verified = results[i] = hmac.compare_digest(h, entry)
+                if m.verified and self.verify_cache is not None:
+                    self.verify_cache.add(m, pp)
+
+        return results
+
     def auth_timer_handler(self, _task = None):
         self.send_new_key()
 
@@ -102,38 +173,170 @@ class Node():
         if __debug__:
             print('node send_new_key')
 
+        if self.crypto:
+            self.loop.create_task(self.sign_and_send_new_key())
+            return
+
         new_key = NewKey.from_node(self)
+        self.rotate_keys(new_key)
+
+    async def sign_and_send_new_key(self):
+        new_key = NewKey.from_node(self, sign = False)
+        signature = await self.crypto.sign(self.principal,
+                                           new_key.content_digest)
+        if not signature:
+            print('new_key signing failure') # TODO: log
+            return # the old keys stay in use
+
+        new_key.set_signature(signature)
+        self.rotate_keys(new_key)
+
+    def rotate_keys(self, new_key):
+        """Use the keys of a signed new_key and send it
+
+        peers use the old keys until the new_key reaches them,
+        so they are replaced only when it is sent.
+        """
+        new_key.use_inkeys(self)
+        self.invalidate_verify_cache()
         self.sendto(new_key, 'ALL_REPLICAS')
         self.last_new_key = new_key
 
+    def invalidate_verify_cache(self):
+        """Drop cached results under inkeys replaced by a new_key"""
+        if self.verify_cache is not None:
+            for p in self.replica_principals:
+                self.verify_cache.invalidate(p, 'Replica')
+
+    def unverified_signatures(self, message) -> list:
+        """message and requests in it whose signatures are not verified"""
+        messages = [message] + list(getattr(message, 'requests', ()))
+        return [m for m in messages
+                if getattr(m, 'use_signature', False)
+                and m.auth and not m.verified]
+
+    async def run_crypto(self, message) -> bool:
+        """Run rsa operations of a received message in the crypto service
+
+        signatures of message and requests in it are verified,
+        the hmac key for this node in a new_key is decrypted.
+
+        return False if any of them fails
+        """
+        signed = []
+        for m in self.unverified_signatures(message):
+            pp = self.find_sender(m)
+            if not pp:
+                return False
+            if (self.verify_cache is not None
+                and self.verify_cache.lookup(m, pp)):
+                m.verified = True
+            else:
+                signed.append((m, pp))
+
+        results = await asyncio.gather(*(
+            self.crypto.verify(pp, m.content_digest, m.auth)
+            for m, pp in signed))
+        for (m, pp), verified in zip(signed, results):
+            m.verified = verified
+            if verified and self.verify_cache is not None:
+                self.verify_cache.add(m, pp)
+        if not all(results):
+            return False
+
+        if type(message) is NewKey:
+            message.outkey = await self.crypto.decrypt(
+                self.principal, message.hmac_keys[self.index])
+            return message.outkey is not None
+
+        return True
+
     def parse_frame(self, data, addr):
         try:
-            tag, payload = BaseMessage.parse_frame(data)
+            tag, version, payload = BaseMessage.parse_frame(data)
             cls = getattr(sys.modules[__name__], tag.name)
-            message = cls.from_payload(payload, addr, self)
+            if version == BaseMessage.struct_version:
+                message = cls.from_struct_payload(payload, addr, self)
+            else:
+                message = cls.from_payload(payload, addr, self)
             return message
         except:
             traceback.print_exc() # TODO: log
 
     def notify(self, task:Task):
-        self.loop.create_task(self.task_queue.put(task))
+        # the queue is unbounded, no task is needed to put
+        self.task_queue.put_nowait(task)
+
+    def datagram_received(self, data:bytes, addr):
+        """Queue a datagram as a task, nodes may dispatch them directly"""
+        self.received_datagrams += 1
+        self.recv_syscalls += 1 # recvfrom of the transport
+        self.notify(Task(TaskType.PEER_MSG, (data, addr)))
 
     def sendto(self, data:bytes, dest, include_self=False):
         if isinstance(data, BaseMessage):
             data = data.frame
 
-        if dest is 'ALL_REPLICAS':
+        if dest == 'ALL_REPLICAS':
             self.sendto(data, self.replica_principals, include_self)
-        elif dest is 'ALL_CLIENTS':
+        elif dest == 'ALL_CLIENTS':
             self.sendto(data, self.client_principals, include_self)
         elif type(dest) is tuple or type(dest) is list:
             for d in dest:
                 self.sendto(data, d, include_self)
         else:
-            assert type(dest) is Principal:
+            assert type(dest) is Principal
             # unicast to addr
             if dest is self.principal and not include_self:
                 return # don't send to myself
 
-            dest = dest.addr
-            self.transport.sendto(data, dest)
+            # sent with other frames of this loop iteration
+            self.outbox.append((data, dest.addr))
+            if not self.flush_handle:
+                self.flush_handle = self.loop.call_soon(self.flush_outbox)
+
+    @property
+    def bulk_socket(self):
+        """BulkSocket of the transport, None if not available"""
+        if self._bulk_socket is None:
+            self._bulk_socket = False
+            if conf.bulk_io:
+                self._bulk_socket = (
+                    new_bulk_socket(self.transport, conf.bulk_io_batch)
+                    or False)
+
+        return self._bulk_socket or None
+
+    def flush_outbox(self):
+        """Send frames queued by sendto, by as few syscalls as possible"""
+        self.flush_handle = None
+        outbox, self.outbox = self.outbox, []
+
+        sent = 0
+        bulk = self.bulk_socket
+        if bulk and not self.transport.get_write_buffer_size():
+            try:
+                sent, syscalls = bulk.send(outbox)
+                self.send_syscalls += syscalls
+            except OSError:
+                traceback.print_exc() # TODO: log
+
+        # the rest, or all if there is no bulk socket
+        for data, addr in outbox[sent:]:
+            self.transport.sendto(data, addr)
+            self.send_syscalls += 1
+
+        self.sent_datagrams += len(outbox)
+
+    @property
+    def io_stats(self):
+        return {
+            'sent_datagrams': self.sent_datagrams,
+            'send_syscalls': self.send_syscalls,
+            'send_syscalls_per_datagram':
+                self.send_syscalls / (self.sent_datagrams or 1),
+            'received_datagrams': self.received_datagrams,
+            'recv_syscalls': self.recv_syscalls,
+            'recv_syscalls_per_datagram':
+                self.recv_syscalls / (self.received_datagrams or 1),
+        }
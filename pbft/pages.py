@@ -0,0 +1,71 @@
+"""Pages of the state in one mmap
+
+Anonymous by default: pages never written are not backed by memory.
+With a path the pages live in a sparse file, so the state may be larger
+than RAM and the kernel pages it in and out.
+"""
+import mmap
+
+class Pages():
+    """count pages of page_size bytes, all zero until written"""
+
+    def __init__(self, count:int, page_size:int, path:str = None):
+        self.count = count
+        self.page_size = page_size
+
+        size = count * page_size
+        if path:
+            self.file = open(path, 'w+b')
+            self.file.truncate(size)
+            self.mmap = mmap.mmap(self.file.fileno(), size)
+        else:
+            self.file = None
+            self.mmap = mmap.mmap(-1, size)
+
+        self.view = memoryview(self.mmap)
+
+        # 1 for pages written at least once
+        self.allocated = bytearray(count)
+
+    def __len__(self):
+        return self.count
+
+    def is_allocated(self, index:int) -> bool:
+        return bool(self.allocated[index])
+
+    def page(self, index:int) -> memoryview:
+        """Writable view of page index, which is allocated from now on"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        self.allocated[index] = 1
+        start = index * self.page_size
+        return self.view[start:start + self.page_size]
+
+    def read(self, index:int) -> memoryview:
+        """Read only view of page index, no copy"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        start = index * self.page_size
+        return self.view[start:start + self.page_size].toreadonly()
+
+    def write(self, index:int, data:bytes):
+        """Replace page index by data, the rest of the page is zeroed"""
+        assert len(data) <= self.page_size
+        page = self.page(index)
+        page[:len(data)] = data
+        if len(data) < self.page_size:
+            page[len(data):] = bytes(self.page_size - len(data))
+
+    def free(self, index:int):
+        """Zero page index, as if it was never written"""
+        self.write(index, b'')
+        self.allocated[index] = 0
+
+    def close(self):
+        """Unmap the pages, views handed out must be released before"""
+        self.view.release()
+        self.mmap.close()
+        if self.file:
+            self.file.close()
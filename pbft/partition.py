@@ -1,6 +1,6 @@
 import hashlib
 
-from .types import Seqno
+from .basic import Seqno
 
 class Partition():
 
@@ -10,19 +10,27 @@ class Partition():
     """Default block content"""
     zero_block = bytes(block_size)
 
+    """Digest of a leaf never written, see compute_digest"""
+    zero_digest = hashlib.sha256(zero_block + b'0').digest()
+
     """Default number of children for partitions"""
-    children_count = 2 << 8 # 256
+    children_count = 2 << 8 # 512
 
     """Default number of levels in partition tree"""
     level_count = 3
 
+    __slots__ = ('level', 'index', 'last_mod_checkpoint', 'digest',
+                 '_block', 'pages')
+
     def __init__(self,
                  level:int, index:int,
-                 last_mod_checkpoint:Seqno):
+                 last_mod_checkpoint:Seqno,
+                 pages = None):
 
         """Partition
 
         last_mod_checkpoint: checkpoint sequence number of last modification
+        pages: Pages holding the blocks of leaves, None to keep them here
         """
         self.level = level
         self.index = index
@@ -31,14 +39,23 @@ class Partition():
 
         # only leaf partition have blocks
         self._block = None
+        self.pages = pages
 
     @property
     def block(self):
+        if self.pages is not None:
+            if self.pages.is_allocated(self.index):
+                return self.pages.read(self.index)
+            return Partition.zero_block
+
         return self._block if self._block else Partition.zero_block
 
     @block.setter
     def block(self, value:bytes):
-        self._block = value
+        if self.pages is not None:
+            self.pages.write(self.index, value)
+        else:
+            self._block = value
 
     def compute_digest(self, data:bytes):
         assert self.level < Partition.level_count
@@ -46,7 +63,9 @@ class Partition():
 
         d = hashlib.sha256()
         # dx: intentionally use a simple encoding method
-        d.update('{}'.format(self.index).encode())
-        d.update('{}'.format(self.last_mod_seqno).encode())
+        # the index is bound by the parent, which hashes digests of
+        # its children in order, so it is left out: subtrees never
+        # written have the same digests wherever they are
         d.update(data)
+        d.update('{}'.format(self.last_mod_checkpoint).encode())
         return d.digest()
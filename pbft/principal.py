@@ -4,7 +4,7 @@ import traceback
 
 import rsa
 
-from .types import Reqid
+from .basic import Reqid
 
 class Principal():
     
@@ -13,6 +13,10 @@ class Principal():
     hmac_nounce_length = 32
     zero_hmac_nounce = bytes(hmac_nounce_length)
 
+    __slots__ = ('index', 'ip', 'port', 'private_key', 'public_key',
+                 'key_epoch', '_inkey', '_inkey_hmac',
+                 '_outkey', '_outkey_hmac', 'outkey_reqid')
+
     def __init__(self,
                  index:int,
                  private_key = None, public_key = None,
@@ -24,7 +28,9 @@ class Principal():
         self.private_key = private_key
         self.public_key = public_key
 
-        # using hmac-256 for session keys
+        # using hmac-256 for session keys,
+        # key_epoch changes with either of them, see VerifyCache
+        self.key_epoch = 0
         self.outkey = self.zero_hmac_nounce
         self.outkey_reqid = Reqid(0) # outkey timestamp
         self.inkey = self.zero_hmac_nounce
@@ -33,6 +39,28 @@ class Principal():
     def addr(self):
         return (self.ip, self.port)
 
+    @property
+    def inkey(self):
+        return self._inkey
+
+    @inkey.setter
+    def inkey(self, key:bytes):
+        # keyed hmac state, copied for each message instead of
+        # running the key schedule of hmac.new every time
+        self._inkey = key
+        self.key_epoch += 1
+        self._inkey_hmac = hmac.new(key, digestmod='SHA256')
+
+    @property
+    def outkey(self):
+        return self._outkey
+
+    @outkey.setter
+    def outkey(self, key:bytes):
+        self._outkey = key
+        self.key_epoch += 1
+        self._outkey_hmac = hmac.new(key, digestmod='SHA256')
+
     def sign(self, message:bytes) -> bytes:
         try:
             return rsa.sign(message, self.private_key, self.hash_method)
@@ -79,9 +107,23 @@ class Principal():
         assert inout == 'in' or inout == 'out'
 
         if inout == 'in':
-            key = self.inkey
+            h = self._inkey_hmac.copy()
         else:
             # inout == 'out'
-            key = self.outkey
+            h = self._outkey_hmac.copy()
+
+        h.update(source)
+        return h.digest()
+
+    def gen_hmacs(self, inout, sources) -> list:
+        """Generate hmacs for a batch of sources with the same key"""
+        assert inout == 'in' or inout == 'out'
+
+        base = self._inkey_hmac if inout == 'in' else self._outkey_hmac
 
-        return hmac.new(key, source, digestmod='SHA256').digest()
+        hmacs = []
+        for source in sources:
+            h = base.copy()
+            h.update(source)
+            hmacs.append(h.digest())
+        return hmacs
@@ -7,9 +7,17 @@ from .principal import Principal
 from .node import Node
 
 from .basic import Reqid, Seqno, View, TaskType, Task, Configuration as conf
+from .batch import Batcher
+from .message import (PrePrepare, Prepare, Commit, Checkpoint, Reply,
+                      Fetch, MetaData, MetaDataD, Data)
+from .partition import Partition
 from .timer import Timer
-from .log   import Log
-from .utils import print_new_key, print_task
+from .log   import PrepareCertificateLog
+from .reply_cache import ReplyCache
+from .state import State
+from .state_transfer import Fetcher
+from .view_change import ViewChanger, ViewChangeTimeout, null_digest
+from .util import print_new_key, print_task
 
 class Replica(Node):
     type = 'Replica'
@@ -23,29 +31,45 @@ class Replica(Node):
                  replica_principals = [],
                  *args, **kwargs):
 
-        super().__init__(replica_principals = replica_principals,
-                         *args, **kwargs)
-
         self.index = None # this is not a consensus replia
         for index, p in enumerate(replica_principals):
             if p.public_key == public_key:
                 self.index = index
                 p.private_key = private_key
 
+        super().__init__(replica_principals = replica_principals,
+                         *args, **kwargs)
+
         self.status_timer = Timer(status_interval / 1000.0,
                                   self.status_handler)
         self.view_change_timer = Timer(view_change_interval / 1000.0,
                                        self.view_change_handler)
+        # the interval of view_change_timer, from commit latency
+        self.view_change_timeout = ViewChangeTimeout(
+            view_change_interval / 1000.0,
+            conf.view_change_min_timeout,
+            conf.view_change_max_timeout,
+            conf.adaptive_view_change_timeout)
         self.recovery_timer = Timer(recovery_interval / 1000.0,
                                     self.recovery_handler)
-        self.idle_timer = Timer(recovery_interval / 1000.0,
+        self.idle_timer = Timer(idle_interval / 1000.0,
                                 self.idle_handler)
 
+        # used when this is primary, the interval is set on start
+        self.batcher = Batcher(conf.request_in_pre_prepare,
+                               conf.pre_prepare_content_thresh,
+                               conf.batch_max_wait,
+                               conf.adaptive_batching)
+        self.batch_timer = Timer(self.batcher.max_wait,
+                                 self.batch_timer_handler)
+
         # self.pending_requests = dict()
 
         # stale requests, all are full requests
         # principal -> [request]
         self.rw_requests = collections.OrderedDict()
+        # (principal, reqid) -> readonly request waiting for tentative
+        # state to commit
         self.ro_requests = collections.OrderedDict()
 
         self.plog = PrepareCertificateLog(self, conf.checkpoint_max_out, 1)
@@ -53,7 +77,10 @@ class Replica(Node):
         # (sender_type, sender_index, reqid, commmand_digest) => request
         # self.inplog_requests = dict()
 
-        self.replies = dict() # principal -> reply
+        self.replies = dict() # principal -> ReplyCache
+        # (principal, reqid) -> undo of the tentative reply in replies,
+        # for requests of last_tentative_execute
+        self.tentative = dict()
 
         self.limbo = False # start view change but has NO new view
 
@@ -62,6 +89,13 @@ class Replica(Node):
         self.last_stable = Seqno(0)
         # self.low_bound = Seqno(0) # used for what?
 
+        # quorum matching checkpoints of last_stable
+        self.stable_certificate = []
+        # seqno => {sender => checkpoint}, in (last_stable, + max_out]
+        self.checkpoints = dict()
+        # sender => latest checkpoint beyond our window
+        self.checkpoints_ahead = dict()
+
         self.last_prepared = Seqno(0)
 
         # last commited seqno
@@ -74,6 +108,17 @@ class Replica(Node):
         self.user_execution_func = None
         self.user_non_det_choice_func = None
 
+        self.state = State()
+        self.state.checkpoint(self.last_stable)
+        self.fetcher = Fetcher(self)
+        self.view_changer = ViewChanger(self)
+
+        # datagrams not dispatched yet, see datagram_received
+        self.inbox = []
+        self.dispatch_handle = None
+        self.dispatch_count = 0
+        self.dispatch_batch_count = 0
+
     @property
     def principal(self) -> Principal:
         """Get principal of this node."""
@@ -88,13 +133,14 @@ class Replica(Node):
         """this replica has complete new-view
         information for the current view
         """
-        return self.view == 0 or True # TODO: more conditions
+        return not self.limbo
 
     def status_handler(self):
         pass
 
-    def view_change_handler(self):
-        pass
+    def view_change_handler(self, _task = None):
+        """No progress on known requests, or no new view in time"""
+        self.start_view_change(self.view + 1)
 
     def recovery_handler(self):
         pass
@@ -102,26 +148,364 @@ class Replica(Node):
     def idle_handler(self):
         pass
 
-    def start_view_change_timer(self):
-        if (self.view_change_timer
-            and not self.view_change_timer.done()):
+    def batch_timer_handler(self, _task = None):
+        """Cut the pending batch when max wait expired"""
+        if self.principal is self.primary:
+            self.new_and_send_pre_prepare(timeout = True)
+
+    def start_view_change_timer(self, restart = False):
+        """Run the view change timer for the current timeout"""
+        if (not restart and self.view_change_timer.timer
+            and not self.view_change_timer.timer.done()):
+            return # already started
+
+        self.view_change_timer.interval = self.view_change_timeout.timeout
+        self.view_change_timer.restart()
+
+    def update_view_change_timer(self, progress:bool):
+        """Backups expect requests they know of to be executed
+
+        the timer runs while requests are pending or pre_prepared,
+        from the last progress on.
+        """
+        if self.principal is self.primary or self.limbo:
+            return
+
+        pcert = self.plog[self.last_executed + 1]
+        if not self.rw_requests and not (pcert and pcert.pre_prepare):
+            self.view_change_timer.stop()
+        else:
+            self.start_view_change_timer(restart = progress)
+
+    def start_view_change(self, view:View):
+        """Leave the current view for view, see ViewChanger
+
+        messages of the view are deferred until its new view is entered,
+        the timer moves on to the next view if that takes too long.
+        """
+        if view <= self.view:
+            return
+        elif self.limbo:
+            # the last view change did not make it, wait longer
+            self.view_change_timeout.fail()
+
+        self.view = view
+        self.limbo = True
+        self.batch_timer.stop()
+        self.rollback_tentative()
 
-    def execute_readonly(self, request):
+        self.start_view_change_timer(restart = True)
+        self.view_changer.start(view)
+
+    def enter_new_view(self, checkpoint:Seqno, digest:bytes, chosen):
+        """Start the view from checkpoint, re-issue chosen pre_prepares
+
+        :chosen: [(seqno, consensus digest)] after checkpoint
+
+        pcerts are rebuilt in the view, with the batches of older views
+        matching chosen, or null pre_prepares. the primary sends them
+        all at once, backups prepare the batches they hold themselves
+        and wait for the others.
+        """
+        self.limbo = False
+        self.view_change_timer.stop()
+        self.view_change_timeout.succeed()
+
+        chosen = dict(chosen)
+        is_primary = self.principal is self.primary
+        if is_primary:
+            self.seqno = max([checkpoint, self.last_executed] + list(chosen))
+
+        # the window moves to checkpoint first, chosen seqnos may be
+        # beyond the one we had
+        if checkpoint > self.last_stable:
+            if (checkpoint <= self.last_executed
+                and any(c.seqno == checkpoint and c.digest == digest
+                        for c in self.state.checkpoint_log)):
+                self.mark_stable(checkpoint)
+            else:
+                # the state follows by a transfer, see state_fetched
+                self.fetcher.start()
+                self.last_stable = checkpoint
+                self.plog.truncate(checkpoint + 1)
+
+        missing = self.view_changer.missing
+        lacking = (set() if is_primary
+                   else self.view_changer.lacked_by_primary(chosen))
+        for seqno in range(self.last_stable + 1,
+                           self.last_stable + conf.checkpoint_max_out + 1):
+            pcert = self.plog[seqno]
+            consensus_digest = chosen.get(seqno)
+            batch = self.find_batch(seqno, consensus_digest)
+            pcert.init_view()
+
+            if not consensus_digest:
+                continue
+            elif consensus_digest == null_digest:
+                batch = None
+            elif not batch:
+                if is_primary:
+                    # backups holding it send it, see recv_chosen_batch
+                    missing[seqno] = consensus_digest
+                continue # wait for the pre_prepare of the primary
+
+            pre_prepare = self.reissue_pre_prepare(pcert, batch)
+            if seqno in lacking:
+                # the primary reported no batch of the digest
+                copy = PrePrepare(self.view, seqno, pre_prepare.extra,
+                                  pre_prepare.requests,
+                                  pre_prepare.non_det_choices)
+                copy.sender = self.index
+                copy.gen_payload(self)
+                self.sendto(copy, self.primary)
+
+        if missing:
+            # the view is given up unless they arrive in time
+            self.start_view_change_timer(restart = True)
+
+        self.execute_committed()
+        self.update_view_change_timer(True)
+
+    def reissue_pre_prepare(self, pcert, batch):
+        """Pre_prepare batch of an older view at pcert in the view
+
+        :batch: None for a null pre_prepare
+
+        the primary sends it, backups prepare it if they can.
+        """
+        is_primary = self.principal is self.primary
+        if batch:
+            pre_prepare = PrePrepare(self.view, pcert.seqno,
+                                     batch.extra & ~2, list(batch.requests),
+                                     batch.non_det_choices)
+        else:
+            pre_prepare = PrePrepare(self.view, pcert.seqno, 0, [], b'')
+
+        pre_prepare.sender = self.primary.index
+        # backups authenticate their copy too, it is never sent
+        pre_prepare.gen_payload(self)
+        if not is_primary:
+            self.take_pending(pre_prepare)
+        for r in pre_prepare.requests:
+            # latency across views is no sample, as karn's algorithm
+            r.arrival = None
+        pcert.add_pre_prepare(pre_prepare)
+
+        if is_primary:
+            pre_prepare.mine = True
+            self.sendto(pre_prepare, 'ALL_REPLICAS')
+        elif pre_prepare.is_requests_verified:
+            self.new_and_send_prepare(pcert)
+        return pre_prepare
+
+    def recv_chosen_batch(self, pre_prepare):
+        """A backup sent a batch of the new view the primary lacks
+
+        it matches the consensus digest chosen for its seqno, which
+        f + 1 replicas pre_prepared, whoever sent it.
+        """
+        missing = self.view_changer.missing
+        if (self.limbo or pre_prepare.view != self.view
+            or missing.get(pre_prepare.seqno)
+               != pre_prepare.consensus_digest):
+            return
+
+        del missing[pre_prepare.seqno]
+        self.reissue_pre_prepare(self.plog[pre_prepare.seqno], pre_prepare)
+        if not missing:
+            self.view_change_timer.stop()
+
+    def find_batch(self, seqno:Seqno, consensus_digest:bytes):
+        """Pre_prepare of seqno with consensus_digest we hold, any view"""
+        pcert = self.plog[seqno]
+        if not pcert or not consensus_digest:
+            return None
+
+        for pp in (pcert.pre_prepare, pcert.last_prepared,
+                   pcert.last_pre_prepare):
+            if pp and pp.consensus_digest == consensus_digest:
+                return pp
+        return None
+
+    def recv_view_change(self, view_change, peer_principal):
+        if view_change.verify(self, peer_principal):
+            self.view_changer.recv_view_change(view_change)
+
+    def recv_view_change_ack(self, view_change_ack, peer_principal):
+        if view_change_ack.verify(self, peer_principal):
+            self.view_changer.recv_view_change_ack(view_change_ack)
+
+    def recv_new_view(self, new_view, peer_principal):
+        if new_view.verify(self, peer_principal):
+            self.view_changer.recv_new_view(new_view)
+
+    def execute_readonly(self, request) -> bool:
+        """Execute a readonly request against the committed state and reply
+
+        the request is not ordered, the client waits for 2f + 1 matching
+        replies. False while there is tentative state or a state transfer,
+        the request should be retried when it is committed.
+        """
+        if (self.last_tentative_execute != self.last_executed
+            or self.state.is_fetching):
+            return False
+
+        pp = self.find_sender(request)
+        if not pp:
+            return True # TODO: log
+
+        result = self.call_user_execution_func(request)
+        self.sendto(Reply.from_node(self, request, result), pp)
         return True
 
-    def call_user_execution_func(self):
-        pass
+    def execute_ro_requests(self):
+        """Retry readonly requests which met tentative state"""
+        while self.ro_requests:
+            key, request = next(iter(self.ro_requests.items()))
+            if not self.execute_readonly(request):
+                return
+            del self.ro_requests[key]
+
+    def defer_readonly(self, principal, request):
+        """Keep a readonly request until tentative state commits
+
+        a flood of them drops the oldest, see conf.ro_requests_max
+        """
+        self.ro_requests[(principal, request.reqid)] = request
+        if len(self.ro_requests) > conf.ro_requests_max:
+            self.ro_requests.popitem(last = False)
+
+    def call_user_execution_func(self, request):
+        """Execute command of request, return the result
+
+        user_execution_func(command, sender_type, sender, readonly,
+                            state) -> bytes
+        pages of state are read by state.read_page and written through
+        the memoryviews of state.page, or after state.modify, so that
+        they are copied on write and their digests are updated.
+        it must leave the last pages of state alone, see reply_page
+        """
+        if not self.user_execution_func:
+            return b''
+
+        return self.user_execution_func(request.command,
+                                        request.sender_type,
+                                        request.sender,
+                                        request.readonly,
+                                        self.state)
+
+    def reply_page(self, principal) -> int:
+        """Page of state keeping the executed reqids of principal
+
+        the last pages, one per client then one per replica
+        """
+        last = len(self.state.leaves) - 1
+        clients = self.client_principals
+        if (principal.index < len(clients)
+            and clients[principal.index] is principal):
+            return last - principal.index
+        return last - len(clients) - principal.index
+
+    def save_replies(self, principal):
+        self.state.set_block(self.reply_page(principal),
+                             self.replies[principal].pack())
+
+    def load_replies(self):
+        """Executed reqids from state, after a state transfer"""
+        for pp in self.client_principals + self.replica_principals:
+            block = self.state.read_page(self.reply_page(pp))
+            if pp in self.replies or any(block[:ReplyCache.header.size]):
+                replies = self.replies.setdefault(
+                    pp, ReplyCache(2 * conf.client_window))
+                replies.load(block)
+
+    def execute_request(self, request, tentative = False) -> bool:
+        """Execute a committed or prepared request and reply to the requestor
+
+        return False if it was not executed, e.g. a duplicate
+        """
+        pp = self.find_sender(request)
+        if not pp:
+            return False # TODO: log
+
+        replies = self.replies.get(pp)
+        if not replies:
+            replies = self.replies[pp] = ReplyCache(2 * conf.client_window)
+        elif replies.is_executed(request.reqid):
+            return False # executed already
+
+        result = self.call_user_execution_func(request)
+        reply = Reply.from_node(self, request, result, tentative)
+        undo = replies.add(reply)
+        self.save_replies(pp)
+        if tentative:
+            self.tentative[(pp, request.reqid)] = undo
+        self.sendto(reply, pp)
+        return True
 
     def execute_prepared(self):
-        pass
+        """Execute the prepared pre_prepare after last_executed tentatively
+
+        replies are marked tentative, clients accept 2f + 1 matching ones
+        without waiting for the commit phase. at most one seqno is
+        tentative, it is rolled back by rollback_tentative.
+        """
+        if (not conf.tentative_execution or self.state.is_fetching
+            or self.last_tentative_execute != self.last_executed):
+            return
+
+        pcert = self.plog[self.last_executed + 1]
+        if not pcert or not pcert.is_prepared or pcert.is_committed:
+            return
+
+        pre_prepare = pcert.pre_prepare
+        if (pre_prepare.view != self.view
+            or any(r.command is None for r in pre_prepare.requests)):
+            return
+
+        pcert.executed = [r for r in pre_prepare.requests
+                          if self.execute_request(r, tentative = True)]
+
+        self.last_tentative_execute = pcert.seqno
+
+    def rollback_tentative(self):
+        """Undo the tentative execution of last_tentative_execute
+
+        the state goes back to its last checkpoint, seqnos committed
+        after it are executed again from the plog without replies.
+        """
+        if self.last_tentative_execute == self.last_executed:
+            return
+
+        for (pp, reqid), undo in reversed(self.tentative.items()):
+            self.replies[pp].remove(reqid, undo)
+        self.tentative = dict()
+
+        checkpoint = self.state.checkpoint_log[-1].seqno
+        self.state.rollback(checkpoint)
+        for seqno in range(checkpoint + 1, self.last_executed + 1):
+            # their pre_prepares may be gone with the view
+            for r in self.plog[seqno].executed:
+                self.call_user_execution_func(r)
+        # replies are back to last_executed already
+        for pp in self.replies:
+            self.save_replies(pp)
+
+        self.last_tentative_execute = self.last_executed
 
     def execute_committed(self):
-        while True:
+        """Execute committed pre_prepares strictly in seqno order
+
+        with pipelining, pre_prepares may commit out of order,
+        they are applied one by one from last_executed + 1
+        """
+        last_executed = self.last_executed
+        while not self.state.is_fetching:
             if (self.last_executed < self.last_stable
                 or (self.last_executed
-                    >= self.last_stable + consts.checkpoint_max_out)):
+                    >= self.last_stable + conf.checkpoint_max_out)):
                 # dx: how doest this happens?
-                return
+                break
 
             pcert = self.plog[self.last_executed + 1]
             if not pcert.is_committed:
@@ -130,23 +514,195 @@ class Replica(Node):
             pre_prepare = pcert.pre_prepare
             if not pre_prepare or pre_prepare.view != self.view:
                 break # no more useful pcert
-            
-            
 
+            if any(r.command is None for r in pre_prepare.requests):
+                break # wait for commands of big requests
+
+            if self.last_tentative_execute > self.last_executed:
+                # executed when prepared, the replies are final now
+                self.tentative = dict()
+            else:
+                pcert.executed = [r for r in pre_prepare.requests
+                                  if self.execute_request(r)]
+                self.last_tentative_execute = pcert.seqno
+
+            self.last_executed = pcert.seqno
+            self.record_commit_latency(pre_prepare)
+            if self.last_executed % conf.checkpoint_interval == 0:
+                self.send_checkpoint(self.last_executed)
+
+        # before tentative state comes back
+        self.execute_ro_requests()
+        self.execute_prepared()
+
+        if self.principal is self.primary:
+            # execution may open the window for new pre_prepares
+            self.new_and_send_pre_prepare()
+        else:
+            self.update_view_change_timer(
+                self.last_executed != last_executed)
+
+    def record_commit_latency(self, pre_prepare):
+        """Sample the view change timeout by the oldest request of
+        an executed pre_prepare"""
+        arrivals = [r.arrival for r in pre_prepare.requests
+                    if r.arrival is not None]
+        if arrivals:
+            self.view_change_timeout.record(self.loop.time() - min(arrivals))
+
+    def send_checkpoint(self, seqno:Seqno):
+        """Take checkpoint seqno of state and multicast its digest"""
+        digest = self.state.checkpoint(seqno)
+        checkpoint = Checkpoint.from_replica(self, seqno, digest)
+        self.sendto(checkpoint, 'ALL_REPLICAS')
+        self.add_checkpoint(checkpoint)
+
+    def recv_checkpoint(self, checkpoint, peer_principal):
+        if not checkpoint.verify(self, peer_principal):
+            return
+        elif checkpoint.seqno <= self.last_stable:
+            return # TODO: send our stable certificate?
+
+        if checkpoint.seqno > self.last_stable + conf.checkpoint_max_out:
+            # f + 1 replicas, one of them is correct, are beyond
+            # our window, which never moves without state transfer
+            last = self.checkpoints_ahead.get(checkpoint.sender)
+            if not last or last.seqno < checkpoint.seqno:
+                self.checkpoints_ahead[checkpoint.sender] = checkpoint
+            if len(self.checkpoints_ahead) > self.f:
+                self.fetcher.start()
+            return
+
+        self.add_checkpoint(checkpoint)
+
+    def add_checkpoint(self, checkpoint):
+        if checkpoint.seqno <= self.last_stable:
+            return
+
+        votes = self.checkpoints.setdefault(checkpoint.seqno, dict())
+        votes[checkpoint.sender] = checkpoint
+
+        mine = votes.get(self.index)
+        if not mine:
+            return # not executed yet
+
+        matching = [c for c in votes.values()
+                    if bytes(c.digest) == bytes(mine.digest)]
+        if len(matching) >= self.quorum:
+            self.mark_stable(checkpoint.seqno, matching)
+        elif len(votes) - len(matching) >= self.quorum:
+            # a quorum of others may agree on another digest
+            digests = collections.Counter(bytes(c.digest)
+                                          for c in votes.values())
+            if digests.most_common(1)[0][1] >= self.quorum:
+                self.fetcher.start() # our state is corrupted
+
+    def mark_stable(self, seqno:Seqno, certificate = []):
+        """Checkpoint seqno is stable, collect what is before it
+
+        pcerts up to seqno are recycled, which frees their messages
+        and requests, the window of seqnos moves forward.
+        """
+        self.last_stable = seqno
+        self.stable_certificate = certificate
+        self.plog.truncate(seqno + 1)
+        self.state.mark_stable(seqno)
+
+        for n in [n for n in self.checkpoints if n <= seqno]:
+            del self.checkpoints[n]
+
+        ahead, self.checkpoints_ahead = self.checkpoints_ahead, dict()
+        for c in ahead.values():
+            if c.seqno > seqno + conf.checkpoint_max_out:
+                self.checkpoints_ahead[c.sender] = c
+            elif c.seqno > seqno:
+                self.add_checkpoint(c)
+
+        if self.principal is self.primary:
+            # the window of new pre_prepares is opened
+            self.new_and_send_pre_prepare()
+
+    def state_fetched(self, checkpoint:Seqno):
+        """State transfer brought the state to checkpoint"""
+        self.last_executed = checkpoint
+        self.last_tentative_execute = checkpoint
+        self.tentative = dict()
+        self.load_replies()
+
+        if checkpoint < self.last_stable:
+            # a new view moved the window past it, see enter_new_view
+            self.fetcher.start()
+            return
+        elif checkpoint > self.last_stable:
+            self.mark_stable(checkpoint)
+        else:
+            self.state.mark_stable(checkpoint)
+
+        self.execute_committed()
+
+    def recv_fetch(self, fetch, peer_principal):
+        """Serve a partition of a checkpoint kept in state"""
+        state = self.state
+        if not fetch.verify(self, peer_principal) or state.is_fetching:
+            return
+        elif (fetch.level >= Partition.level_count
+              or fetch.index >= Partition.children_count ** fetch.level):
+            return
+        elif not state.checkpoint_log:
+            return
+
+        if fetch.checkpoint == Fetch.latest:
+            checkpoint = state.checkpoint_log[-1].seqno
+            last_mod, digest = state.partition_at(checkpoint, fetch.level,
+                                                  fetch.index)
+            reply = MetaDataD.from_replica(self, checkpoint,
+                                           fetch.level, fetch.index,
+                                           last_mod, digest)
+        elif not any(c.seqno == fetch.checkpoint
+                     for c in state.checkpoint_log):
+            return # TODO: log, too old
+        elif fetch.level == Partition.level_count - 1:
+            last_mod, _ = state.partition_at(fetch.checkpoint,
+                                             fetch.level, fetch.index)
+            block = state.page_at(fetch.checkpoint, fetch.index)
+            if block == Partition.zero_block:
+                block = b'' # never written, or zeros
+            reply = Data.from_replica(self, fetch.checkpoint, fetch.index,
+                                      last_mod, bytes(block))
+        else:
+            reply = MetaData.from_replica(
+                self, fetch.checkpoint, fetch.level, fetch.index,
+                state.children_at(fetch.checkpoint, fetch.level,
+                                  fetch.index))
+
+        self.sendto(reply, peer_principal)
+
+    def recv_meta_data(self, meta_data, peer_principal):
+        self.fetcher.recv_meta_data(meta_data)
+
+    def recv_meta_data_d(self, meta_data_d, peer_principal):
+        if meta_data_d.verify(self, peer_principal):
+            self.fetcher.recv_meta_data_d(meta_data_d)
+
+    def recv_data(self, data, peer_principal):
+        self.fetcher.recv_data(data)
 
     def recv_new_key(self, new_key, peer_principal):
-        assert new_key.index == peer_principal.index
+        assert new_key.sender == peer_principal.index
         pp = peer_principal
 
         # firstly, verify signature
-        if not new_key.verify(pp):
+        if not new_key.verify(self, pp):
             print('new_key verification failure: {}'.format(
                 pp.index
             ))
             return
+        elif new_key.reqid == pp.outkey_reqid:
+            return # we hold it, resent on first contact, see below
 
         # secondly, extract outkey
-        outkey = self.principal.decrypt(new_key.hmac_keys[self.index])
+        outkey = (new_key.outkey
+                  or self.principal.decrypt(new_key.hmac_keys[self.index]))
         if not outkey:
             print('new_key outkey failure: {}'.format(
                 pp.index
@@ -159,13 +715,21 @@ class Replica(Node):
             return
 
         # finally, update peer_principal
+        first_contact = pp.outkey_reqid == 0
         pp.outkey = outkey
         pp.outkey_reqid = new_key.reqid
+        if self.verify_cache is not None:
+            self.verify_cache.invalidate(pp, new_key.sender_type)
 
         print_new_key(new_key, pp)
 
+        if (first_contact and new_key.sender_type == 'Replica'
+            and self.last_new_key is not None):
+            # the peer may have missed our new_key when it was down
+            self.sendto(self.last_new_key, pp)
+
     def recv_request(self, request, peer_principal):
-        assert request.index == peer_principal.index
+        assert request.sender == peer_principal.index
         pp = peer_principal
 
         # verify auth
@@ -179,22 +743,20 @@ class Replica(Node):
         # init attributes
         request.pre_prepare = None # pre_prepare it belong
 
-        if (request.sender_type is 'Client'):
+        if (request.sender_type == 'Client'):
             if request.readonly:
-                if not execute_readonly(request):
+                if not self.execute_readonly(request):
                     # if failed, then push to the queue
                     # will try to execute it later
-                    principal = self.client_principals[request.index]
-                    self.ro_requests[principal] = request
-                    self.ro_requests.move_to_end(principal)
+                    self.defer_readonly(pp, request)
 
                 # return regardless of the result
                 return
 
-            # this is a read-write request from client
-            last_reply_reqid = (self.replies[pp].reqid if
-                                pp in self.replies else -1)
-            if last_reply_reqid < request.reqid:
+            # this is a read-write request from client, the client may
+            # have others outstanding, see ReplyCache
+            replies = self.replies.get(pp)
+            if not replies or not replies.is_executed(request.reqid):
                 # firstly, check whether this request is in pre_prepare
                 req = self.plog.get_request(request)
                 if req:
@@ -207,8 +769,8 @@ class Replica(Node):
                     # when pcert.add_pre_prepare
                     # pcert has updated plog.requests
                     assert pcert.pre_prepare
-                    # if prepared, last_reply_reqid >= request.reqid
-                    assert not pcert.is_prepared
+                    # pcert may be prepared or even committed
+                    # when waiting for the command of a big request
 
                     if self.principal is self.primary:
                         if req.change_by_primary(request, self):
@@ -218,7 +780,7 @@ class Replica(Node):
                             dest = []
                             for p in self.replica_principals:
                                 if (p is not self.principal
-                                    and p.index not in pcert.prepares):
+                                    and not pcert.has_prepare(p.index)):
                                     dest.append(p)
                             self.sendto(pcert.pre_prepare, dest)
                         # else:
@@ -226,18 +788,22 @@ class Replica(Node):
                         #         but in fact this should be done by client
                     else:
                         # this is a backup
-                        if req.change_by_backup(request.self):
+                        if req.change_by_backup(request, self):
                             # if req.command is None, then it will be assigned
                             # to request.command, if not, commands should also
                             # be the same, for consensus_digests is the same
                             assert req.command == request.command
+                            pcert.pre_prepare.clear_digests()
 
                             if pcert.is_pre_prepared:
                                 assert pcert.my_prepare
                                 self.sendto(pcert.my_prepare, self.primary)
-                            else if pcert.pre_prepare.is_requests_verified:
+                            elif pcert.pre_prepare.is_requests_verified:
                                 self.new_and_send_prepare(pcert)
 
+                        if pcert.is_committed:
+                            self.execute_committed()
+
                     return
 
                 # if not in pre_prepare, insert into pending queue
@@ -258,13 +824,8 @@ class Replica(Node):
                         insert_index = i
                         break
 
-                if insert_index == len(requests):
-                    request.pre_prepare_candidate = True
-                    if requests:
-                        requests[-1].pre_prepare_candidate = False
-                else:
-                     request.pre_prepare_candidate = False
-
+                # used to measure batch latency
+                request.arrival = self.loop.time()
 
                 requests.insert(insert_index, request)
                 self.rw_requests[pp] = requests
@@ -272,46 +833,75 @@ class Replica(Node):
 
                 if self.principal is self.primary:
                     self.new_and_send_pre_prepare()
-                else if not self.limbo:
-                    send(request, self.primary)
-                    # TODO: view change timer
-
-            elif last_reqid == request.reqid:
-                assert pp in self.replies
-                reply = self.replies.get(pp)
-                reply.view = self.view
-                p = self.find_sender(reply)
-                self.sendto(reply, p)
-
-                # TODO: send reply
+                elif not self.limbo:
+                    self.sendto(request, self.primary)
+                    self.start_view_change_timer()
+
+            elif replies.get(request.reqid):
+                # retransmitted, resend the reply
+                reply = replies.get(request.reqid)
+                committed = (pp, request.reqid) not in self.tentative
+                if ((reply.is_tentative and committed)
+                    or (reply.is_digest and request.reply_with_full)):
+                    # committed since, the client may lack a quorum,
+                    # or asks for full results after a timeout
+                    reply = Reply.from_node(self, request, reply.full_result,
+                                            not committed)
+                    replies.replace(reply)
+                self.sendto(reply, pp)
+
                 # TODO: start view change timer if ...
 
         # TODO: replica request
 
-    def new_and_send_pre_prepare(self):
-        assert self.principal is self.primary
+    @property
+    def pending_count(self):
+        """Count of requests waiting for a pre_prepare"""
+        return sum(len(rs) for rs in self.rw_requests.values())
 
-        if not len(self.rw_requests) or not self.has_new_view:
-            # 1. requests queue should NOT empty
-            # 2. has new view
-            return
+    def new_and_send_pre_prepare(self, timeout = False):
+        """Batch pending requests into new pre_prepares
 
-        new_seqno = self.seqno + 1
-        if not (new_seqno <= self.last_executed + consts.congestion_window
-                and new_seqno <= self.last_stable + checkpoint_max_out):
-            return # window is too narrow
+        batches are cut while they are ready and the window is open.
 
-        self.seqno = new_seqno # use new sequence number
+        :timeout: max wait of the batch expired, cut it even if not full
+        """
+        assert self.principal is self.primary
 
-        pre_prepare = PrePrepare.from_primary(self, False)
+        # 1. requests queue should NOT empty
+        # 2. has new view
+        while len(self.rw_requests) and self.has_new_view:
+            new_seqno = self.seqno + 1
+            if not (new_seqno <= self.last_executed + conf.congestion_window
+                    and (new_seqno
+                         <= self.last_stable + conf.checkpoint_max_out)):
+                return # window is too narrow
+
+            now = self.loop.time()
+            oldest = min(rs[0].arrival for rs in self.rw_requests.values())
+            if (not timeout and not self.batcher.is_ready(self.pending_count,
+                                                          oldest, now)):
+                # wait a little while for more requests
+                self.batch_timer.interval = self.batcher.delay(oldest, now)
+                self.batch_timer.start()
+                return
 
-        # add pre_prepare into plog
-        pcert = self.plog[new_seqno]
-        assert not pcert.pre_prepare
+            self.batch_timer.stop()
+            self.seqno = new_seqno # use new sequence number
+            timeout = False # only the expired batch is cut regardless
 
-        send(pre_prepare, 'ALL_REPLICAS')
-        pre_prepare.mine = True
-        pcert.add_pre_prepare(pre_prepare)
+            pre_prepare = PrePrepare.from_primary(self, False,
+                                                  self.batcher.size,
+                                                  self.batcher.max_bytes)
+            self.batcher.record(pre_prepare, self.pending_count, now)
+
+            # add pre_prepare into plog
+            pcert = self.plog[new_seqno]
+            assert not pcert.pre_prepare
+
+            self.sendto(pre_prepare, 'ALL_REPLICAS')
+            pre_prepare.mine = True
+            pcert.add_pre_prepare(pre_prepare)
 
     def in_proper_view(self, message):
         """
@@ -323,63 +913,63 @@ class Replica(Node):
             and message.view == self.view):
             return True
 
+        # messages beyond our window are not verified yet, state
+        # transfer waits for f + 1 checkpoints, see recv_checkpoint
         # TODO: send_status as negative ack
 
         return False
 
     def recv_pre_prepare(self, pre_prepare, peer_principal):
+        if self.principal is self.primary:
+            # i am the boss! but i may lack a batch of the new view
+            self.recv_chosen_batch(pre_prepare)
+            return
+        elif not self.in_proper_view(pre_prepare):
+            return # TODO: send other messages? like fetch?
+
+        if not self.has_new_view:
+            self.view_changer.defer(pre_prepare)
+            return
+
+        chosen = self.view_changer.chosen.get(pre_prepare.seqno)
+        if chosen and chosen != pre_prepare.consensus_digest:
+            return # TODO: log, not the one of the new view
+
+        pcert = self.plog[pre_prepare.seqno]
         if pcert.pre_prepare:
             # old pre_prepare dominates
-            if (pcert.pre_prepare.view == pre_prepare.view
-                and pcert.pre_prepare.seqno == pre_prepare.seqno
-                and (pcert.pre_prepare.consensus_digest
-                     == pre_prepare.consensus_digest)):
-                pass
+            if (pcert.pre_prepare.consensus_digest
+                != pre_prepare.consensus_digest):
+                return # TODO: log
         elif pre_prepare.verify(self, peer_principal):
             pass
-        elif pcert.prepare_count[pre_prepare.consensus_digest] >= self.f:
+        elif (pcert.prepare_count.get(pre_prepare.consensus_digest, 0)
+              >= self.f):
             # for liveness
             # plus this pre_prepare, we have f + 1 votes
             pass
-        else
+        else:
             return # TODO: log
 
-        if self.principal == self.primary:
-            return # i am the boss!
-        elif not self.in_proper_view(pre_prepare)):
-            return # TODO: send other messages? like fetch?
-
-        if not self.has_new_view:
-            return # TODO: add missing?
+        # requests of a batch are verified together
+        verified = self.verify_messages(pre_prepare.requests)
 
-        pcert = self.plog[pre_prepare.seqno]
         changed = False
         if pcert.pre_prepare:
             for i, r in enumerate(pre_prepare.requests):
-                if r.verify():
+                if verified[i]:
                     req = pcert.pre_prepare.requests[i] # old request
                     # (pcert.pre_prepare.consensus_digest
                     # == pre_prepare.consensus_digest) implies:
                     assert r.consensus_digest == req.consensus_digest
                     if req.change_by_backup(r, self):
+                        pcert.pre_prepare.clear_digests()
                         changed = True
                 # else:
                 #   nothing to be done, just wait for client's request
         else:
             # new verified per_prepare
-            # handle big requests
-            for r in pre_prepare.requests:
-                r.verify()
-                p = self.find_sender(r)
-                if not p:
-                    continue # TODO: error?
-                rs = node.rw_requests.get(p, [])
-                for i, req in enumerate(rs):
-                    if req.reqid == r.reqid:
-                        r.change_by_backup(req, self)
-                        rs.pop(i)
-                        break
-
+            self.take_pending(pre_prepare)
             pcert.add_pre_prepare(pre_prepare)
             changed = True
 
@@ -396,21 +986,44 @@ class Replica(Node):
             if pcert.pre_prepare.is_requests_verified:
                 self.new_and_send_prepare(pcert)
 
+    def take_pending(self, pre_prepare):
+        """Remove requests of pre_prepare from rw_requests
+
+        commands of big requests are taken from the pending ones, so
+        are arrivals, requests not pending arrive now
+        """
+        now = self.loop.time()
+        for r in pre_prepare.requests:
+            r.arrival = now
+            p = self.find_sender(r)
+            if not p:
+                continue # TODO: error?
+            rs = self.rw_requests.get(p, [])
+            for i, req in enumerate(rs):
+                if req.reqid == r.reqid:
+                    if r.change_by_backup(req, self):
+                        pre_prepare.clear_digests()
+                    r.arrival = req.arrival
+                    rs.pop(i)
+                    break
+            if not rs:
+                self.rw_requests.pop(p, None)
+
     def new_and_send_prepare(self, pcert):
         """
         """
         pre_prepare = pcert.pre_prepare
 
-        assert pre_prepare and pre_prepare.is_requests_verified:
+        assert pre_prepare and pre_prepare.is_requests_verified
         assert not pcert.is_pre_prepared # not pcert.my_prepare
 
-        prepare = Prepare.from_backup(self, pre_prepare,
+        prepare = Prepare.from_backup(self,
                                       pre_prepare.view, pre_prepare.seqno,
                                       False,
                                       pre_prepare.consensus_digest)
 
         self.sendto(prepare, 'ALL_REPLICAS')
-        changed = pcert.add_prepare(prepare):
+        changed = pcert.add_prepare(prepare)
         assert changed
 
         if pcert.is_prepared:
@@ -423,11 +1036,12 @@ class Replica(Node):
         elif not self.in_proper_view(prepare):
             return # TODO: send other messages? like fetch?
         elif not self.has_new_view:
-            return # TODO: add missing?
+            self.view_changer.defer(prepare)
+            return
 
         pcert = self.plog[prepare.seqno]
         prepared = pcert.is_prepared
-        if pcert.add_prepare(preprare):
+        if pcert.add_prepare(prepare):
             # received a valid vote
             if not prepared and pcert.is_prepared:
                 # this is the key note
@@ -435,9 +1049,10 @@ class Replica(Node):
 
     def new_and_send_commit(self, pcert):
         assert pcert.is_prepared # count of prepare == 2f
-        assert self.index not in pcert.commits
+        assert not pcert.has_commit(self.index)
 
         pre_prepare = pcert.pre_prepare
+        pcert.last_prepared = pre_prepare
         commit = Commit.from_replica(self, pre_prepare.view,
                                      pre_prepare.seqno)
 
@@ -450,13 +1065,14 @@ class Replica(Node):
         else:
             self.execute_prepared()
 
-    def recv_commit(self. commit, peer_principal):
+    def recv_commit(self, commit, peer_principal):
         if not commit.verify(self, peer_principal):
             return
         elif not self.in_proper_view(commit):
             return # TODO: send other messages? like fetch?
         elif not self.has_new_view:
-            return # TODO: add missing?
+            self.view_changer.defer(commit)
+            return
 
         # what if i am primary and received a commit
         # for non-existant pre_prepare ?
@@ -467,8 +1083,69 @@ class Replica(Node):
             if not committed and pcert.is_committed:
                 self.execute_committed()
 
-    def notify(self, task:Task):
-        self.loop.create_task(self.task_queue.put(task))
+    def datagram_received(self, data:bytes, addr):
+        """Collect datagrams of this loop iteration, see dispatch_inbox"""
+        self.received_datagrams += 1
+        self.recv_syscalls += 1 # recvfrom of the transport
+        self.inbox.append((data, addr))
+        if not self.dispatch_handle:
+            self.dispatch_handle = self.loop.call_soon(self.dispatch_inbox)
+
+    def start_bulk_recv(self):
+        """Read datagrams by recvmmsg instead of the transport
+
+        add_reader refuses fds of transports, the reader is replaced
+        by _add_reader of selector loops, as the transport itself does.
+        the transport removes our reader when it is closed.
+        """
+        bulk = self.bulk_socket
+        # the public loop.add_reader raises RuntimeError for an fd used
+        # by a transport, so it cannot be used here. _add_reader is
+        # what the selector transport registers its own reader with,
+        # other loops lack it and the transport keeps reading
+        add_reader = getattr(self.loop, '_add_reader', None)
+        if not bulk or not add_reader:
+            return
+
+        self.transport.pause_reading()
+        add_reader(bulk.fd, self.bulk_read_ready)
+
+    def bulk_read_ready(self):
+        try:
+            datagrams = self.bulk_socket.recv()
+        except OSError as exc:
+            self.protocol.error_received(exc)
+            return
+
+        self.recv_syscalls += 1
+        self.received_datagrams += len(datagrams)
+        self.inbox.extend(datagrams)
+        if datagrams and not self.dispatch_handle:
+            self.dispatch_handle = self.loop.call_soon(self.dispatch_inbox)
+
+    def dispatch_inbox(self):
+        """Parse and dispatch all datagrams received since the last call"""
+        self.dispatch_handle = None
+        inbox, self.inbox = self.inbox, []
+
+        messages = []
+        for data, addr in inbox:
+            message = self.parse_frame(data, addr)
+            if message:
+                messages.append(message)
+            else:
+                print('invalid frame from: {}'.format(addr))
+
+        # authenticators of the batch are checked together,
+        # signatures are left to recv_message
+        self.verify_messages([m for m in messages
+                              if m.authenticator(self) is not None])
+
+        for message in messages:
+            self.recv_message(message)
+
+        self.dispatch_count += len(inbox)
+        self.dispatch_batch_count += 1
 
     def recv_message(self, message):
         try:
@@ -478,7 +1155,21 @@ class Replica(Node):
             if not principal:
                 raise ValueError('no valid principal')
 
-            receiver(message, principal)
+            if self.crypto and self.unverified_signatures(message):
+                # resumed when the crypto service is done
+                self.loop.create_task(
+                    self.recv_after_crypto(message, principal, receiver))
+            else:
+                receiver(message, principal)
+        except:
+            traceback.print_exc() # TODO: log
+
+    async def recv_after_crypto(self, message, principal, receiver):
+        try:
+            if await self.run_crypto(message):
+                receiver(message, principal)
+            else:
+                print('crypto failure: {}'.format(message)) # TODO: log
         except:
             traceback.print_exc() # TODO: log
 
@@ -494,7 +1185,7 @@ class Replica(Node):
             message = self.parse_frame(data, addr)
             if message:
                 self.recv_message(message)
-            else
+            else:
                 print('invalid frame from: {}'.format(addr))
 
         elif task.type == TaskType.PEER_ERR:
@@ -515,12 +1206,20 @@ class Replica(Node):
             self.loop.run_until_complete(self.listen))
         task = self.loop.run_until_complete(self.fetch())
         assert task.type == TaskType.CONN_MADE
+        self.start_bulk_recv()
 
         # start auth_timer
         self.auth_timer_handler()
 
         try:
+            # datagrams are dispatched by dispatch_inbox while
+            # waiting here, the queue only has connection events
             while True:
                 self.loop.run_until_complete(self.fetch_and_handle())
-        except:
+        except Exception:
+            # SystemExit and KeyboardInterrupt, e.g. on SIGTERM, are
+            # no errors and pass through
             traceback.print_exc()
+        finally:
+            if self.crypto:
+                self.crypto.close()
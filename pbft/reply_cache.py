@@ -0,0 +1,73 @@
+import collections
+import struct
+
+class ReplyCache():
+    """Replies to the last requests of a client, by reqid
+
+    a pipelined client has requests of up to conf.client_window reqids
+    outstanding, they may be executed in any order. replies of the last
+    size executed ones are kept to be sent again, reqids up to low were
+    executed and their replies dropped.
+
+    which reqids are executed is part of the state, see pack and load,
+    so that replicas agree on duplicates after a state transfer.
+    """
+    __slots__ = ('size', 'replies', 'low')
+
+    def __init__(self, size:int):
+        self.size = size
+        self.replies = collections.OrderedDict() # reqid -> reply
+        self.low = -1
+
+    def __len__(self):
+        return len(self.replies)
+
+    def get(self, reqid):
+        """Reply to reqid, None if not kept, e.g. after a state transfer"""
+        return self.replies.get(reqid)
+
+    def is_executed(self, reqid) -> bool:
+        return reqid <= self.low or reqid in self.replies
+
+    def add(self, reply) -> tuple:
+        """Keep reply, return what undoes it, see remove"""
+        self.replies[reply.reqid] = reply
+
+        dropped = []
+        while len(self.replies) > self.size:
+            dropped.append(self.replies.popitem(last = False))
+
+        undo = (self.low, dropped)
+        for reqid, _ in dropped:
+            self.low = max(self.low, reqid)
+        return undo
+
+    def replace(self, reply):
+        """Reply again to an executed request, e.g. once committed"""
+        assert reply.reqid in self.replies
+        self.replies[reply.reqid] = reply
+
+    def remove(self, reqid, undo:tuple):
+        """Undo add of the reply to reqid, the last added goes first"""
+        low, dropped = undo
+        self.replies.pop(reqid, None)
+        for reqid, reply in reversed(dropped):
+            self.replies[reqid] = reply
+            self.replies.move_to_end(reqid, last = False)
+        self.low = low
+
+    header = struct.Struct('<qH') # low + 1, count of reqids
+
+    def pack(self) -> bytes:
+        """Executed reqids, zero bytes when none is"""
+        return (self.header.pack(self.low + 1, len(self.replies))
+                + struct.pack('<%dq' % len(self.replies), *self.replies))
+
+    def load(self, block:bytes):
+        """Executed reqids from pack, replies of other ones are dropped"""
+        low, count = self.header.unpack_from(block)
+        reqids = struct.unpack_from('<%dq' % count, block,
+                                    self.header.size)
+        self.replies = collections.OrderedDict(
+            (reqid, self.replies.get(reqid)) for reqid in reqids)
+        self.low = low - 1
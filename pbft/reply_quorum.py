@@ -0,0 +1,98 @@
+class Tally():
+    """Replicas which replied the same reply_digest to a request"""
+    __slots__ = ('repliers', 'result')
+
+    def __init__(self):
+        self.repliers = dict() # sender -> (tentative, view)
+        self.result = None # full result, once a reply carries it
+
+    def view(self, f:int):
+        """Highest view f + 1 of the repliers are in"""
+        views = sorted((v for _, v in self.repliers.values()), reverse = True)
+        return views[f]
+
+class ReplyQuorum():
+    """Replies to outstanding requests, counted by (reqid, reply_digest)
+
+    each replica has one vote per request, a later reply replaces it,
+    e.g. a committed reply the tentative one. a request is decided by
+    f + 1 matching committed replies, or 2f + 1 matching ones if some
+    are tentative or the request is readonly, once one of them carries
+    the full result. requests are opened when sent and closed when
+    decided or given up. replies to other ones are dropped, so memory
+    is bounded by the window of the client.
+    """
+    __slots__ = ('f', 'votes', 'readonly', 'tallies')
+
+    def __init__(self, f:int):
+        self.f = f
+        # reqid -> {sender: (reply_digest, tentative, view)}
+        self.votes = dict()
+        self.readonly = set() # reqids of readonly requests
+        self.tallies = dict() # (reqid, reply_digest) -> Tally
+
+    def __len__(self):
+        return len(self.votes)
+
+    def open(self, reqid, readonly:bool = False):
+        self.votes[reqid] = dict()
+        if readonly:
+            self.readonly.add(reqid)
+
+    def close(self, reqid):
+        for digest, _, _ in self.votes.pop(reqid, {}).values():
+            self.tallies.pop((reqid, digest), None)
+        self.readonly.discard(reqid)
+
+    def is_duplicate(self, reply) -> bool:
+        """reply adds nothing, it needs no verification
+
+        replies to requests not open (late ones) or which repeat the
+        vote of their sender
+        """
+        votes = self.votes.get(reply.reqid)
+        if votes is None:
+            return True
+
+        vote = votes.get(reply.sender)
+        if (not vote or vote[1] != self.is_tentative(reply)
+            or vote[2] != reply.view):
+            return False
+        elif reply.is_digest:
+            return vote[0] == bytes(reply.result)
+        # a full result may complete a tally of digests
+        tally = self.tallies.get((reply.reqid, vote[0]))
+        return tally.result is not None and tally.result == reply.result
+
+    def is_tentative(self, reply) -> bool:
+        return reply.is_tentative or reply.reqid in self.readonly
+
+    def add(self, reply):
+        """Count a verified reply, return its Tally if it decides"""
+        votes = self.votes.get(reply.reqid)
+        if votes is None:
+            return None
+
+        digest = reply.reply_digest
+        tentative = self.is_tentative(reply)
+        last = votes.get(reply.sender)
+        if last and last[0] != digest:
+            tally = self.tallies[(reply.reqid, last[0])]
+            del tally.repliers[reply.sender]
+            if not tally.repliers:
+                del self.tallies[(reply.reqid, last[0])]
+        votes[reply.sender] = (digest, tentative, reply.view)
+
+        tally = self.tallies.get((reply.reqid, digest))
+        if not tally:
+            tally = self.tallies[(reply.reqid, digest)] = Tally()
+        tally.repliers[reply.sender] = (tentative, reply.view)
+        if not reply.is_digest:
+            tally.result = bytes(reply.result)
+
+        committed = sum(1 for t, _ in tally.repliers.values() if not t)
+        if ((len(tally.repliers) >= 2 * self.f + 1
+             or committed >= self.f + 1)
+            and tally.result is not None):
+            return tally
+        return None
@@ -0,0 +1,43 @@
+from .basic import Seqno
+
+class Snapshot():
+    """What the state held at checkpoint seqno and was modified since
+
+    copy on write: a page is copied before its first modification after
+    the checkpoint, digest and last_mod_checkpoint of a partition before
+    they are updated at the next checkpoint. Everything else is shared
+    with the live state and newer checkpoints.
+    """
+
+    __slots__ = ('seqno', 'digest', 'pages', 'partitions')
+
+    def __init__(self, seqno:Seqno, digest:bytes):
+        self.seqno = seqno
+        self.digest = digest
+
+        self.pages = {} # leaf index => bytes, None if never written
+        self.partitions = {} # (level, index) => (last_mod_checkpoint, digest)
+
+    def save_page(self, index:int, block:bytes):
+        if index not in self.pages:
+            self.pages[index] = block
+
+    def save_partition(self, p):
+        key = (p.level, p.index)
+        if key not in self.partitions:
+            self.partitions[key] = (p.last_mod_checkpoint, p.digest)
+
+    @property
+    def size(self) -> int:
+        """Bytes of pages and digests copied for this checkpoint"""
+        return (sum(len(b) for b in self.pages.values() if b)
+                + sum(len(d) for _, d in self.partitions.values() if d))
+
+    @property
+    def stats(self):
+        return {
+            'seqno': self.seqno,
+            'pages': len(self.pages),
+            'partitions': len(self.partitions),
+            'bytes': self.size,
+        }
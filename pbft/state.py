@@ -1,49 +1,323 @@
-from .log import Log
+from concurrent.futures import ThreadPoolExecutor
+
+from .basic import Configuration as conf
+from .basic import Seqno
+from .snapshot import Snapshot
+from .pages import Pages
 from .partition import Partition
 
+class Leaves():
+    """Leaf partitions, materialized on first access
+
+    leaves never accessed have no object, their blocks are zero and
+    their digests are Partition.zero_digest.
+    """
+
+    def __init__(self, pages:Pages):
+        self.pages = pages
+        self.partitions = {} # index => Partition
+        # indices of parents with materialized leaves
+        self.parents = set()
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __getitem__(self, index:int) -> Partition:
+        p = self.partitions.get(index)
+        if p is None:
+            if not 0 <= index < len(self.pages):
+                raise IndexError(index)
+            p = Partition(level = Partition.level_count - 1, index = index,
+                          last_mod_checkpoint = 0, pages = self.pages)
+            self.partitions[index] = p
+            self.parents.add(index // Partition.children_count)
+        return p
+
+    def get(self, index:int) -> Partition:
+        """Leaf index if materialized, else None"""
+        return self.partitions.get(index)
+
+    def materialized(self):
+        return self.partitions.values()
+
 class State():
-    def __init__(self):
+    def __init__(self, path:str = None,
+                 digest_workers:int = conf.digest_workers,
+                 checkpoint_log_size:int = conf.checkpoint_log_size):
+        """State
+
+        path: file backing the pages, anonymous memory if None
+        digest_workers: threads hashing each level, 1 for serial
+        checkpoint_log_size: checkpoints kept to read or roll back to
+        """
 
         self.total_size = 0
 
         self.partition_tree =  []
-        # initialize partition tree
-        for l in range(Partition.level_count):
+        # initialize partition tree, leaves are created on demand
+        for l in range(Partition.level_count - 1):
             ps = [Partition(level = l, index = i,
                             last_mod_checkpoint = 0)
                   for i in range(Partition.children_count ** l)]
             self.partition_tree.append(ps)
 
+        self.pages = Pages(Partition.children_count ** (Partition.level_count - 1),
+                           Partition.block_size, path)
+        self.partition_tree.append(Leaves(self.pages))
+
+        # indices of leaves modified since the last checkpoint
+        self.dirty = set()
+
         self.last_stable_checkpoint = Seqno(0)
-        # TODO: self.checkpoint_log = []
+
+        # snapshots of recent checkpoints, oldest first
+        self.checkpoint_log = []
+        self.checkpoint_log_size = checkpoint_log_size
 
         self.is_checking = False
         self.is_fetching = False
-    
+
+        self.digest_workers = digest_workers
+        # created on the first parallel digest
+        self.digest_executor = None
+
+    @property
+    def leaves(self):
+        return self.partition_tree[-1]
+
+    @property
+    def digest(self):
+        """Digest of the whole state, None before the first checkpoint"""
+        return self.partition_tree[0][0].digest
+
+    def copy_on_write(self, index:int):
+        """Save page index to the last checkpoint before it is modified"""
+        if index in self.dirty or not self.checkpoint_log:
+            return
+
+        block = (bytes(self.pages.read(index))
+                 if self.pages.is_allocated(index) else None)
+        self.checkpoint_log[-1].save_page(index, block)
+
+    def set_block(self, index:int, block:bytes):
+        """Replace the page of leaf index"""
+        assert len(block) <= Partition.block_size
+        self.copy_on_write(index)
+        self.leaves[index].block = block
+        self.dirty.add(index)
+
+    def page(self, index:int) -> memoryview:
+        """Writable view of the page of leaf index for execution
+
+        the page is dirty until the next checkpoint.
+        """
+        self.leaves[index]
+        self.copy_on_write(index)
+        self.dirty.add(index)
+        return self.pages.page(index)
+
+    def read_page(self, index:int):
+        """Read only view of the page of leaf index, no copy"""
+        return self.leaves[index].block
+
+    def leaf_digest(self, index:int) -> bytes:
+        p = self.leaves.get(index)
+        if p is None or p.digest is None:
+            return Partition.zero_digest
+        return p.digest
+
+    def modify(self, offset:int, size:int):
+        """Pages in [offset, offset + size) are about to be modified"""
+        if size <= 0:
+            return
+
+        first = offset // Partition.block_size
+        last = (offset + size - 1) // Partition.block_size
+        for i in range(first, last + 1):
+            self.copy_on_write(i)
+            self.dirty.add(i)
+
+    def children_digests(self, level:int, index:int) -> bytes:
+        cbi = index * Partition.children_count
+        cei = cbi + Partition.children_count
+        if level + 1 == len(self.partition_tree) - 1:
+            if index not in self.leaves.parents:
+                return Partition.zero_digest * Partition.children_count
+            return b''.join(self.leaf_digest(i) for i in range(cbi, cei))
+
+        children = self.partition_tree[level + 1][cbi:cei]
+        return b''.join(c.digest for c in children)
+
+    def compute_digests(self, level:int, partitions) -> list:
+        """Digests of partitions at level, their children are up to date"""
+        if level == len(self.partition_tree) - 1:
+            return [p.compute_digest(p.block) for p in partitions]
+
+        return [p.compute_digest(self.children_digests(level, p.index))
+                for p in partitions]
+
+    def digest_level(self, level:int, partitions):
+        """Set digests of partitions at level, in parallel if configured
+
+        partitions are split into one chunk per worker, the digests are
+        the same as computed serially.
+        """
+        partitions = list(partitions)
+        workers = self.digest_workers
+        if workers <= 1 or len(partitions) < workers * 2:
+            digests = self.compute_digests(level, partitions)
+        else:
+            if not self.digest_executor:
+                self.digest_executor = ThreadPoolExecutor(workers)
+
+            size = -(-len(partitions) // workers) # ceil
+            futures = [self.digest_executor.submit(
+                self.compute_digests, level, partitions[i:i + size])
+                       for i in range(0, len(partitions), size)]
+            digests = [d for f in futures for d in f.result()]
+
+        for p, digest in zip(partitions, digests):
+            p.digest = digest
+
     def compute_full_digest(self):
         """Initialize state
         """
 
-        # handle leaves first
-        for p in self.partition_tree[-1]:
-            p.digest = p.compute_digest(p.block)
+        # handle leaves first, others are zero_digest
+        self.digest_level(len(self.partition_tree) - 1,
+                          self.leaves.materialized())
 
         # handle non-leaves
         for psi in range(len(self.partition_tree) - 2, -1, -1):
-            for pi, p in enumerate(self.partition_tree[psi]):
-                assert pi == p.index
+            self.digest_level(psi, self.partition_tree[psi])
 
-                sums = b''
-                cbi = pi * Partition.children_count
-                cei = cbi + Partition.children_count
-                for c in self.partition_tree[psi + 1][cbi:cei]:
-                    sums += c.digest
-                p.digest = p.compute_digest(sums)
-
-        # TODO: update self.checkpint_log
+        self.dirty.clear()
 
     def update_partition_tree(self, n:Seqno):
-        pass
-        
-    def checkpoint(self):
-        pass
+        """Digest pages modified since the last checkpoint
+
+        dirty leaves and their ancestors are marked as modified at
+        checkpoint n and only they are rehashed, partitions with an
+        older last_mod_checkpoint are clean and keep their digests.
+        """
+        if self.digest is None:
+            for i in self.dirty:
+                self.leaves[i].last_mod_checkpoint = n
+            self.compute_full_digest()
+            return
+
+        last = self.checkpoint_log[-1] if self.checkpoint_log else None
+        dirty = self.dirty
+        for level in range(len(self.partition_tree) - 1, -1, -1):
+            ps = self.partition_tree[level]
+            parents = set()
+            modified = []
+            for i in sorted(dirty):
+                p = ps[i] # materialize modified leaves
+                if last:
+                    last.save_partition(p)
+                p.last_mod_checkpoint = n
+                modified.append(p)
+                parents.add(i // Partition.children_count)
+            self.digest_level(level, modified)
+            dirty = parents
+
+        self.dirty = set()
+
+    def checkpoint(self, n:Seqno) -> bytes:
+        """Bring digests up to checkpoint n, return the state digest
+
+        n is kept in checkpoint_log, the oldest one is dropped when full.
+        """
+        self.update_partition_tree(n)
+
+        self.checkpoint_log.append(Snapshot(n, self.digest))
+        if len(self.checkpoint_log) > self.checkpoint_log_size:
+            self.checkpoint_log.pop(0)
+
+        return self.digest
+
+    def checkpoints_since(self, n:Seqno) -> list:
+        """Checkpoints from n on, n must be in checkpoint_log"""
+        for i, c in enumerate(self.checkpoint_log):
+            if c.seqno == n:
+                return self.checkpoint_log[i:]
+        raise KeyError(n)
+
+    def partition_at(self, n:Seqno, level:int, index:int):
+        """(last_mod_checkpoint, digest) of a partition at checkpoint n
+
+        the value at n was saved by the first checkpoint from n on
+        after which the partition was modified, if any.
+        """
+        key = (level, index)
+        for c in self.checkpoints_since(n):
+            if key in c.partitions:
+                last_mod, digest = c.partitions[key]
+                break
+        else:
+            p = (self.leaves.get(index) if level == len(self.partition_tree) - 1
+                 else self.partition_tree[level][index])
+            last_mod = p.last_mod_checkpoint if p else 0
+            digest = p.digest if p else None
+
+        if digest is None and level == len(self.partition_tree) - 1:
+            digest = Partition.zero_digest
+        return last_mod, digest
+
+    def children_at(self, n:Seqno, level:int, index:int) -> list:
+        """[(last_mod_checkpoint, digest)] of children at checkpoint n"""
+        first = index * Partition.children_count
+        return [self.partition_at(n, level + 1, i)
+                for i in range(first, first + Partition.children_count)]
+
+    def page_at(self, n:Seqno, index:int):
+        """Page of leaf index at checkpoint n, no copy if not modified"""
+        for c in self.checkpoints_since(n):
+            if index in c.pages:
+                return c.pages[index] or Partition.zero_block
+        return self.read_page(index)
+
+    def rollback(self, n:Seqno):
+        """Restore pages and partitions to checkpoint n
+
+        checkpoints after n are dropped, so are modifications since n.
+        """
+        since = self.checkpoints_since(n)
+
+        pages, partitions = {}, {}
+        for c in reversed(since): # values saved by the oldest win
+            pages.update(c.pages)
+            partitions.update(c.partitions)
+
+        for i, block in pages.items():
+            if block is None:
+                self.pages.free(i)
+            else:
+                self.pages.write(i, block)
+
+        for (level, index), (last_mod, digest) in partitions.items():
+            p = self.partition_tree[level][index]
+            p.last_mod_checkpoint = last_mod
+            p.digest = digest
+
+        del self.checkpoint_log[len(self.checkpoint_log) - len(since) + 1:]
+        since[0].pages.clear()
+        since[0].partitions.clear()
+        self.dirty = set()
+
+    def mark_stable(self, n:Seqno):
+        """Checkpoint n is stable, older ones are no longer needed"""
+        self.last_stable_checkpoint = n
+        self.checkpoint_log = [c for c in self.checkpoint_log
+                               if c.seqno >= n]
+
+    @property
+    def checkpoint_stats(self):
+        return [c.stats for c in self.checkpoint_log]
+
+    def close(self):
+        if self.digest_executor:
+            self.digest_executor.shutdown()
+            self.digest_executor = None
+        self.pages.close()
@@ -0,0 +1,301 @@
+import collections
+
+from .basic import Seqno, Configuration as conf
+from .snapshot import Snapshot
+from .message import Fetch, MetaData
+from .partition import Partition
+from .timer import Timer
+
+class Fetcher():
+    """State transfer of a lagging replica, top down the partition tree
+
+    1. the root at Fetch.latest is asked from all replicas, f + 1
+       matching MetaDataD make their checkpoint the target
+    2. interior partitions are fetched as MetaData, children whose
+       digests differ from ours are fetched in turn
+    3. differing leaves are fetched as Data and written into the state
+
+    replies are checked against digests already trusted, so they need
+    no authentication. fetches go to replicas round robin, bounded by
+    max_bytes of replies in flight, and go to the next replica when
+    not answered within timeout.
+    """
+
+    def __init__(self, replica,
+                 max_bytes:int = conf.fetch_max_bytes,
+                 timeout:float = conf.fetch_timeout):
+        self.replica = replica
+        self.state = replica.state
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.timer = Timer(timeout, self.timer_handler, replica.loop)
+
+        self.reset()
+
+        self.fetch_count = 0
+        self.retransmit_count = 0
+        self.meta_data_count = 0
+        self.data_count = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.started = None
+        self.elapsed = None
+
+    def reset(self):
+        # (checkpoint, last_mod_checkpoint, digest) of the root
+        self.target = None
+        self.votes = {} # target => {sender}
+
+        # (level, index) => (last_mod_checkpoint, digest), trusted
+        self.expected = {}
+        # (level, index) => count of children not fetched yet
+        self.waiting = {}
+
+        self.queue = collections.deque() # (level, index) to fetch
+        self.in_flight = {} # (level, index) => (replier, sent at, bytes)
+        self.bytes_in_flight = 0
+        self.next_replier = 0
+
+    @property
+    def leaf_level(self):
+        return Partition.level_count - 1
+
+    def start(self):
+        """Fetch the latest checkpoint of other replicas"""
+        state = self.state
+        if state.is_fetching:
+            return
+
+        # modifications after the last checkpoint are not in any
+        # checkpoint of others, thus cannot be compared
+        if state.checkpoint_log:
+            state.rollback(state.checkpoint_log[-1].seqno)
+        elif state.digest is None:
+            state.compute_full_digest()
+
+        self.reset()
+        state.is_fetching = True
+        self.started = self.replica.loop.time()
+        self.elapsed = None
+
+        self.send_latest()
+        self.timer.restart()
+
+    def send_latest(self):
+        fetch = Fetch.from_replica(self.replica, 0, 0, Fetch.latest)
+        self.replica.sendto(fetch, 'ALL_REPLICAS')
+        self.fetch_count += 1
+        self.sent_bytes += len(fetch) * (self.replica.n - 1)
+
+    def recv_meta_data_d(self, meta_data_d):
+        """A vote for the target, meta_data_d is verified"""
+        if not self.state.is_fetching or self.target:
+            return
+        elif meta_data_d.level or meta_data_d.index:
+            return
+
+        self.received_bytes += len(meta_data_d)
+        target = (meta_data_d.checkpoint, meta_data_d.last_mod,
+                  bytes(meta_data_d.digest))
+        voters = self.votes.setdefault(target, set())
+        voters.add(meta_data_d.sender)
+        if len(voters) <= self.replica.f:
+            return
+
+        self.target = target
+        self.votes = {}
+        self.expected[(0, 0)] = (target[1], target[2])
+        if self.current(0, 0) == self.expected[(0, 0)]:
+            self.finish() # nothing differs
+            return
+
+        self.queue.append((0, 0))
+        self.pump()
+
+    def current(self, level:int, index:int):
+        """(last_mod_checkpoint, digest) of our partition"""
+        if level == self.leaf_level:
+            leaf = self.state.leaves.get(index)
+            return (leaf.last_mod_checkpoint if leaf else 0,
+                    self.state.leaf_digest(index))
+
+        p = self.state.partition_tree[level][index]
+        return p.last_mod_checkpoint, p.digest
+
+    def reply_size(self, level:int) -> int:
+        if level == self.leaf_level:
+            return Partition.block_size
+        return Partition.children_count * MetaData.child_size
+
+    def pump(self):
+        """Send queued fetches while bytes in flight allow"""
+        while self.queue:
+            level, index = self.queue[0]
+            size = self.reply_size(level)
+            if (self.in_flight
+                and self.bytes_in_flight + size > self.max_bytes):
+                break
+
+            self.queue.popleft()
+            self.send_fetch(level, index, size)
+
+    def send_fetch(self, level:int, index:int, size:int):
+        replica = self.replica
+        principals = [p for p in replica.replica_principals
+                      if p is not replica.principal]
+        replier = principals[self.next_replier % len(principals)]
+        self.next_replier += 1
+
+        fetch = Fetch.from_replica(replica, level, index, self.target[0])
+        replica.sendto(fetch, replier)
+
+        self.in_flight[(level, index)] = (replier, replica.loop.time(), size)
+        self.bytes_in_flight += size
+        self.fetch_count += 1
+        self.sent_bytes += len(fetch)
+
+    def answered(self, message, key) -> bool:
+        """message answers the fetch of key in flight"""
+        if (not self.state.is_fetching or not self.target
+            or message.checkpoint != self.target[0]):
+            return False
+
+        flight = self.in_flight.get(key)
+        return bool(flight) and flight[0].index == message.sender
+
+    def land(self, message, key):
+        _, _, size = self.in_flight.pop(key)
+        self.bytes_in_flight -= size
+        self.received_bytes += len(message)
+
+    def recv_meta_data(self, meta_data):
+        key = (meta_data.level, meta_data.index)
+        if key[0] >= self.leaf_level or not self.answered(meta_data, key):
+            return
+
+        try:
+            children = meta_data.unpack_children()
+        except ValueError:
+            return
+        if len(children) != Partition.children_count:
+            return
+
+        # children must hash to the digest we trust
+        last_mod, digest = self.expected[key]
+        p = Partition(key[0], key[1], last_mod)
+        if p.compute_digest(b''.join(d for _, d in children)) != digest:
+            return # TODO: log, it is fetched again after timeout
+
+        self.land(meta_data, key)
+        self.meta_data_count += 1
+
+        first = key[1] * Partition.children_count
+        differing = 0
+        for i, child in enumerate(children):
+            child_key = (key[0] + 1, first + i)
+            if self.current(*child_key) == child:
+                continue
+
+            self.expected[child_key] = child
+            self.queue.append(child_key)
+            differing += 1
+
+        self.waiting[key] = differing
+        if not differing:
+            self.complete(key)
+        self.pump()
+
+    def recv_data(self, data):
+        key = (self.leaf_level, data.index)
+        if not self.answered(data, key):
+            return
+
+        last_mod, digest = self.expected[key]
+        block = data.block if len(data.block) else Partition.zero_block
+        if data.last_mod != last_mod or len(block) != Partition.block_size:
+            return
+
+        leaf = Partition(key[0], key[1], last_mod)
+        if leaf.compute_digest(block) != digest:
+            return # TODO: log, it is fetched again after timeout
+
+        self.land(data, key)
+        self.data_count += 1
+
+        pages = self.state.pages
+        if len(data.block):
+            pages.write(data.index, data.block)
+        else:
+            pages.free(data.index)
+
+        leaf = self.state.leaves[data.index]
+        leaf.last_mod_checkpoint = last_mod
+        leaf.digest = digest
+
+        self.complete(key)
+        self.pump()
+
+    def complete(self, key):
+        """key and all of its children are fetched, up to the root"""
+        while True:
+            level, index = key
+            last_mod, digest = self.expected.pop(key)
+            self.waiting.pop(key, None)
+            if level < self.leaf_level:
+                p = self.state.partition_tree[level][index]
+                p.last_mod_checkpoint = last_mod
+                p.digest = digest
+
+            if level == 0:
+                self.finish()
+                return
+
+            key = (level - 1, index // Partition.children_count)
+            self.waiting[key] -= 1
+            if self.waiting[key]:
+                return
+
+    def finish(self):
+        state = self.state
+        checkpoint, _, digest = self.target
+        assert state.digest == digest
+
+        state.checkpoint_log = [Snapshot(checkpoint, digest)]
+        state.dirty = set()
+        state.is_fetching = False
+
+        self.timer.stop()
+        self.elapsed = self.replica.loop.time() - self.started
+        self.replica.state_fetched(Seqno(checkpoint))
+
+    def timer_handler(self, _task = None):
+        if not self.state.is_fetching:
+            return
+
+        if not self.target:
+            self.send_latest()
+        else:
+            now = self.replica.loop.time()
+            for key, (_, sent, size) in list(self.in_flight.items()):
+                if now - sent >= self.timeout:
+                    del self.in_flight[key]
+                    self.bytes_in_flight -= size
+                    self.queue.appendleft(key)
+                    self.retransmit_count += 1
+            self.pump()
+
+        self.timer.restart()
+
+    @property
+    def stats(self):
+        return {
+            'fetching': self.state.is_fetching,
+            'target': self.target[0] if self.target else None,
+            'fetch_count': self.fetch_count,
+            'retransmit_count': self.retransmit_count,
+            'meta_data_count': self.meta_data_count,
+            'data_count': self.data_count,
+            'sent_bytes': self.sent_bytes,
+            'received_bytes': self.received_bytes,
+            'elapsed': self.elapsed,
+        }
@@ -1,7 +1,7 @@
 from datetime import datetime
 import math
 
-from .types import Reqid, TaskType, Task
+from .basic import Reqid, TaskType, Task
 
 def utcnow_ts():
     return datetime.utcnow().timestamp()
@@ -12,7 +12,7 @@ def utcnow_reqid():
 def print_new_key(new_key, pp):
     if __debug__:
         print('new_key <{}:{}> updated:\n{}\n{}'.format(
-            new_key.node_type, new_key.index, pp.inkey, pp.outkey))
+            new_key.sender_type, new_key.sender, pp.inkey, pp.outkey))
 
 def print_task(task):
     if __debug__:
@@ -0,0 +1,68 @@
+import collections
+
+class VerifyCache():
+    """Bounded LRU of positive verification results
+
+    A request is verified when it arrives from the client, again in a
+    pre_prepare and again on retransmits, the same content from the same
+    sender is verified once while the key stays the same.
+
+    key: (sender_type, sender, key epoch, content_digest), the epoch of
+    the sender principal changes with its inkey/outkey, thus entries
+    under an old key never hit again.
+    """
+
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict() # key => None
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, message, principal):
+        if getattr(message, 'use_signature', False):
+            epoch = 0 # public keys never change
+        else:
+            epoch = principal.key_epoch
+
+        return (message.sender_type, principal.index, epoch,
+                bytes(message.content_digest))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, message, principal) -> bool:
+        key = self.key(message, principal)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, message, principal):
+        key = self.key(message, principal)
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+
+    def invalidate(self, principal, sender_type:str):
+        """Drop entries of principal under its old keys"""
+        stale = [k for k in self.entries
+                 if k[0] == sender_type and k[1] == principal.index
+                 and k[2] and k[2] != principal.key_epoch]
+        for k in stale:
+            del self.entries[k]
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,410 @@
+import collections
+import hashlib
+
+from .basic import Seqno, View, Configuration as conf
+from .message import ViewChange, ViewChangeAck, NewView
+
+# consensus digest of a null pre_prepare, no requests and no choices
+null_digest = hashlib.sha256(b'').digest()
+
+def select(view_changes, f:int, max_out:int = conf.checkpoint_max_out):
+    """Checkpoint and consensus digests a new view starts from
+
+    the decision of PBFT on view changes which carry digests only:
+    the checkpoint is the highest one held by f + 1 replicas, while
+    2f + 1 replicas are stable at or below it. after it, seqno n gets
+    digest d prepared in view v by some replica, if 2f + 1 replicas
+    stable below n prepared nothing at n in a later view (nor another
+    digest in v), and f + 1 replicas pre_prepared d in v or later.
+    seqnos no replica prepared get null pre_prepares.
+
+    :view_changes: [ViewChange] of the same view
+    return (checkpoint, state digest, [(seqno, digest)]), None if
+    view_changes do not decide yet
+    """
+    infos = [] # (last_stable, checkpoints, prepared, pre_prepared)
+    for vc in view_changes:
+        infos.append((
+            vc.last_stable,
+            {s: d for s, _, d in ViewChange.unpack_entries(vc.checkpoints)},
+            {s: (v, d) for s, v, d in ViewChange.unpack_entries(vc.prepared)},
+            {s: (v, d)
+             for s, v, d in ViewChange.unpack_entries(vc.pre_prepared)},
+        ))
+
+    claims = collections.Counter((s, d) for _, checkpoints, _, _ in infos
+                                 for s, d in checkpoints.items())
+    checkpoint = None
+    for (s, d), count in sorted(claims.items()):
+        if (count >= f + 1
+            and sum(1 for info in infos if info[0] <= s) >= 2 * f + 1):
+            checkpoint = (s, d)
+    if not checkpoint:
+        return None
+    h, h_digest = checkpoint
+
+    last = max([s for _, _, prepared, _ in infos for s in prepared
+                if h < s <= h + max_out], default = h)
+
+    chosen = []
+    for n in range(h + 1, last + 1):
+        below = [info for info in infos if info[0] < n]
+        candidates = sorted({prepared[n] for _, _, prepared, _ in infos
+                             if n in prepared}, reverse = True)
+
+        digest = None
+        for v, d in candidates:
+            a1 = sum(1 for _, _, prepared, _ in below
+                     if n not in prepared or prepared[n][0] < v
+                     or prepared[n] == (v, d))
+            a2 = sum(1 for _, _, prepared, pre_prepared in infos
+                     if any(n in entries and entries[n][0] >= v
+                            and entries[n][1] == d
+                            for entries in (prepared, pre_prepared)))
+            if a1 >= 2 * f + 1 and a2 >= f + 1:
+                digest = d
+                break
+
+        if digest is None:
+            if (sum(1 for _, _, prepared, _ in below if n not in prepared)
+                < 2 * f + 1):
+                return None # wait for more view changes
+            digest = null_digest
+
+        chosen.append((Seqno(n), digest))
+
+    return h, h_digest, chosen
+
+class ViewChangeTimeout():
+    """Timeout of the view change timer from observed commit latency
+
+    latencies are smoothed as round trip times by tcp (rfc 6298), the
+    timeout is srtt + 4 * rttvar within [min_timeout, max_timeout], the
+    initial one until the first sample. it is doubled for each
+    consecutive view change which did not start its view.
+    """
+
+    def __init__(self,
+                 initial:float,
+                 min_timeout:float = conf.view_change_min_timeout,
+                 max_timeout:float = conf.view_change_max_timeout,
+                 adaptive:bool = conf.adaptive_view_change_timeout):
+        """
+        :initial: seconds, view_change_interval
+        """
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.adaptive = adaptive
+
+        self.srtt = None # smoothed latency, seconds
+        self.rttvar = None
+        self.backoff = 0 # consecutive failed view changes
+
+        self.sample_count = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.recent = collections.deque(maxlen = 256) # for percentiles
+
+    @property
+    def base(self) -> float:
+        if not self.adaptive or self.srtt is None:
+            return self.initial
+        return min(max(self.srtt + 4 * self.rttvar, self.min_timeout),
+                   self.max_timeout)
+
+    @property
+    def timeout(self) -> float:
+        return min(self.base * 2 ** self.backoff,
+                   max(self.max_timeout, self.initial))
+
+    def record(self, latency:float):
+        """Seconds from the arrival of a request to its execution"""
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+            self.srtt = 0.875 * self.srtt + 0.125 * latency
+
+        self.sample_count += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.recent.append(latency)
+
+    def fail(self):
+        """The view change timed out before its new view"""
+        if self.timeout < self.max_timeout:
+            self.backoff += 1
+
+    def succeed(self):
+        """A new view is entered"""
+        self.backoff = 0
+
+    @property
+    def stats(self):
+        recent = sorted(self.recent)
+        def percentile(p):
+            return recent[min(len(recent) - 1, int(len(recent) * p))]
+
+        return {
+            'view_change_timeout': self.timeout,
+            'view_change_backoff': self.backoff,
+            'commit_latency_srtt': self.srtt,
+            'commit_latency_rttvar': self.rttvar,
+            'commit_latency_count': self.sample_count,
+            'last_commit_latency': self.last_latency,
+            'max_commit_latency': self.max_latency,
+            'p50_commit_latency': percentile(0.5) if recent else None,
+            'p99_commit_latency': percentile(0.99) if recent else None,
+        }
+
+class ViewChanger():
+    """View changes, their acks and the new view of the next view
+
+    the replica multicasts a ViewChange when it leaves its view, the
+    others ack it to the new primary. the primary accepts a view change
+    acked by 2f - 1 replicas, and sends a NewView once the accepted ones
+    decide, see select. backups check a NewView against the view
+    changes they received themselves.
+    """
+
+    def __init__(self, replica):
+        self.replica = replica
+
+        self.view = View(0) # the view being changed to
+        self.reset()
+
+        # sender => view change of a view after self.view
+        self.later = dict()
+
+        self.view_change_count = 0
+        self.new_view_count = 0
+
+    def reset(self):
+        self.view_changes = dict() # sender => view change
+        self.acks = dict() # (sender, digest) => {acker}
+        self.new_view = None # received or sent
+        self.chosen = dict() # seqno => digest, of the entered new view
+        # seqno => digest, chosen batches the primary waits for
+        self.missing = dict()
+
+        # messages of the view received before its new view
+        self.early = []
+
+    @property
+    def is_primary(self):
+        return self.replica.principal is self.replica.primary
+
+    def start(self, view:View):
+        """Multicast our view change to view, replica.view is view"""
+        replica = self.replica
+        self.view = view
+        self.reset()
+
+        last_stable = replica.last_stable
+        checkpoints = [(c.seqno, 0, c.digest)
+                       for c in replica.state.checkpoint_log
+                       if c.seqno >= last_stable]
+        prepared, pre_prepared = [], []
+        for seqno in range(last_stable + 1,
+                           last_stable + conf.checkpoint_max_out + 1):
+            pcert = replica.plog[seqno]
+            for entries, pp in ((prepared, pcert.last_prepared),
+                                (pre_prepared, pcert.last_pre_prepare)):
+                if pp:
+                    entries.append((seqno, pp.view, pp.consensus_digest))
+
+        view_change = ViewChange.from_replica(replica, view, last_stable,
+                                              checkpoints, prepared,
+                                              pre_prepared)
+        replica.sendto(view_change, 'ALL_REPLICAS')
+        self.view_changes[replica.index] = view_change
+        self.view_change_count += 1
+
+        later, self.later = self.later, dict()
+        for vc in later.values():
+            if vc.view > view:
+                self.later[vc.sender] = vc
+            elif vc.view == view:
+                self.add(vc)
+
+        self.try_new_view()
+
+    def recv_view_change(self, view_change):
+        replica = self.replica
+        vc = view_change
+        try:
+            for entries in (vc.checkpoints, vc.prepared, vc.pre_prepared):
+                ViewChange.unpack_entries(entries)
+        except ValueError:
+            return # TODO: log
+
+        if vc.view > replica.view:
+            last = self.later.get(vc.sender)
+            if not last or last.view < vc.view:
+                self.later[vc.sender] = vc
+            if (vc.view == replica.view + 1
+                and vc.sender == replica.primary.index):
+                # the primary gave up our view, e.g. it lacks a batch
+                replica.start_view_change(vc.view)
+            elif len(self.later) > replica.f:
+                # f + 1 replicas, one of them is correct, left our view
+                replica.start_view_change(
+                    min(vc.view for vc in self.later.values()))
+            return
+        elif vc.view < replica.view:
+            return
+        elif not replica.limbo:
+            if self.is_primary and self.new_view:
+                # the sender missed our new view
+                replica.sendto(self.new_view, replica.find_sender(vc))
+            return
+
+        self.add(vc)
+        self.try_new_view()
+
+    def add(self, view_change):
+        replica = self.replica
+        vc = view_change
+        if vc.sender in self.view_changes:
+            return
+
+        self.view_changes[vc.sender] = vc
+        if not self.is_primary and vc.sender != replica.primary.index:
+            ack = ViewChangeAck.from_replica(replica, vc)
+            replica.sendto(ack, replica.primary)
+
+    def lacked_by_primary(self, chosen:dict) -> set:
+        """Seqnos of chosen batches the view change of the primary lacks
+
+        :chosen: seqno => consensus digest
+        """
+        vc = self.view_changes.get(self.replica.primary.index)
+        if not vc:
+            return set()
+
+        held = {(n, bytes(d)) for entries in (vc.prepared, vc.pre_prepared)
+                for n, _, d in ViewChange.unpack_entries(entries)}
+        return {n for n, d in chosen.items()
+                if n > vc.last_stable and d != null_digest
+                and (n, bytes(d)) not in held}
+
+    def recv_view_change_ack(self, ack):
+        replica = self.replica
+        if (ack.view != replica.view or not replica.limbo
+            or not self.is_primary or ack.sender == ack.replica):
+            return
+
+        self.acks.setdefault((ack.replica, bytes(ack.digest)),
+                             set()).add(ack.sender)
+        self.try_new_view()
+
+    def accepted(self) -> list:
+        """View changes the primary may rely on, ordered by sender"""
+        f = self.replica.f
+        index = self.replica.index
+        result = []
+        for sender, vc in sorted(self.view_changes.items()):
+            acks = self.acks.get((sender, vc.content_digest), ())
+            if sender == index or len(acks) >= 2 * f - 1:
+                result.append(vc)
+        return result
+
+    def try_new_view(self):
+        replica = self.replica
+        if not replica.limbo:
+            return
+        elif not self.is_primary:
+            self.try_enter()
+            return
+
+        view_changes = self.accepted()
+        if len(view_changes) < 2 * replica.f + 1:
+            return
+
+        decision = select(view_changes, replica.f)
+        if not decision:
+            return
+        checkpoint, digest, chosen = decision
+
+        new_view = NewView.from_primary(
+            replica, self.view, checkpoint,
+            [(vc.sender, vc.content_digest) for vc in view_changes],
+            chosen)
+        replica.sendto(new_view, 'ALL_REPLICAS')
+        self.new_view = new_view
+        self.enter(checkpoint, digest, chosen)
+
+    def recv_new_view(self, new_view):
+        replica = self.replica
+        if new_view.view < replica.view:
+            return
+        elif new_view.view == replica.view and not replica.limbo:
+            return
+
+        if new_view.view > replica.view:
+            replica.start_view_change(new_view.view)
+        if new_view.sender != replica.primary.index:
+            return
+
+        self.new_view = new_view
+        self.try_enter()
+
+    def try_enter(self):
+        """Enter the received new view once its view changes are here"""
+        new_view = self.new_view
+        if not new_view or not self.replica.limbo:
+            return
+
+        try:
+            refs = new_view.unpack_view_changes()
+            chosen = new_view.unpack_chosen()
+        except ValueError:
+            self.new_view = None # TODO: log
+            return
+
+        view_changes = []
+        for sender, digest in refs:
+            vc = self.view_changes.get(sender)
+            if not vc:
+                return # not received yet
+            elif vc.content_digest != digest:
+                self.new_view = None # TODO: log, faulty primary
+                return
+            view_changes.append(vc)
+
+        if len(set(refs)) < 2 * self.replica.f + 1:
+            self.new_view = None
+            return
+
+        decision = select(view_changes, self.replica.f)
+        if (not decision or decision[0] != new_view.checkpoint
+            or decision[2] != chosen):
+            self.new_view = None # TODO: log, faulty primary
+            return
+
+        self.enter(*decision)
+
+    def enter(self, checkpoint:Seqno, digest:bytes, chosen):
+        self.chosen = dict(chosen)
+        self.new_view_count += 1
+        self.replica.enter_new_view(checkpoint, digest, chosen)
+
+        early, self.early = self.early, []
+        for message in early:
+            self.replica.recv_message(message)
+
+    def defer(self, message):
+        """Keep a message of the view until its new view is entered"""
+        if (message.view == self.replica.view
+            and len(self.early) < conf.checkpoint_max_out * 4):
+            self.early.append(message)
+
+    @property
+    def stats(self):
+        return {
+            'view': self.view,
+            'view_change_count': self.view_change_count,
+            'new_view_count': self.new_view_count,
+        }
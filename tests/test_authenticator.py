@@ -0,0 +1,68 @@
+import hmac
+import secrets
+import unittest
+
+from pbft.message import Commit
+from pbft.node import Node
+from pbft.principal import Principal
+
+class FakeNode(Node):
+    """Replica 0 with session keys but no transport"""
+    def __init__(self, n = 4):
+        self.index = 0
+        self.replica_principals = [Principal(i) for i in range(n)]
+        self.client_principals = []
+        self.verify_cache = None
+        for p in self.replica_principals[1:]:
+            p.gen_inkey()
+            p.outkey = secrets.token_bytes(Principal.hmac_nounce_length)
+
+    @property
+    def principal(self):
+        return self.replica_principals[self.index]
+
+def new_commit(node, sender, seqno = 1):
+    """A commit from sender, as received by node"""
+    m = Commit(0, seqno, sender)
+    m.auth = [b''] * len(node.replica_principals)
+    pp = node.replica_principals[sender]
+    m.auth[node.index] = pp.gen_hmac('in', m.content_digest)
+    return m
+
+class TestPrincipal(unittest.TestCase):
+    def test_gen_hmac(self):
+        p = Principal(1)
+        for _ in range(2):
+            p.gen_inkey()
+            self.assertEqual(p.gen_hmac('in', b'source'),
+                             hmac.new(p.inkey, b'source',
+                                      digestmod='SHA256').digest())
+
+    def test_gen_hmacs(self):
+        p = Principal(1)
+        p.outkey = secrets.token_bytes(Principal.hmac_nounce_length)
+        sources = [b'a', b'b', b'c']
+        self.assertEqual(p.gen_hmacs('out', sources),
+                         [p.gen_hmac('out', s) for s in sources])
+
+class TestVerifyMessages(unittest.TestCase):
+    def test_batch(self):
+        node = FakeNode()
+        messages = [new_commit(node, s, seqno)
+                    for seqno in range(1, 4) for s in (1, 2, 3)]
+
+        # a forged one
+        messages[4].auth[0] = bytes(Principal.hmac_nounce_length)
+
+        results = node.verify_messages(messages)
+        self.assertEqual(results, [i != 4 for i in range(len(messages))])
+        self.assertEqual([m.verified for m in messages], results)
+
+    def test_rotated_key(self):
+        node = FakeNode()
+        m = new_commit(node, 1)
+        node.replica_principals[1].gen_inkey()
+        self.assertEqual(node.verify_messages([m]), [False])
+
+if __name__ == '__main__':
+    unittest.main()
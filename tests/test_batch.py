@@ -0,0 +1,81 @@
+import collections
+import unittest
+
+from pbft.batch import Batcher
+from pbft.message import Request, PrePrepare
+
+class FakePrimary():
+    """Just enough of a replica for PrePrepare.from_primary"""
+    def __init__(self):
+        self.index = 0
+        self.view = 0
+        self.seqno = 1
+        self.rw_requests = collections.OrderedDict()
+
+    def gen_authenticators(self, hash_bytes):
+        return [b'', b'', b'', b'']
+
+def new_request(sender, reqid, command = b'x'):
+    r = Request(sender, reqid, 1 << 4, 0, command)
+    r.gen_payload()
+    return r
+
+class TestBatcher(unittest.TestCase):
+    def test_grow_under_load(self):
+        b = Batcher(max_size = 8, max_bytes = 8196, max_wait = 0.01)
+        self.assertEqual(b.size, 1)
+        for expected in (2, 4, 8, 8):
+            pp = PrePrepare(0, 1, 0, [new_request(0, 1)] * b.size, b'')
+            pp.payload = b''
+            b.record(pp, pending = 10, now = 0.0)
+            self.assertEqual(b.size, expected)
+
+    def test_shrink_when_idle(self):
+        b = Batcher(max_size = 8, max_bytes = 8196, max_wait = 0.01)
+        b.size = 8
+        pp = PrePrepare(0, 1, 0, [new_request(0, 1)], b'')
+        pp.payload = b''
+        b.record(pp, pending = 0, now = 0.0)
+        self.assertEqual(b.size, 4)
+
+    def test_is_ready(self):
+        b = Batcher(max_size = 8, max_bytes = 8196, max_wait = 0.01)
+        b.size = 4
+        self.assertFalse(b.is_ready(2, oldest = 1.0, now = 1.005))
+        self.assertTrue(b.is_ready(4, oldest = 1.0, now = 1.005))
+        self.assertTrue(b.is_ready(2, oldest = 1.0, now = 1.01))
+
+    def test_fixed_size(self):
+        b = Batcher(max_size = 8, max_bytes = 8196, max_wait = 0.01,
+                    adaptive = False)
+        self.assertEqual(b.size, 8)
+
+class TestFromPrimary(unittest.TestCase):
+    def test_round_robin_count(self):
+        primary = FakePrimary()
+        primary.rw_requests['a'] = [new_request(0, 1), new_request(0, 2)]
+        primary.rw_requests['b'] = [new_request(1, 1)]
+
+        pp = PrePrepare.from_primary(primary, False, max_count = 2)
+        self.assertEqual([(r.sender, r.reqid) for r in pp.requests],
+                         [(0, 1), (1, 1)])
+        self.assertEqual(list(primary.rw_requests), ['a'])
+        self.assertEqual(len(primary.rw_requests['a']), 1)
+
+    def test_max_bytes(self):
+        primary = FakePrimary()
+        for i in range(4):
+            primary.rw_requests[i] = [new_request(i, 1, b'x' * 60)]
+
+        length = len(primary.rw_requests[0][0].payload_in_pre_prepare)
+        pp = PrePrepare.from_primary(primary, False, max_count = 64,
+                                     max_bytes = length * 2 + 1)
+        self.assertEqual(len(pp.requests), 2)
+        self.assertEqual(len(primary.rw_requests), 2)
+
+    def test_at_least_one(self):
+        primary = FakePrimary()
+        primary.rw_requests[0] = [new_request(0, 1, b'x' * 60)]
+        pp = PrePrepare.from_primary(primary, False, max_bytes = 1)
+        self.assertEqual(len(pp.requests), 1)
+        self.assertFalse(primary.rw_requests)
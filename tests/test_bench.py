@@ -0,0 +1,48 @@
+import unittest
+
+from pbft.bench import Workload, Latencies
+
+class FakeClient():
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, command, readonly, signed):
+        self.submitted.append((command, readonly, signed))
+
+class TestWorkload(unittest.TestCase):
+    def test_commands(self):
+        client = FakeClient()
+        workload = Workload(command_size = 16, readonly_ratio = 0.25,
+                            signed = True, seed = 1)
+        for _ in range(400):
+            workload.submit(client)
+
+        commands = [c for c, _, _ in client.submitted]
+        self.assertEqual({len(c) for c in commands}, {16})
+        self.assertEqual(len(set(commands)), 400)
+        readonly = sum(r for _, r, _ in client.submitted)
+        self.assertTrue(60 < readonly < 140)
+        self.assertTrue(all(s for _, _, s in client.submitted))
+
+    def test_small_commands(self):
+        client = FakeClient()
+        Workload(command_size = 2).submit(client)
+        self.assertEqual(client.submitted[0][0], b'\x01\x00')
+
+class TestLatencies(unittest.TestCase):
+    def test_stats(self):
+        latencies = Latencies()
+        self.assertEqual(latencies.stats['completed'], 0)
+
+        for i in range(1, 1001):
+            latencies.record(i / 10000) # 0.1ms to 100ms
+        stats = latencies.stats
+        self.assertEqual(stats['completed'], 1000)
+        self.assertAlmostEqual(stats['latency_ms']['p50'], 50.1)
+        self.assertAlmostEqual(stats['latency_ms']['p99'], 99.1)
+        self.assertAlmostEqual(stats['latency_ms']['p999'], 100.0)
+
+        histogram = stats['histogram_ms']
+        self.assertEqual(sum(c for _, c in histogram), 1000)
+        self.assertEqual(histogram[0], (0.1, 1))
+        self.assertAlmostEqual(histogram[-1][0], 102.4)
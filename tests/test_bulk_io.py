@@ -0,0 +1,88 @@
+import ctypes
+import errno
+import socket
+import unittest
+import unittest.mock
+
+from pbft import bulk_io
+from pbft.bulk_io import BulkSocket, libc
+
+class FakeLibc():
+    """libc whose sendmmsg sends at most limit datagrams per call,
+    then fails with EAGAIN after sending fail_after of them"""
+    def __init__(self, limit, fail_after = None):
+        self.limit = limit
+        self.fail_after = fail_after
+        self.sent = 0
+
+    def sendmmsg(self, fd, msgs, count, flags):
+        count = min(count, self.limit)
+        if self.fail_after is not None:
+            if self.sent >= self.fail_after:
+                ctypes.set_errno(errno.EAGAIN)
+                return -1
+            count = min(count, self.fail_after - self.sent)
+
+        n = libc.sendmmsg(fd, msgs, count, flags)
+        self.sent += max(n, 0)
+        return n
+
+    def recvmmsg(self, *args):
+        return libc.recvmmsg(*args)
+
+@unittest.skipUnless(libc, 'no sendmmsg/recvmmsg')
+class TestBulkSocket(unittest.TestCase):
+    def setUp(self):
+        self.sender = self.new_socket()
+        self.receiver = self.new_socket()
+        self.addr = self.receiver.getsockname()
+        self.bulk_sender = BulkSocket(self.sender, batch = 4)
+        self.bulk_receiver = BulkSocket(self.receiver, batch = 16)
+
+    def new_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.setblocking(False)
+        self.addCleanup(sock.close)
+        return sock
+
+    def datagrams(self, count):
+        return [(b'datagram %d' % i, self.addr) for i in range(count)]
+
+    def test_round_trip(self):
+        sent = self.datagrams(6)
+        # memoryviews are sent too
+        sent[1] = (memoryview(sent[1][0]), self.addr)
+        self.assertEqual(self.bulk_sender.send(sent), (6, 2)) # batch of 4
+
+        received = self.bulk_receiver.recv()
+        self.assertEqual([bytes(d) for d, _ in sent],
+                         [d for d, _ in received])
+        self.assertEqual({a for _, a in received},
+                         {self.sender.getsockname()})
+
+    def test_recv_nothing_ready(self):
+        self.assertEqual(self.bulk_receiver.recv(), [])
+
+    def test_partial_send(self):
+        with unittest.mock.patch.object(bulk_io, 'libc', FakeLibc(3)):
+            self.assertEqual(self.bulk_sender.send(self.datagrams(6)),
+                             (6, 3)) # 3 + 1, then 2
+
+        received = self.bulk_receiver.recv()
+        self.assertEqual([d for d, _ in received],
+                         [d for d, _ in self.datagrams(6)])
+
+    def test_send_again(self):
+        fake = FakeLibc(3, fail_after = 5)
+        with unittest.mock.patch.object(bulk_io, 'libc', fake):
+            # stops at the full socket buffer, the rest is left
+            self.assertEqual(self.bulk_sender.send(self.datagrams(8)),
+                             (5, 4)) # 3 + 1, 1, then EAGAIN
+
+        received = self.bulk_receiver.recv()
+        self.assertEqual([d for d, _ in received],
+                         [d for d, _ in self.datagrams(5)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import collections
+import hashlib
+import types
+import unittest
+
+from pbft.basic import Configuration as conf
+from pbft.client import Client, Outstanding
+from pbft.message import Reply
+from pbft.reply_quorum import ReplyQuorum
+
+def new_client(readonly = False):
+    pending = Outstanding(b'', readonly, 1.0, FakeFuture())
+    pending.request = types.SimpleNamespace(reqid = 7, readonly = readonly)
+    client = types.SimpleNamespace(f = 1, view = 0,
+                                   outstanding = {7: pending},
+                                   replies = ReplyQuorum(1),
+                                   duplicate_reply_count = 0,
+                                   find_sender = lambda m: None,
+                                   send_waiting = lambda: None)
+    client.replies.open(7, readonly)
+    client.finish = types.MethodType(Client.finish, client)
+    client.recv_reply = types.MethodType(Client.recv_reply, client)
+    return client
+
+class FakeFuture():
+    result = None
+
+    def done(self):
+        return self.result is not None
+
+    def set_result(self, result):
+        self.result = result
+
+def new_reply(sender, result = b'ok', tentative = False, reqid = 7,
+              digest = False, view = 0):
+    extra = int(tentative)
+    if digest:
+        extra |= 2
+        result = hashlib.sha256(result).digest()
+    reply = Reply(view, reqid, extra, 0, sender, result)
+    reply.verified = True
+    return reply
+
+class TestRecvReply(unittest.TestCase):
+    def test_committed_quorum(self):
+        client = new_client()
+        self.assertIsNone(Client.recv_reply(client, new_reply(0)))
+        self.assertIsNone(Client.recv_reply(client, new_reply(1, b'bad')))
+        self.assertIsNone(Client.recv_reply(client, new_reply(2, reqid = 6)))
+        self.assertEqual(Client.recv_reply(client, new_reply(3)), b'ok')
+        self.assertEqual(client.outstanding, {})
+        self.assertEqual(len(client.replies), 0)
+        # late replies are dropped
+        self.assertIsNone(Client.recv_reply(client, new_reply(2)))
+
+    def test_tentative_quorum(self):
+        client = new_client()
+        for i in range(2):
+            reply = new_reply(i, tentative = True)
+            self.assertIsNone(Client.recv_reply(client, reply))
+        reply = new_reply(2, tentative = True)
+        self.assertEqual(Client.recv_reply(client, reply), b'ok')
+
+    def test_tentative_then_committed(self):
+        client = new_client()
+        Client.recv_reply(client, new_reply(0, tentative = True))
+        Client.recv_reply(client, new_reply(1))
+        # the commit of replica 0 replaces its tentative reply
+        self.assertEqual(Client.recv_reply(client, new_reply(0)), b'ok')
+
+    def test_digest_replies(self):
+        client = new_client()
+        for i in range(3):
+            reply = new_reply(i, b'large', digest = True)
+            self.assertIsNone(Client.recv_reply(client, reply))
+        # the full result is checked against the digests
+        self.assertIsNone(Client.recv_reply(client, new_reply(3, b'forged')))
+        self.assertEqual(Client.recv_reply(client, new_reply(3, b'large')),
+                         b'large')
+
+    def test_view_of_quorum(self):
+        client = new_client()
+        Client.recv_reply(client, new_reply(0, tentative = True, view = 9))
+        Client.recv_reply(client, new_reply(1, tentative = True, view = 2))
+        self.assertEqual(client.view, 0)
+        # f + 1 repliers are in view 2 or later
+        reply = new_reply(2, tentative = True, view = 1)
+        self.assertEqual(Client.recv_reply(client, reply), b'ok')
+        self.assertEqual(client.view, 2)
+
+    def test_readonly_quorum(self):
+        client = new_client(readonly = True)
+        for i in range(2):
+            self.assertIsNone(Client.recv_reply(client, new_reply(i)))
+        self.assertEqual(Client.recv_reply(client, new_reply(2)), b'ok')
+
+    def test_bulk_verification(self):
+        client = new_client()
+        verified = []
+        client.verify_messages = verified.extend
+        Client.recv_reply(client, new_reply(0))
+
+        # the repeated reply of 0 and the one to reqid 6 are dropped
+        replies = [new_reply(0), new_reply(1, tentative = True),
+                   new_reply(2, reqid = 6), new_reply(1)]
+        Client.recv_replies(client, replies)
+        self.assertEqual(verified, [replies[1], replies[3]])
+        self.assertEqual(client.duplicate_reply_count, 2)
+        self.assertEqual(client.outstanding, {})
+
+class FakeHandle():
+    cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeClient():
+    type = 'Client'
+    index = 0
+    n = 4
+    f = 1
+    primary = 'primary'
+    reqid = 100
+
+    send_waiting = Client.send_waiting
+    send_request = Client.send_request
+    finish = Client.finish
+    retransmit = Client.retransmit
+
+    def __init__(self):
+        self.outstanding = collections.OrderedDict()
+        self.replies = ReplyQuorum(self.f)
+        self.waiting = collections.deque()
+        self.loop = types.SimpleNamespace(
+            call_later = lambda *args: FakeHandle())
+        self.sent = []
+
+    def next_reqid(self):
+        self.reqid += 1
+        return self.reqid
+
+    def gen_authenticators(self, hash_bytes):
+        return [b''] * self.n
+
+    def sendto(self, request, dest):
+        self.sent.append(request.reqid)
+
+    def submit(self, command):
+        self.waiting.append(Outstanding(command, False, 1.0, FakeFuture()))
+        self.send_waiting()
+
+class TestWindow(unittest.TestCase):
+    def test_window(self):
+        client = FakeClient()
+        window = conf.client_window
+        for i in range(window + 2):
+            client.submit(bytes([i]))
+        # reqids within the window from the oldest outstanding one
+        self.assertEqual(client.sent, list(range(101, 101 + window)))
+        self.assertEqual(len(client.waiting), 2)
+
+        # a newer one done does not move the window
+        client.finish(client.outstanding[102], b'ok')
+        self.assertEqual(len(client.sent), window)
+
+        client.finish(client.outstanding[101], b'ok')
+        self.assertEqual(client.sent[window:], [101 + window,
+                                               102 + window])
+        self.assertEqual(len(client.waiting), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import unittest
+
+from pbft.message import (BaseMessage, Request, PrePrepare, Prepare,
+                          Commit, Checkpoint, Reply, Fetch, MetaData, MetaDataD, Data,
+                          ViewChange, ViewChangeAck, NewView)
+from pbft.principal import Principal
+
+class FakeNode():
+    type = 'Replica'
+    index = 1
+    n = 4
+    view = 0
+
+    def gen_authenticators(self, hash_bytes):
+        return [bytes([i]) * 32 if i != self.index else b''
+                for i in range(self.n)]
+
+def parse(message):
+    tag, version, payload = BaseMessage.parse_frame(message.frame)
+    assert tag == message.tag and version == message.version
+    cls = type(message)
+    if version == BaseMessage.struct_version:
+        return cls.from_struct_payload(payload, None, FakeNode())
+    return cls.from_payload(payload, None, FakeNode())
+
+def new_request(version, command):
+    r = Request(0, 7, 1 << 4, 2, command)
+    r.version = version
+    r.gen_payload(FakeNode())
+    return r
+
+class TestCodec(unittest.TestCase):
+    versions = (BaseMessage.rlp_version, BaseMessage.struct_version)
+
+    def test_prepare(self):
+        for v in self.versions:
+            p = Prepare(3, 9, 0, 1, bytes(range(32)))
+            p.version = v
+            p.gen_payload(FakeNode())
+            m = parse(p)
+            self.assertEqual((m.view, m.seqno, m.extra, m.sender),
+                             (3, 9, 0, 1))
+            self.assertEqual(bytes(m.consensus_digest), bytes(range(32)))
+            self.assertEqual(m.content_digest, p.content_digest)
+            self.assertEqual(bytes(m.auth[2]), bytes([2]) * 32)
+
+    def test_commit(self):
+        for v in self.versions:
+            c = Commit(3, 9, 1)
+            c.version = v
+            c.gen_payload(FakeNode())
+            m = parse(c)
+            self.assertEqual((m.view, m.seqno, m.sender), (3, 9, 1))
+            self.assertEqual(len(m.auth), 4)
+
+    def test_struct_is_zero_copy(self):
+        p = Prepare(3, 9, 0, 1, bytes(32))
+        p.version = BaseMessage.struct_version
+        p.gen_payload(FakeNode())
+        m = parse(p)
+        self.assertIsInstance(m.consensus_digest, memoryview)
+        self.assertIsInstance(m.auth[0], memoryview)
+
+    def test_request(self):
+        for v in self.versions:
+            r = new_request(v, b'Hello, world!')
+            m = parse(r)
+            self.assertEqual(bytes(m.command), b'Hello, world!')
+            self.assertEqual((m.sender, m.reqid, m.full_replier),
+                             (0, 7, 2))
+            self.assertEqual(m.content_digest, r.content_digest)
+
+    def test_retransmitted_request_unchanged(self):
+        for v in self.versions:
+            r = new_request(v, b'Hello, world!')
+            m, again = parse(r), parse(r)
+            m.verified = again.verified = True
+            self.assertFalse(m.change_by_primary(again, FakeNode()))
+            self.assertFalse(m.change_by_backup(again, FakeNode()))
+
+            other = new_request(v, b'Hello, world!')
+            other.auth[0] = bytes([9]) * 32
+            other.gen_payload()
+            other = parse(other)
+            other.verified = True
+            self.assertTrue(m.change_by_backup(other, FakeNode()))
+
+    def test_pre_prepare(self):
+        for v in self.versions:
+            small = new_request(v, b'small')
+            big = new_request(v, bytes(1024))
+            pp = PrePrepare(0, 5, 0, [small, big], b'choices')
+            pp.version = v
+            pp.gen_payload(FakeNode())
+
+            m = parse(pp)
+            self.assertEqual((m.view, m.seqno), (0, 5))
+            self.assertEqual(bytes(m.non_det_choices), b'choices')
+            self.assertEqual(bytes(m.requests[0].command), b'small')
+            self.assertIsNone(m.requests[1].command)
+            self.assertEqual(bytes(m.requests[1].command_digest),
+                             big.command_digest)
+            self.assertEqual(m.consensus_digest, pp.consensus_digest)
+            self.assertEqual(m.content_digest, pp.content_digest)
+
+    def test_pre_prepare_converts_requests(self):
+        r = new_request(BaseMessage.rlp_version, b'small')
+        pp = PrePrepare(0, 5, 0, [r], b'')
+        pp.version = BaseMessage.struct_version
+        pp.gen_payload(FakeNode())
+        m = parse(pp)
+        self.assertEqual(m.requests[0].version, BaseMessage.struct_version)
+        self.assertEqual(m.content_digest, pp.content_digest)
+
+    def test_reply(self):
+        for v in self.versions:
+            reply = Reply(0, 7, 0, 0, 1, b'result')
+            reply.version = v
+            reply.gen_payload(Principal(0))
+            m = parse(reply)
+            self.assertEqual(bytes(m.result), b'result')
+            self.assertEqual((m.requestor, m.sender), (0, 1))
+            self.assertEqual(bytes(m.auth), reply.auth)
+            self.assertFalse(m.is_tentative)
+
+            tentative = Reply(0, 7, 1, 0, 1, b'result')
+            tentative.version = v
+            tentative.gen_payload(Principal(0))
+            m = parse(tentative)
+            self.assertTrue(m.is_tentative)
+            self.assertNotEqual(m.content_digest, reply.content_digest)
+
+            digest = Reply(0, 7, 2, 0, 1, reply.reply_digest)
+            digest.version = v
+            digest.gen_payload(Principal(0))
+            m = parse(digest)
+            self.assertTrue(m.is_digest)
+            self.assertEqual(m.reply_digest, reply.reply_digest)
+
+    def test_checkpoint(self):
+        for v in self.versions:
+            c = Checkpoint(256, 1, bytes(range(32)))
+            c.version = v
+            c.gen_payload(FakeNode())
+            m = parse(c)
+            self.assertEqual((m.seqno, m.sender), (256, 1))
+            self.assertEqual(bytes(m.digest), bytes(range(32)))
+            self.assertEqual(m.content_digest, c.content_digest)
+            self.assertEqual(len(m.auth), 4)
+
+    def test_state_transfer(self):
+        children = [(i, bytes([i]) * 32) for i in range(4)]
+        for v in self.versions:
+            f = Fetch(1, 3, Fetch.latest, 1)
+            d = MetaDataD(256, 0, 0, 128, 1, bytes(range(32)))
+            md = MetaData(256, 1, 3, 1, MetaData.pack_children(children))
+            data = Data(256, 7, 128, 1, b'page')
+            for message in (f, d, md, data):
+                message.version = v
+                message.gen_payload(FakeNode())
+
+            m = parse(f)
+            self.assertEqual((m.level, m.index, m.checkpoint, m.sender),
+                             (1, 3, Fetch.latest, 1))
+            self.assertEqual(m.content_digest, f.content_digest)
+            self.assertEqual(len(m.auth), 4)
+
+            m = parse(d)
+            self.assertEqual((m.checkpoint, m.last_mod), (256, 128))
+            self.assertEqual(bytes(m.digest), bytes(range(32)))
+            self.assertEqual(m.content_digest, d.content_digest)
+
+            m = parse(md)
+            self.assertEqual((m.checkpoint, m.level, m.index), (256, 1, 3))
+            self.assertEqual(m.unpack_children(), children)
+            self.assertIsNone(m.authenticator(FakeNode()))
+
+            m = parse(data)
+            self.assertEqual((m.index, m.last_mod), (7, 128))
+            self.assertEqual(bytes(m.block), b'page')
+
+    def test_view_change(self):
+        entries = [(129, 2, bytes([1]) * 32), (130, 3, bytes([2]) * 32)]
+        for v in self.versions:
+            vc = ViewChange(4, 128, 1, ViewChange.pack_entries(
+                [(128, 0, bytes(32))]), ViewChange.pack_entries(entries), b'')
+            ack = ViewChangeAck(4, 1, 2, vc.content_digest)
+            nv = NewView(4, 0, 128,
+                         NewView.pack_pairs(NewView.view_change_struct,
+                                            [(1, vc.content_digest)]),
+                         NewView.pack_pairs(NewView.chosen_struct,
+                                            [(129, bytes([1]) * 32)]))
+            for message in (vc, ack, nv):
+                message.version = v
+                message.gen_payload(FakeNode())
+
+            m = parse(vc)
+            self.assertEqual((m.view, m.last_stable, m.sender), (4, 128, 1))
+            self.assertEqual(ViewChange.unpack_entries(m.prepared), entries)
+            self.assertEqual(ViewChange.unpack_entries(m.pre_prepared), [])
+            self.assertEqual(m.content_digest, vc.content_digest)
+            self.assertEqual(len(m.auth), 4)
+
+            m = parse(ack)
+            self.assertEqual((m.view, m.sender, m.replica), (4, 1, 2))
+            self.assertEqual(bytes(m.digest), vc.content_digest)
+
+            m = parse(nv)
+            self.assertEqual((m.view, m.sender, m.checkpoint), (4, 0, 128))
+            self.assertEqual(m.unpack_view_changes(), [(1, vc.content_digest)])
+            self.assertEqual(m.unpack_chosen(), [(129, bytes([1]) * 32)])
+            self.assertEqual(m.content_digest, nv.content_digest)
+
+    def test_truncated(self):
+        c = Commit(3, 9, 1)
+        c.version = BaseMessage.struct_version
+        c.gen_payload(FakeNode())
+        tag, version, payload = BaseMessage.parse_frame(c.frame[:-1])
+        with self.assertRaises(ValueError):
+            Commit.from_struct_payload(payload, None, FakeNode())
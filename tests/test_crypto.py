@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+import rsa
+
+from pbft.crypto import CryptoService
+from pbft.principal import Principal
+
+class TestCryptoService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        public_key, private_key = rsa.newkeys(512)
+        cls.principal = Principal(0, private_key, public_key)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.crypto = CryptoService(1, self.loop)
+
+    def tearDown(self):
+        self.crypto.close()
+        self.loop.close()
+
+    def run_batch(self, *coros):
+        async def gather():
+            return await asyncio.gather(*coros)
+        return self.loop.run_until_complete(gather())
+
+    def test_sign_and_verify(self):
+        p = self.principal
+        [signature] = self.run_batch(self.crypto.sign(p, b'digest'))
+        self.assertEqual(signature, p.sign(b'digest'))
+
+        results = self.run_batch(self.crypto.verify(p, b'digest', signature),
+                                 self.crypto.verify(p, b'forged', signature))
+        self.assertEqual(results, [True, False])
+        self.assertEqual(self.crypto.job_count, 3)
+
+    def test_memoryview_arguments(self):
+        # received frames are parsed into memoryviews by the struct codec
+        p = self.principal
+        frame = memoryview(b'..digest' + p.sign(b'digest'))
+        digest, signature = frame[2:8], frame[8:]
+        results = self.run_batch(self.crypto.verify(p, digest, signature),
+                                 self.crypto.sign(p, digest),
+                                 self.crypto.decrypt(
+                                     p, memoryview(p.encrypt(b'nonce'))))
+        self.assertEqual(results, [True, p.sign(b'digest'), b'nonce'])
+
+    def test_decrypt(self):
+        p = self.principal
+        nonces = [bytes([i]) * 32 for i in range(4)]
+        results = self.run_batch(*(self.crypto.decrypt(p, p.encrypt(n))
+                                   for n in nonces))
+        self.assertEqual(results, nonces)
+
+        [result] = self.run_batch(self.crypto.decrypt(p, b'garbage'))
+        self.assertIsNone(result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import types
+import unittest
+
+from pbft.log import PrepareCertificateLog
+
+def new_pre_prepare(seqno):
+    request = types.SimpleNamespace(sender_type = 'Client', sender = 0,
+                                    reqid = seqno)
+    return types.SimpleNamespace(seqno = seqno, requests = [request],
+                                 consensus_digest = bytes(32))
+
+class TestPrepareCertificateLog(unittest.TestCase):
+    def test_truncate_recycles(self):
+        replica = types.SimpleNamespace(index = 0, n = 4, f = 1)
+        plog = PrepareCertificateLog(replica, 8, 1)
+        for seqno in range(1, 9):
+            pcert = plog[seqno]
+            pcert.add_pre_prepare(new_pre_prepare(seqno))
+            pcert.add_commit(types.SimpleNamespace(sender = 1))
+        self.assertEqual(len(plog.requests), 8)
+        self.assertIsNone(plog[9])
+
+        plog.truncate(5) # seqno 4 is stable
+        self.assertEqual(plog.head, 5)
+        self.assertEqual(sorted(k[2] for k in plog.requests), [5, 6, 7, 8])
+        for seqno in range(9, 13):
+            pcert = plog[seqno]
+            self.assertEqual(pcert.seqno, seqno)
+            self.assertIsNone(pcert.pre_prepare)
+            self.assertFalse(pcert.has_commit(1))
+            self.assertEqual(pcert.commits, [None] * 4)
+        self.assertIsNone(plog[4])
+
+        plog.truncate(100) # beyond the whole window
+        self.assertFalse(plog.requests)
+        self.assertEqual([plog[s].seqno for s in range(100, 108)],
+                         list(range(100, 108)))
+
+    def test_quorums(self):
+        replica = types.SimpleNamespace(index = 0, n = 4, f = 1)
+        plog = PrepareCertificateLog(replica, 8, 1)
+        pcert = plog[1]
+        digest = bytes(32)
+
+        # prepares may come before the pre_prepare
+        for sender, d in ((1, digest), (2, bytes([1]) * 32)):
+            vote = types.SimpleNamespace(sender = sender, consensus_digest = d)
+            self.assertTrue(pcert.add_prepare(vote))
+            self.assertFalse(pcert.add_prepare(vote))
+
+        pcert.add_pre_prepare(types.SimpleNamespace(
+            requests = [], consensus_digest = digest, mine = True))
+        self.assertEqual(pcert.matching_prepares, 1)
+        self.assertFalse(pcert.is_prepared)
+
+        pcert.add_prepare(types.SimpleNamespace(sender = 3,
+                                                consensus_digest = digest))
+        self.assertTrue(pcert.is_prepared)
+        self.assertTrue(pcert.has_prepare(3))
+        self.assertFalse(pcert.has_prepare(0))
+
+        for sender in range(3):
+            self.assertFalse(pcert.is_committed)
+            pcert.add_commit(types.SimpleNamespace(sender = sender))
+        self.assertTrue(pcert.is_committed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import types
+import unittest
+
+from pbft.log import PrepareCertificateLog
+from pbft.message import (BaseMessage, Request, PrePrepare, Prepare, Commit,
+                          Reply, NewKey)
+from pbft.message.struct_codec import Authenticators
+from pbft.principal import Principal
+
+class FakeNode():
+    type = 'Replica'
+    index = 1
+    n = 4
+    view = 0
+
+    def gen_authenticators(self, hash_bytes):
+        return [bytes([i]) * 32 if i != self.index else b''
+                for i in range(self.n)]
+
+def new_request():
+    r = Request(0, 7, 1 << 4, 2, b'Hello, world!')
+    r.gen_payload()
+    return r
+
+class TestSlots(unittest.TestCase):
+    def assertSlotted(self, obj):
+        self.assertFalse(hasattr(obj, '__dict__'), type(obj).__name__)
+        with self.assertRaises(AttributeError):
+            obj.not_a_field = None
+
+    def test_messages(self):
+        for message in (new_request(),
+                        PrePrepare(0, 1, 0, [new_request()], b''),
+                        Prepare(0, 1, 0, 2, bytes(32)),
+                        Commit(0, 1, 2),
+                        Reply(0, 7, 0, 0, 1, b'result'),
+                        NewKey(1, 7, 0, [])):
+            self.assertSlotted(message)
+
+    def test_request_fields_of_replicas(self):
+        # set when received, they never add a __dict__ to a request
+        r = new_request()
+        self.assertEqual((r.arrival, r.seqno, r.in_pre_prepare_index,
+                          r.pre_prepare), (None, None, None, None))
+
+    def test_principal_and_prepare_certificate(self):
+        self.assertSlotted(Principal(0))
+        replica = types.SimpleNamespace(index = 0, n = 4, f = 1)
+        self.assertSlotted(PrepareCertificateLog(replica, 8, 1)[1])
+
+class TestAuthenticators(unittest.TestCase):
+    def test_struct_auth_is_one_view(self):
+        p = Prepare(3, 9, 0, 1, bytes(32))
+        p.version = BaseMessage.struct_version
+        p.gen_payload(FakeNode())
+        _, _, payload = BaseMessage.parse_frame(p.frame)
+        auth = Prepare.from_struct_payload(payload, None, FakeNode()).auth
+
+        self.assertIsInstance(auth, Authenticators)
+        self.assertEqual(len(auth), 4)
+        self.assertEqual([bytes(a) for a in auth],
+                         [bytes([i]) * 32 if i != 1 else bytes(32)
+                          for i in range(4)])
+        self.assertEqual(bytes(auth[-2]), bytes([2]) * 32)
+        with self.assertRaises(IndexError):
+            auth[4]
+        # a view over the frame, no memoryview per replica is kept
+        self.assertIsInstance(auth.buf, memoryview)
+        self.assertFalse(hasattr(auth, '__dict__'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from pbft.message import Request, PrePrepare
+
+class FakeNode():
+    index = 1
+
+def new_request(command = b'Hello, world!'):
+    r = Request(0, 1, 1 << 4, 0, command)
+    r.gen_payload()
+    return r
+
+class TestDigests(unittest.TestCase):
+    def test_request_digests_cached(self):
+        r = new_request()
+        consensus, content = r.consensus_digest, r.content_digest
+        r.command = b'changed behind the back'
+        self.assertEqual(r.consensus_digest, consensus)
+        self.assertEqual(r.content_digest, content)
+
+    def test_change_clears_content_digest(self):
+        r = new_request()
+        consensus, content = r.consensus_digest, r.content_digest
+
+        other = new_request()
+        other.reply_from_all = True
+        r.verified = other.verified = True
+        self.assertTrue(r.change_by_backup(other, FakeNode()))
+
+        self.assertEqual(r.consensus_digest, consensus)
+        self.assertNotEqual(r.content_digest, content)
+        self.assertEqual(r.content_digest, other.content_digest)
+
+    def test_unchanged_keeps_digests(self):
+        r = new_request()
+        content = r.content_digest
+        other = new_request()
+        r.verified = other.verified = True
+        self.assertFalse(r.change_by_backup(other, FakeNode()))
+        self.assertIs(r.content_digest, content)
+
+    def test_pre_prepare_digest_follows_requests(self):
+        r = new_request()
+        pp = PrePrepare(0, 1, 0, [r], b'')
+        content = pp.content_digest
+
+        r.readonly = True
+        pp.clear_digests()
+        self.assertNotEqual(pp.content_digest, content)
@@ -0,0 +1,521 @@
+import asyncio
+import collections
+import contextlib
+import io
+import types
+import unittest
+import unittest.mock
+
+from pbft.basic import Configuration as conf
+from pbft.message import (Request, PrePrepare, Prepare, Commit, Reply,
+                          Checkpoint, Fetch, ViewChange, NewKey)
+from pbft.principal import Principal
+from pbft.replica import Replica
+from pbft.timer import Timer
+from pbft.view_change import null_digest
+
+A = bytes([1]) * 32
+
+class RecordingReplica(Replica):
+    """Replica of a cluster of 4 which records what it sends"""
+    def sendto(self, message, principal):
+        self.sent.append((message, principal))
+
+class ReplicaTestCase(unittest.TestCase):
+    def new_replica(self, index = 1, n = 4):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+        replicas = [Principal(i, public_key = i, port = 25600 + i)
+                    for i in range(n)]
+        clients = [Principal(i, public_key = n + i, port = 25700 + i)
+                   for i in range(2)]
+        with unittest.mock.patch.object(conf, 'crypto_workers', 0):
+            replica = RecordingReplica(None, index, 1000, 1000, 1000, 1000,
+                                       replicas, n = n, f = (n - 1) // 3,
+                                       auth_interval = 1000,
+                                       client_principals = clients)
+        replica.listen.close() # no transport
+        replica.sent = []
+        self.addCleanup(self.close, replica)
+        return replica
+
+    def close(self, replica):
+        for node in (replica, replica.fetcher):
+            for timer in vars(node).values():
+                if isinstance(timer, Timer):
+                    timer.stop()
+        replica.loop.run_until_complete(asyncio.sleep(0)) # cancel them
+        replica.loop.close()
+        asyncio.set_event_loop(None)
+
+    def execute(self, replica):
+        """Commands replica executes, each one is written to page 0"""
+        executed = []
+        def execute(command, sender_type, sender, readonly, state):
+            executed.append(bytes(command))
+            state.page(0)[:len(command)] = command
+            return bytes(command)
+        replica.user_execution_func = execute
+        return executed
+
+    def prepare(self, replica, seqno, *commands):
+        """Pre_prepare commands of client 0 at seqno, prepared by all"""
+        requests = [new_request(seqno * 100 + i, c)
+                    for i, c in enumerate(commands)]
+        pre_prepare = PrePrepare(replica.view, seqno, 0, requests, b'')
+        pre_prepare.sender = replica.primary.index
+        pre_prepare.gen_payload(replica)
+
+        pcert = replica.plog[seqno]
+        pcert.add_pre_prepare(pre_prepare)
+        for i in range(replica.n):
+            if i != replica.primary.index:
+                pcert.add_prepare(types.SimpleNamespace(
+                    sender = i,
+                    consensus_digest = pre_prepare.consensus_digest))
+        return pcert
+
+    def commit(self, replica, seqno):
+        for i in range(replica.n):
+            replica.plog[seqno].add_commit(types.SimpleNamespace(sender = i))
+
+def new_request(reqid, command):
+    r = Request(0, reqid, 1 << 4, 0, command)
+    r.gen_payload()
+    r.verified = True
+    return r
+
+def sent_of(replica, cls):
+    return [m for m, _ in replica.sent if type(m) is cls]
+
+class TestDispatch(ReplicaTestCase):
+    def test_batch_in_order(self):
+        replica = self.new_replica()
+        received = []
+        replica.recv_message = received.append
+
+        frames = []
+        for seqno, sender in ((3, 0), (1, 2), (2, 0), (1, 3)):
+            commit = Commit(0, seqno, sender)
+            commit.gen_payload(replica)
+            frames.append((commit.frame,
+                           replica.replica_principals[sender].addr))
+        frames.insert(2, (b'garbage', frames[0][1]))
+
+        replica.inbox.extend(frames)
+        replica.dispatch_inbox()
+        self.assertEqual([(m.seqno, m.sender) for m in received],
+                         [(3, 0), (1, 2), (2, 0), (1, 3)])
+        self.assertEqual(replica.inbox, [])
+        self.assertEqual((replica.dispatch_count,
+                          replica.dispatch_batch_count), (5, 1))
+
+class TestBatching(ReplicaTestCase):
+    def new_primary(self, count):
+        """Primary of view 0 with count pending requests of client 0"""
+        replica = self.new_replica(0)
+        replica.batcher.adaptive = False
+        replica.batcher.size = 2
+        client = replica.client_principals[0]
+        replica.rw_requests[client] = [new_request(i, b'x')
+                                       for i in range(count)]
+        for r in replica.rw_requests[client]:
+            r.arrival = replica.loop.time()
+        return replica
+
+    def test_ready_batches_are_cut(self):
+        replica = self.new_primary(7)
+        replica.new_and_send_pre_prepare()
+        self.assertEqual([len(pp.requests)
+                          for pp in sent_of(replica, PrePrepare)],
+                         [2, 2, 2])
+        self.assertEqual(replica.seqno, 3)
+        self.assertEqual(replica.pending_count, 1) # waits for the timer
+        self.assertTrue(replica.batch_timer.timer)
+
+    @unittest.mock.patch.object(conf, 'congestion_window', 2)
+    def test_window_limits_batches(self):
+        replica = self.new_primary(7)
+        replica.new_and_send_pre_prepare()
+        self.assertEqual(len(sent_of(replica, PrePrepare)), 2)
+        self.assertEqual(replica.pending_count, 3)
+
+class TestExecution(ReplicaTestCase):
+    @unittest.mock.patch.object(conf, 'tentative_execution', False)
+    def test_commits_out_of_order(self):
+        replica = self.new_replica()
+        executed = self.execute(replica)
+        for seqno in (1, 2, 3, 4):
+            self.prepare(replica, seqno, b'%d' % seqno)
+
+        for seqno in (3, 2, 4):
+            self.commit(replica, seqno)
+            replica.execute_committed()
+        self.assertEqual((executed, replica.last_executed), ([], 0))
+
+        self.commit(replica, 1)
+        replica.execute_committed()
+        self.assertEqual(executed, [b'1', b'2', b'3', b'4'])
+        self.assertEqual(replica.last_executed, 4)
+
+class TestTentativeExecution(ReplicaTestCase):
+    def test_prepared_executes_tentatively(self):
+        replica = self.new_replica()
+        executed = self.execute(replica)
+        self.prepare(replica, 1, b'a')
+        replica.execute_prepared()
+
+        self.assertEqual(executed, [b'a'])
+        self.assertEqual((replica.last_executed,
+                          replica.last_tentative_execute), (0, 1))
+        self.assertEqual([r.is_tentative for r in sent_of(replica, Reply)],
+                         [True])
+
+    def test_commit_does_not_execute_again(self):
+        replica = self.new_replica()
+        executed = self.execute(replica)
+        self.prepare(replica, 1, b'a')
+        replica.execute_prepared()
+        self.commit(replica, 1)
+        replica.execute_committed()
+
+        self.assertEqual(executed, [b'a'])
+        self.assertEqual((replica.last_executed,
+                          replica.last_tentative_execute), (1, 1))
+        self.assertFalse(replica.tentative)
+
+    def test_view_change_rolls_back(self):
+        replica = self.new_replica()
+        executed = self.execute(replica)
+        self.prepare(replica, 1, b'a')
+        self.commit(replica, 1)
+        replica.execute_committed()
+        self.prepare(replica, 2, b'b')
+        replica.execute_prepared()
+        self.assertEqual(bytes(replica.state.read_page(0)[:1]), b'b')
+
+        replica.start_view_change(1)
+        # back to checkpoint 0, then seqno 1 again
+        self.assertEqual(executed, [b'a', b'b', b'a'])
+        self.assertEqual(bytes(replica.state.read_page(0)[:1]), b'a')
+        self.assertEqual((replica.last_executed,
+                          replica.last_tentative_execute), (1, 1))
+        replies = replica.replies[replica.client_principals[0]]
+        self.assertTrue(replies.is_executed(100))
+        self.assertFalse(replies.is_executed(200))
+
+class TestCheckpoint(ReplicaTestCase):
+    interval = conf.checkpoint_interval
+    max_out = conf.checkpoint_max_out
+
+    def new_replica(self):
+        """Replica 1 which executed up to its first checkpoint"""
+        replica = super().new_replica()
+        self.execute(replica)
+        for seqno in range(1, self.interval + 1):
+            self.prepare(replica, seqno, b'%d' % seqno)
+            self.commit(replica, seqno)
+        replica.execute_committed()
+        return replica
+
+    def test_quorum(self):
+        replica = self.new_replica()
+        mine = replica.checkpoints[self.interval][1]
+        replica.add_checkpoint(Checkpoint(self.interval, 2, mine.digest))
+        replica.add_checkpoint(Checkpoint(self.interval, 3, A))
+        self.assertEqual(replica.last_stable, 0)
+
+        # 2f + 1 matching ones
+        replica.add_checkpoint(Checkpoint(self.interval, 0, mine.digest))
+        self.assertEqual(replica.last_stable, self.interval)
+        self.assertEqual(sorted(c.sender
+                                for c in replica.stable_certificate),
+                         [0, 1, 2])
+
+    def test_stable_collects_and_moves_window(self):
+        replica = self.new_replica()
+        self.assertIsNone(replica.plog[self.max_out + 1])
+        self.assertEqual(len(replica.plog.requests), self.interval)
+
+        digest = replica.checkpoints[self.interval][1].digest
+        replica.add_checkpoint(Checkpoint(2 * self.interval, 3, digest))
+        for sender in (0, 2):
+            replica.add_checkpoint(Checkpoint(self.interval, sender,
+                                              digest))
+
+        self.assertIsNone(replica.plog[self.interval])
+        self.assertIsNotNone(replica.plog[self.interval + self.max_out])
+        self.assertFalse(replica.plog.requests)
+        self.assertEqual([c.seqno for c in replica.state.checkpoint_log],
+                         [self.interval])
+        # votes for later checkpoints are kept
+        self.assertEqual(list(replica.checkpoints), [2 * self.interval])
+
+    def test_out_of_window_messages(self):
+        replica = self.new_replica()
+        page = bytes(replica.state.read_page(0))
+        seqno = self.interval + self.max_out + 1
+        peer = replica.replica_principals[0]
+
+        # forged, nothing is verified before the window is checked
+        pre_prepare = PrePrepare(0, seqno, 0, [], b'')
+        pre_prepare.sender = 0
+        replica.recv_pre_prepare(pre_prepare, peer)
+        replica.recv_prepare(Prepare(0, seqno, 0, 0, A), peer)
+        replica.recv_commit(Commit(0, seqno, 0), peer)
+
+        self.assertFalse(replica.state.is_fetching)
+        self.assertEqual(replica.last_executed, self.interval)
+        self.assertEqual(bytes(replica.state.read_page(0)), page)
+        self.assertFalse(sent_of(replica, Fetch))
+
+    @unittest.mock.patch.object(Checkpoint, 'verify', return_value = True)
+    def test_checkpoints_ahead_start_fetch(self, _verify):
+        replica = self.new_replica()
+        for sender in (0, 2):
+            checkpoint = Checkpoint(self.interval + self.max_out,
+                                    sender, A)
+            replica.recv_checkpoint(checkpoint,
+                                    replica.replica_principals[sender])
+            # f + 1 of them, one is correct
+            self.assertEqual(replica.state.is_fetching, sender == 2)
+
+class FakeReplica():
+    type = 'Replica'
+    index = 1
+    view = 0
+    execute_readonly = Replica.execute_readonly
+    execute_ro_requests = Replica.execute_ro_requests
+    defer_readonly = Replica.defer_readonly
+
+    def __init__(self):
+        self.last_executed = 4
+        self.last_tentative_execute = 5
+        self.state = types.SimpleNamespace(is_fetching = False)
+        self.ro_requests = collections.OrderedDict()
+        self.executed = []
+        self.sent = []
+
+    def find_sender(self, request):
+        return Principal(request.sender)
+
+    def call_user_execution_func(self, request):
+        self.executed.append(request.reqid)
+        return b''
+
+    def sendto(self, message, principal):
+        self.sent.append((message.reqid, principal.index))
+
+class TestReadonly(unittest.TestCase):
+    def test_wait_for_tentative_state(self):
+        replica = FakeReplica()
+        for i in range(3):
+            request = types.SimpleNamespace(sender = i, reqid = i)
+            self.assertFalse(replica.execute_readonly(request))
+            replica.ro_requests[i] = request
+        self.assertEqual(replica.executed, [])
+
+        replica.state.is_fetching = True
+        replica.last_executed = 5 # committed
+        replica.execute_ro_requests()
+        self.assertEqual(len(replica.ro_requests), 3)
+
+        replica.state.is_fetching = False
+        replica.execute_ro_requests()
+        self.assertEqual(replica.executed, [0, 1, 2])
+        self.assertEqual(replica.sent, [(0, 0), (1, 1), (2, 2)])
+        self.assertFalse(replica.ro_requests)
+
+class TestNewView(ReplicaTestCase):
+    def new_view_change(self, replica, sender, view, pre_prepared = ()):
+        """sender prepared what it pre_prepared, from checkpoint 0"""
+        checkpoint = replica.state.checkpoint_log[0].digest
+        vc = ViewChange(view, 0, sender,
+                        ViewChange.pack_entries([(0, 0, checkpoint)]),
+                        ViewChange.pack_entries(pre_prepared),
+                        ViewChange.pack_entries(pre_prepared))
+        vc.gen_payload(replica)
+        return vc
+
+    def new_batch(self, replica, view, sender):
+        """PrePrepare at seqno 1 a backup holds, of the same requests"""
+        batch = PrePrepare(view, 1, 0, [new_request(100, b'x')], b'')
+        batch.sender = sender
+        batch.gen_payload(replica)
+        return batch
+
+    def test_primary_without_chosen_batch(self):
+        replica = self.new_replica(1) # primary of view 1
+        digest = self.new_batch(replica, 0, 0).consensus_digest
+        replica.start_view_change(1)
+        changer = replica.view_changer
+        for sender in (0, 2):
+            vc = self.new_view_change(replica, sender, 1, [(1, 0, digest)])
+            changer.recv_view_change(vc)
+            changer.recv_view_change_ack(types.SimpleNamespace(
+                view = 1, sender = 3, replica = sender,
+                digest = vc.content_digest))
+
+        # the batch is chosen at seqno 1, the primary never saw it
+        self.assertIsNotNone(changer.new_view)
+        self.assertEqual((replica.view, replica.limbo), (1, False))
+        self.assertEqual(changer.missing, {1: digest})
+        self.assertIsNotNone(replica.view_change_timer.timer)
+        self.assertEqual(sent_of(replica, PrePrepare), [])
+
+        # a backup sends it
+        replica.recv_pre_prepare(self.new_batch(replica, 1, 0),
+                                 replica.replica_principals[0])
+        self.assertEqual(changer.missing, {})
+        self.assertIsNone(replica.view_change_timer.timer)
+        pre_prepare = replica.plog[1].pre_prepare
+        self.assertEqual((pre_prepare.view, pre_prepare.sender), (1, 1))
+        self.assertEqual(pre_prepare.consensus_digest, digest)
+        self.assertEqual(sent_of(replica, PrePrepare), [pre_prepare])
+
+    def test_primary_gives_up_without_chosen_batch(self):
+        replica = self.new_replica(1)
+        replica.start_view_change(1)
+        replica.enter_new_view(0, replica.state.checkpoint_log[0].digest,
+                               [(1, A)])
+        self.assertEqual(replica.view_changer.missing, {1: A})
+
+        # others are ignored
+        replica.recv_pre_prepare(self.new_batch(replica, 1, 0),
+                                 replica.replica_principals[0])
+        self.assertEqual(replica.view_changer.missing, {1: A})
+
+        replica.view_change_handler()
+        self.assertEqual((replica.view, replica.limbo), (2, True))
+
+    def test_backup_sends_chosen_batch(self):
+        replica = self.new_replica(2)
+        pcert = self.prepare(replica, 1, b'x')
+        digest = pcert.pre_prepare.consensus_digest
+        replica.start_view_change(1)
+        # the primary of view 1 reported nothing at seqno 1
+        replica.view_changer.recv_view_change(
+            self.new_view_change(replica, 1, 1))
+        replica.enter_new_view(0, replica.state.checkpoint_log[0].digest,
+                               [(1, digest)])
+
+        sent = [(m, p) for m, p in replica.sent if type(m) is PrePrepare]
+        self.assertEqual(len(sent), 1)
+        batch, principal = sent[0]
+        self.assertIs(principal, replica.primary)
+        self.assertEqual((batch.view, batch.seqno, batch.sender), (1, 1, 2))
+        self.assertEqual(batch.consensus_digest, digest)
+
+    def test_backup_follows_primary(self):
+        replica = self.new_replica(2)
+        replica.start_view_change(1)
+        replica.view_changer.recv_view_change(self.new_view_change(replica, 1, 2))
+        self.assertEqual(replica.view, 2)
+
+        # others than the primary need f + 1
+        replica.view_changer.recv_view_change(self.new_view_change(replica, 0, 3))
+        self.assertEqual(replica.view, 2)
+
+    def test_window_moves_to_checkpoint(self):
+        replica = self.new_replica(2)
+        max_out = conf.checkpoint_max_out
+        replica.start_view_change(1)
+        replica.enter_new_view(max_out, A, [(max_out + 1, null_digest)])
+
+        self.assertEqual(replica.last_stable, max_out)
+        self.assertTrue(replica.state.is_fetching)
+        pcert = replica.plog[max_out + 1]
+        self.assertEqual(pcert.pre_prepare.consensus_digest, null_digest)
+
+    @unittest.mock.patch.object(conf, 'ro_requests_max', 2)
+    def test_oldest_dropped(self):
+        replica = FakeReplica()
+        for i in range(3):
+            request = types.SimpleNamespace(sender = i, reqid = i)
+            replica.defer_readonly(Principal(i), request)
+        self.assertEqual([r.reqid for r in replica.ro_requests.values()],
+                         [1, 2])
+
+    def test_big_request_without_command(self):
+        replica = self.new_replica(2)
+        big = bytes(conf.pre_prepare_big_request_thresh + 1)
+        pcert = self.prepare(replica, 1, big)
+        digest = pcert.pre_prepare.consensus_digest
+        # only its digest came with the pre_prepare
+        pcert.pre_prepare.requests[0].command = None
+
+        replica.start_view_change(1)
+        replica.enter_new_view(0, replica.state.checkpoint_log[0].digest,
+                               [(1, digest)])
+        self.assertFalse(replica.limbo)
+        self.assertEqual(pcert.pre_prepare.view, 1)
+        self.assertEqual(pcert.pre_prepare.consensus_digest, digest)
+
+class TestNewKey(ReplicaTestCase):
+    def new_key(self, sender, reqid):
+        """Verified new_key of replica sender, its key decrypted"""
+        new_key = NewKey(sender, reqid, 0, [])
+        new_key.outkey = bytes([reqid]) * 32
+        new_key.verified = True
+        return new_key
+
+    def test_first_contact_is_clean(self):
+        replica = self.new_replica(1)
+        replica.last_new_key = self.new_key(1, 1)
+        peer = replica.replica_principals[0]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            replica.recv_new_key(self.new_key(0, 1), peer)
+            # the peer resent it for our first contact
+            replica.recv_new_key(self.new_key(0, 1), peer)
+
+        self.assertNotIn('failure', out.getvalue())
+        self.assertEqual((peer.outkey_reqid, peer.outkey),
+                         (1, bytes([1]) * 32))
+        self.assertEqual([p for m, p in replica.sent if type(m) is NewKey],
+                         [peer])
+
+    def test_old_key_fails(self):
+        replica = self.new_replica(1)
+        peer = replica.replica_principals[0]
+        replica.recv_new_key(self.new_key(0, 2), peer)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            replica.recv_new_key(self.new_key(0, 1), peer)
+
+        self.assertIn('timestamp failure', out.getvalue())
+        self.assertEqual(peer.outkey_reqid, 2)
+
+    @unittest.mock.patch.object(Principal, 'encrypt', lambda self, m: m)
+    def sign_new_key(self, signature):
+        """Replica 1 signs a new_key in its crypto service"""
+        replica = self.new_replica(1)
+        peer = replica.replica_principals[0]
+        inkey = peer.inkey
+        signed = replica.loop.create_future()
+        replica.crypto = types.SimpleNamespace(sign = lambda p, d: signed)
+
+        task = replica.loop.create_task(replica.sign_and_send_new_key())
+        replica.loop.run_until_complete(asyncio.sleep(0))
+        # peers authenticate with the old key until it is sent
+        self.assertEqual(peer.inkey, inkey)
+
+        signed.set_result(signature)
+        replica.loop.run_until_complete(task)
+        return replica, peer, inkey
+
+    def test_keys_rotate_once_signed(self):
+        replica, peer, inkey = self.sign_new_key(b'signature')
+        [new_key] = sent_of(replica, NewKey)
+        self.assertNotEqual(peer.inkey, inkey)
+        self.assertEqual(new_key.hmac_keys[0], peer.inkey)
+        self.assertIs(replica.last_new_key, new_key)
+
+    def test_keys_kept_without_signature(self):
+        replica, peer, inkey = self.sign_new_key(None)
+        self.assertEqual(sent_of(replica, NewKey), [])
+        self.assertEqual(peer.inkey, inkey)
+        self.assertIsNone(replica.last_new_key)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import types
+import unittest
+
+from pbft.reply_cache import ReplyCache
+
+def new_reply(reqid):
+    return types.SimpleNamespace(reqid = reqid)
+
+class TestReplyCache(unittest.TestCase):
+    def test_out_of_order(self):
+        cache = ReplyCache(4)
+        for reqid in (3, 1, 4):
+            cache.add(new_reply(reqid))
+        self.assertTrue(cache.is_executed(1))
+        self.assertFalse(cache.is_executed(2))
+        self.assertEqual(cache.get(4).reqid, 4)
+
+    def test_drop_oldest(self):
+        cache = ReplyCache(2)
+        for reqid in (3, 1, 4):
+            cache.add(new_reply(reqid))
+        # 3 is dropped, reqids up to it count as executed
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(3))
+        self.assertTrue(cache.is_executed(2))
+        self.assertFalse(cache.is_executed(5))
+
+    def test_remove(self):
+        cache = ReplyCache(2)
+        cache.add(new_reply(1))
+        cache.add(new_reply(2))
+        undo3 = cache.add(new_reply(3))
+        undo4 = cache.add(new_reply(4))
+        cache.remove(4, undo4)
+        cache.remove(3, undo3)
+        self.assertEqual(list(cache.replies), [1, 2])
+        self.assertEqual(cache.low, -1)
+        self.assertFalse(cache.is_executed(3))
+
+    def test_pack(self):
+        self.assertEqual(ReplyCache(2).pack(), bytes(10))
+
+        cache = ReplyCache(2)
+        for reqid in (3, 1, 4):
+            cache.add(new_reply(reqid))
+
+        # a replica fetching the state knows of executed reqids only
+        fetched = ReplyCache(2)
+        fetched.load(cache.pack() + bytes(100))
+        self.assertEqual(fetched.low, 3)
+        self.assertEqual(list(fetched.replies), [1, 4])
+        self.assertIsNone(fetched.get(4))
+
+        # ours are kept
+        cache.load(cache.pack())
+        self.assertEqual(cache.get(4).reqid, 4)
+
+        fetched.load(bytes(10))
+        self.assertEqual(len(fetched), 0)
+        self.assertFalse(fetched.is_executed(1))
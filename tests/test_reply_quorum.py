@@ -0,0 +1,61 @@
+import hashlib
+import types
+import unittest
+
+from pbft.reply_quorum import ReplyQuorum
+
+def new_reply(sender, result = b'ok', tentative = False, reqid = 7,
+              digest = False, view = 0):
+    if digest:
+        result = hashlib.sha256(result).digest()
+    return types.SimpleNamespace(
+        sender = sender, reqid = reqid, view = view, result = result,
+        is_tentative = tentative, is_digest = digest,
+        reply_digest = result if digest else hashlib.sha256(result).digest())
+
+class TestReplyQuorum(unittest.TestCase):
+    def test_distinct_repliers(self):
+        quorum = ReplyQuorum(1)
+        quorum.open(7)
+        self.assertIsNone(quorum.add(new_reply(0)))
+        # a replica counts once
+        self.assertIsNone(quorum.add(new_reply(0)))
+        self.assertIsNone(quorum.add(new_reply(1, b'bad')))
+        tally = quorum.add(new_reply(2))
+        self.assertEqual(tally.result, b'ok')
+        self.assertEqual(sorted(tally.repliers), [0, 2])
+
+    def test_changed_vote(self):
+        quorum = ReplyQuorum(1)
+        quorum.open(7, readonly = True)
+        quorum.add(new_reply(0, b'old'))
+        quorum.add(new_reply(1))
+        # replica 0 replies again after a rollback
+        self.assertIsNone(quorum.add(new_reply(0)))
+        self.assertNotIn((7, hashlib.sha256(b'old').digest()),
+                         quorum.tallies)
+        # readonly replies count as tentative ones
+        self.assertEqual(quorum.add(new_reply(2)).result, b'ok')
+
+    def test_duplicates(self):
+        quorum = ReplyQuorum(1)
+        quorum.open(7)
+        self.assertTrue(quorum.is_duplicate(new_reply(0, reqid = 6)))
+        self.assertFalse(quorum.is_duplicate(new_reply(0)))
+
+        quorum.add(new_reply(0, digest = True))
+        self.assertTrue(quorum.is_duplicate(new_reply(0, digest = True)))
+        # the full result, a commit or a new view is news
+        self.assertFalse(quorum.is_duplicate(new_reply(0)))
+        self.assertFalse(quorum.is_duplicate(
+            new_reply(0, digest = True, tentative = True)))
+        self.assertFalse(quorum.is_duplicate(
+            new_reply(0, digest = True, view = 1)))
+
+        quorum.add(new_reply(1))
+        self.assertTrue(quorum.is_duplicate(new_reply(1)))
+        self.assertFalse(quorum.is_duplicate(new_reply(1, b'bad')))
+
+        quorum.close(7)
+        self.assertEqual((len(quorum), quorum.tallies), (0, {}))
+        self.assertTrue(quorum.is_duplicate(new_reply(1)))
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import unittest
+
+from pbft.partition import Partition
+from pbft.state import State
+
+class TestState(unittest.TestCase):
+    def setUp(self):
+        # a small tree: 1, 8, 64 partitions
+        self.children_count = Partition.children_count
+        Partition.children_count = 8
+
+    def tearDown(self):
+        Partition.children_count = self.children_count
+
+    def digests(self, state):
+        levels = [[p.digest for p in ps] for ps in state.partition_tree[:-1]]
+        return levels + [[state.leaf_digest(i)
+                          for i in range(len(state.leaves))]]
+
+    def test_incremental_equals_full(self):
+        state = State()
+        state.checkpoint(0)
+
+        state.set_block(3, b'three')
+        state.set_block(60, b'sixty')
+        state.modify(9 * Partition.block_size - 1, 2) # pages 8 and 9
+        self.assertEqual(state.dirty, {3, 8, 9, 60})
+
+        digest = state.checkpoint(128)
+        self.assertFalse(state.dirty)
+
+        full = State()
+        for i in (3, 8, 9, 60):
+            full.leaves[i].last_mod_checkpoint = 128
+        for i in (0, 1, 7):
+            full.partition_tree[1][i].last_mod_checkpoint = 128
+        full.partition_tree[0][0].last_mod_checkpoint = 128
+        full.set_block(3, b'three')
+        full.set_block(60, b'sixty')
+        full.compute_full_digest()
+
+        self.assertEqual(digest, full.digest)
+        self.assertEqual(self.digests(state), self.digests(full))
+
+    def test_clean_subtrees_kept(self):
+        state = State()
+        state.checkpoint(0)
+        clean = state.partition_tree[1][5]
+        digest = clean.digest
+
+        state.set_block(0, b'zero')
+        state.checkpoint(128)
+        self.assertEqual(clean.last_mod_checkpoint, 0)
+        self.assertIs(clean.digest, digest)
+        self.assertEqual(state.partition_tree[1][0].last_mod_checkpoint, 128)
+
+    def test_leaves_lazy(self):
+        state = State()
+        self.assertEqual(len(state.leaves), 64)
+        self.assertFalse(state.leaves.partitions)
+
+        state.checkpoint(0)
+        self.assertFalse(state.leaves.partitions)
+        self.assertEqual(state.leaf_digest(5), state.leaves[5].compute_digest(
+            Partition.zero_block))
+
+        page = state.page(7)
+        page[:4] = b'page'
+        self.assertEqual(state.dirty, {7})
+        self.assertEqual(bytes(state.read_page(7)[:5]), b'page\0')
+        self.assertEqual(set(state.leaves.partitions), {5, 7})
+
+        digest = state.checkpoint(128)
+        full = State()
+        full.set_block(7, b'page')
+        full.leaves[7].last_mod_checkpoint = 128
+        full.partition_tree[1][0].last_mod_checkpoint = 128
+        full.partition_tree[0][0].last_mod_checkpoint = 128
+        full.compute_full_digest()
+        self.assertEqual(digest, full.digest)
+
+        page.release()
+        state.close()
+        full.close()
+
+    def test_file_backed(self):
+        with tempfile.TemporaryDirectory() as d:
+            state = State(os.path.join(d, 'state'))
+            state.set_block(63, b'last')
+            self.assertEqual(bytes(state.leaves[63].block[:4]), b'last')
+            self.assertEqual(os.path.getsize(os.path.join(d, 'state')),
+                             64 * Partition.block_size)
+            state.close()
+
+    def test_parallel_equals_serial(self):
+        states = [State(digest_workers = w) for w in (1, 4)]
+        for state in states:
+            state.checkpoint(0)
+            for i in range(0, 64, 3):
+                state.set_block(i, bytes([i]) * 100)
+            state.checkpoint(128)
+
+        self.assertIsNotNone(states[1].digest_executor)
+        self.assertEqual(self.digests(states[0]), self.digests(states[1]))
+        for state in states:
+            state.close()
+
+    def test_snapshots_share_unmodified(self):
+        state = State()
+        state.set_block(1, b'one')
+        state.set_block(2, b'two')
+        state.checkpoint(0)
+        before = self.digests(state)
+
+        state.set_block(1, b'uno')
+        state.set_block(1, b'eins') # copied once
+        state.modify(3 * Partition.block_size, 1)
+        state.checkpoint(128)
+
+        c = state.checkpoint_log[0]
+        self.assertEqual(set(c.pages), {1, 3})
+        self.assertEqual(c.pages[3], None)
+        self.assertEqual(bytes(c.pages[1][:3]), b'one')
+        self.assertEqual(set(c.partitions), {(0, 0), (1, 0), (2, 1), (2, 3)})
+        self.assertEqual(c.size, Partition.block_size + 3 * 32)
+        self.assertFalse(state.checkpoint_log[1].pages)
+
+        self.assertEqual(bytes(state.page_at(0, 1)[:3]), b'one')
+        self.assertEqual(bytes(state.page_at(128, 1)[:4]), b'eins')
+        self.assertEqual(bytes(state.page_at(0, 2)[:3]), b'two')
+        self.assertEqual(state.partition_at(0, 2, 1), (0, before[2][1]))
+        self.assertEqual(state.partition_at(0, 0, 0), (0, before[0][0]))
+        self.assertEqual(state.partition_at(128, 0, 0)[1], state.digest)
+
+    def test_rollback(self):
+        state = State()
+        state.set_block(1, b'one')
+        state.checkpoint(0)
+        before = self.digests(state)
+
+        state.set_block(1, b'uno')
+        digest = state.checkpoint(128)
+        state.set_block(5, b'five')
+        state.rollback(0)
+
+        self.assertEqual([c.seqno for c in state.checkpoint_log], [0])
+        self.assertFalse(state.dirty)
+        self.assertEqual(bytes(state.read_page(1)[:3]), b'one')
+        self.assertFalse(state.pages.is_allocated(5))
+        self.assertEqual(self.digests(state), before)
+
+        # the same modifications give the same checkpoint again
+        state.set_block(1, b'uno')
+        self.assertEqual(state.checkpoint(128), digest)
+
+    def test_log_size(self):
+        state = State(checkpoint_log_size = 2)
+        for n in (0, 128, 256):
+            state.checkpoint(n)
+        self.assertEqual([c.seqno for c in state.checkpoint_log], [128, 256])
+        with self.assertRaises(KeyError):
+            state.page_at(0, 0)
+
+        state.mark_stable(256)
+        self.assertEqual(state.last_stable_checkpoint, 256)
+        self.assertEqual([c.seqno for c in state.checkpoint_log], [256])
+
+if __name__ == '__main__':
+    unittest.main()
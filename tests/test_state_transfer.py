@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+
+from pbft.message import Fetch, MetaData, MetaDataD, Data
+from pbft.partition import Partition
+from pbft.principal import Principal
+from pbft.state import State
+from pbft.state_transfer import Fetcher
+
+class FakeReplica():
+    """Replica 0 fetching, its fetches are answered from the states of
+    the others without network and authentication"""
+    def __init__(self, states):
+        self.loop = asyncio.new_event_loop()
+        self.index = 0
+        self.n = len(states)
+        self.f = (self.n - 1) // 3
+        self.replica_principals = [Principal(i) for i in range(self.n)]
+        self.states = states
+        self.state = states[0]
+        self.sent = [] # (fetch, principal)
+        self.fetched = None
+
+    @property
+    def principal(self):
+        return self.replica_principals[self.index]
+
+    def gen_authenticators(self, hash_bytes):
+        return [b''] * self.n
+
+    def sendto(self, fetch, dest):
+        if dest == 'ALL_REPLICAS':
+            dest = self.replica_principals[1:]
+        for p in dest if type(dest) is list else [dest]:
+            self.sent.append((fetch, p))
+
+    def close(self, fetcher):
+        fetcher.timer.stop()
+        self.loop.run_until_complete(asyncio.sleep(0)) # cancel the timer
+        self.loop.close()
+
+    def state_fetched(self, checkpoint):
+        self.fetched = checkpoint
+
+    def answer(self, fetch, replier):
+        state = self.states[replier]
+        c = state.checkpoint_log[-1].seqno
+        if fetch.checkpoint == Fetch.latest:
+            last_mod, digest = state.partition_at(c, 0, 0)
+            m = MetaDataD(c, 0, 0, last_mod, replier, digest)
+            m.verified = True
+        elif fetch.level == Partition.level_count - 1:
+            last_mod, _ = state.partition_at(c, fetch.level, fetch.index)
+            block = bytes(state.page_at(c, fetch.index))
+            m = Data(c, fetch.index, last_mod, replier,
+                     b'' if block == Partition.zero_block else block)
+        else:
+            m = MetaData(c, fetch.level, fetch.index, replier,
+                         MetaData.pack_children(state.children_at(
+                             c, fetch.level, fetch.index)))
+        m.gen_payload(self)
+        return m
+
+    def run(self, fetcher, forge = None):
+        """Answer fetches until none is left, forge may alter replies"""
+        while self.sent:
+            sent, self.sent = self.sent, []
+            for fetch, p in sent:
+                m = self.answer(fetch, p.index)
+                if forge:
+                    m = forge(m)
+                getattr(fetcher, 'recv_' + m.tag.snake_name)(m)
+
+class TestFetcher(unittest.TestCase):
+    def setUp(self):
+        # a small tree: 1, 8, 64 partitions
+        self.children_count = Partition.children_count
+        Partition.children_count = 8
+
+        self.states = [State() for _ in range(4)]
+        for state in self.states:
+            state.checkpoint(0)
+        for state in self.states[1:]:
+            for n in (128, 256):
+                for i in range(n // 32, 64, 5):
+                    state.set_block(i, bytes([n // 128, i]))
+                state.checkpoint(n)
+
+    def tearDown(self):
+        for state in self.states:
+            state.close()
+        Partition.children_count = self.children_count
+
+    def test_fetch_differing(self):
+        replica = FakeReplica(self.states)
+        lagging = self.states[0]
+        lagging.set_block(63, b'tentative') # rolled back first
+
+        fetcher = Fetcher(replica)
+        self.addCleanup(replica.close, fetcher)
+        fetcher.start()
+        replica.run(fetcher)
+
+        self.assertEqual(replica.fetched, 256)
+        self.assertFalse(lagging.is_fetching)
+        self.assertEqual(lagging.digest, self.states[1].digest)
+        self.assertEqual([c.seqno for c in lagging.checkpoint_log], [256])
+        for i in range(64):
+            self.assertEqual(bytes(lagging.read_page(i)),
+                             bytes(self.states[1].read_page(i)))
+
+        # only leaves written by others, among 64
+        written = set(range(4, 64, 5)) | set(range(8, 64, 5))
+        self.assertEqual(fetcher.data_count, len(written))
+        self.assertEqual(lagging.pages.allocated.count(1), len(written))
+        self.assertFalse(fetcher.in_flight)
+
+    def test_forged_replies_dropped(self):
+        replica = FakeReplica(self.states)
+        fetcher = Fetcher(replica)
+        self.addCleanup(replica.close, fetcher)
+
+        def forge(m):
+            if type(m) is Data and m.sender == 1:
+                m.block = bytes([9]) * Partition.block_size
+            return m
+
+        fetcher.start()
+        replica.run(fetcher, forge)
+        self.assertTrue(self.states[0].is_fetching)
+        self.assertTrue(fetcher.in_flight)
+        self.assertEqual(fetcher.data_count,
+                         self.states[0].pages.allocated.count(1))
+
+        # sent again to other replicas after timeout
+        for _ in range(3):
+            for key, (p, _, size) in fetcher.in_flight.items():
+                fetcher.in_flight[key] = (p, -fetcher.timeout, size)
+            fetcher.timer_handler()
+            replica.run(fetcher, forge)
+
+        self.assertFalse(self.states[0].is_fetching)
+        self.assertEqual(self.states[0].digest, self.states[1].digest)
+        self.assertTrue(fetcher.retransmit_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from pbft.verify_cache import VerifyCache
+
+from test_authenticator import FakeNode, new_commit
+
+class TestVerifyCache(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode()
+        self.node.verify_cache = VerifyCache(4)
+
+    def test_hit_on_another_instance(self):
+        node, cache = self.node, self.node.verify_cache
+        pp = node.replica_principals[1]
+
+        self.assertTrue(new_commit(node, 1).verify(node, pp))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # a retransmit, forged auth shows it is not checked again
+        m = new_commit(node, 1)
+        m.auth[node.index] = bytes(32)
+        self.assertTrue(m.verify(node, pp))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_failure_not_cached(self):
+        node, cache = self.node, self.node.verify_cache
+        pp = node.replica_principals[1]
+
+        m = new_commit(node, 1)
+        m.auth[node.index] = bytes(32)
+        self.assertFalse(m.verify(node, pp))
+        self.assertEqual(len(cache), 0)
+
+    def test_key_change(self):
+        node, cache = self.node, self.node.verify_cache
+        pp = node.replica_principals[1]
+
+        self.assertEqual(node.verify_messages([new_commit(node, 1)]), [True])
+        self.assertEqual(len(cache), 1)
+
+        pp.gen_inkey()
+        m = new_commit(node, 1)
+        m.auth[node.index] = bytes(32)
+        self.assertEqual(node.verify_messages([m]), [False])
+
+        cache.invalidate(pp, 'Replica')
+        self.assertEqual(len(cache), 0)
+
+    def test_bounded(self):
+        node, cache = self.node, self.node.verify_cache
+        messages = [new_commit(node, 1, seqno) for seqno in range(8)]
+        node.verify_messages(messages)
+        self.assertEqual(len(cache), cache.capacity)
+
+        # the oldest ones are evicted
+        self.assertFalse(cache.lookup(messages[0],
+                                      node.replica_principals[1]))
+        self.assertTrue(cache.lookup(messages[-1],
+                                     node.replica_principals[1]))
+        self.assertEqual(cache.stats['hits'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
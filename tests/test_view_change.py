@@ -0,0 +1,114 @@
+import unittest
+
+from pbft.message import ViewChange
+from pbft.view_change import select, null_digest, ViewChangeTimeout
+
+A = bytes([1]) * 32
+B = bytes([2]) * 32
+C0 = bytes([3]) * 32 # checkpoint 0
+C8 = bytes([4]) * 32 # checkpoint 8
+
+def new_view_change(sender, last_stable, checkpoints,
+                    prepared = (), pre_prepared = ()):
+    return ViewChange(1, last_stable, sender,
+                      ViewChange.pack_entries(checkpoints),
+                      ViewChange.pack_entries(prepared),
+                      ViewChange.pack_entries(pre_prepared))
+
+class TestSelect(unittest.TestCase):
+    f = 1
+
+    def test_empty(self):
+        vcs = [new_view_change(i, 0, [(0, 0, C0)]) for i in range(3)]
+        self.assertEqual(select(vcs, self.f), (0, C0, []))
+
+    def test_prepared_digest_is_chosen(self):
+        vcs = [new_view_change(0, 0, [(0, 0, C0)], [(1, 0, A)], [(1, 0, A)]),
+               new_view_change(1, 0, [(0, 0, C0)], [], [(1, 0, A)]),
+               new_view_change(2, 0, [(0, 0, C0)])]
+        self.assertEqual(select(vcs, self.f), (0, C0, [(1, A)]))
+
+    def test_holes_are_null(self):
+        vcs = [new_view_change(0, 0, [(0, 0, C0)], [(2, 0, A)], [(2, 0, A)]),
+               new_view_change(1, 0, [(0, 0, C0)], [], [(2, 0, A)]),
+               new_view_change(2, 0, [(0, 0, C0)])]
+        self.assertEqual(select(vcs, self.f),
+                         (0, C0, [(1, null_digest), (2, A)]))
+
+    def test_later_view_wins(self):
+        vcs = [new_view_change(0, 0, [(0, 0, C0)], [(1, 0, A)], [(1, 0, A)]),
+               new_view_change(1, 0, [(0, 0, C0)], [(1, 1, B)], [(1, 1, B)]),
+               new_view_change(2, 0, [(0, 0, C0)], [], [(1, 1, B)])]
+        self.assertEqual(select(vcs, self.f), (0, C0, [(1, B)]))
+
+    def test_highest_checkpoint(self):
+        vcs = [new_view_change(0, 8, [(8, 0, C8)], [(9, 0, A)], [(9, 0, A)]),
+               new_view_change(1, 0, [(0, 0, C0), (8, 0, C8)],
+                               [(2, 0, B)], [(9, 0, A)]),
+               new_view_change(2, 0, [(0, 0, C0)])]
+        self.assertEqual(select(vcs, self.f), (8, C8, [(9, A)]))
+
+    def test_undecided(self):
+        # one pre_prepare of the digest is not enough, f may lie
+        vcs = [new_view_change(0, 0, [(0, 0, C0)], [(1, 0, A)]),
+               new_view_change(1, 0, [(0, 0, C0)]),
+               new_view_change(2, 0, [(0, 0, C0)], [(1, 0, B)])]
+        self.assertIsNone(select(vcs, self.f))
+
+        # nor a checkpoint held by a single replica
+        vcs = [new_view_change(i, 0, [(8 * i, 0, C8)]) for i in range(3)]
+        self.assertIsNone(select(vcs, self.f))
+
+class TestViewChangeTimeout(unittest.TestCase):
+    def new_timeout(self, adaptive = True):
+        return ViewChangeTimeout(5.0, 0.2, 60.0, adaptive)
+
+    def test_initial_until_sampled(self):
+        timeout = self.new_timeout()
+        self.assertEqual(timeout.timeout, 5.0)
+        timeout.record(0.1)
+        # srtt + 4 * rttvar
+        self.assertAlmostEqual(timeout.timeout, 0.3)
+        for _ in range(100):
+            timeout.record(0.01)
+        self.assertEqual(timeout.timeout, 0.2)
+
+    def test_tracks_spikes(self):
+        timeout = self.new_timeout()
+        for _ in range(10):
+            timeout.record(0.1)
+        steady = timeout.timeout
+        timeout.record(1.0)
+        self.assertGreater(timeout.timeout, 1.0)
+        self.assertGreater(timeout.timeout, steady)
+
+    def test_backoff(self):
+        timeout = self.new_timeout()
+        timeout.record(1.0)
+        self.assertAlmostEqual(timeout.timeout, 3.0)
+        timeout.fail()
+        timeout.fail()
+        self.assertAlmostEqual(timeout.timeout, 12.0)
+        for _ in range(10):
+            timeout.fail()
+        self.assertEqual(timeout.timeout, 60.0)
+        timeout.succeed()
+        self.assertAlmostEqual(timeout.timeout, 3.0)
+
+    def test_fixed(self):
+        timeout = self.new_timeout(adaptive = False)
+        timeout.record(0.1)
+        self.assertEqual(timeout.timeout, 5.0)
+        timeout.fail()
+        self.assertEqual(timeout.timeout, 10.0)
+
+    def test_stats(self):
+        timeout = self.new_timeout()
+        self.assertIsNone(timeout.stats['p50_commit_latency'])
+        for i in range(1, 101):
+            timeout.record(i / 100)
+        stats = timeout.stats
+        self.assertEqual(stats['commit_latency_count'], 100)
+        self.assertEqual(stats['max_commit_latency'], 1.0)
+        self.assertEqual(stats['p50_commit_latency'], 0.51)
+        self.assertEqual(stats['view_change_timeout'], timeout.timeout)